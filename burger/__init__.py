@@ -0,0 +1 @@
+from burger.runner import run, iter_run
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Bulk loading of the JSON files under a directory of the jar, such as
+data/minecraft/recipes/ or data/minecraft/tags/.
+
+Newer versions have thousands of small JSON files in those directories.
+Opening and parsing each of them in turn through the classloader spends
+most of the time on per-file overhead, so load_json_tree reads all of the
+matching entries in a single pass over the jar and parses them together.
+
+Parsing happens in the current process unless the caller passes an
+executor.  Toppings don't start processes of their own: they may already be
+running in a worker process (see burger/scheduler.py), or in a server with
+other threads running (see burger/server.py), where forking isn't safe.
+"""
+
+from collections import OrderedDict
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from burger.tracing import PREFIX, read_entry, record, unwrap
+
+# Below this many files, parsing them in the current process is faster than
+# sending them to an executor
+MIN_PARALLEL_FILES = 200
+
+# Number of files sent to an executor at a time
+BATCH_SIZE = 64
+
+def _parse_batch(batch):
+    """Parses a list of (path, raw bytes) pairs, possibly in another process."""
+    result = []
+    for path, data in batch:
+        try:
+            # utf-8-sig, as some files start with a byte order mark
+            result.append(json.loads(data.decode("utf-8-sig")))
+        except ValueError as e:
+            raise ValueError("Failed to parse %s: %s" % (path, e))
+    return result
+
+def read_tree(classloader, prefix, suffix):
+    """
+    Reads the raw contents of every entry whose path starts with prefix and
+    ends with suffix, in the jar's order.  Returns a list of (path, bytes).
+    """
+    record(classloader, PREFIX, prefix)
+    entries = []
+    for path in unwrap(classloader).path_map:
+        if path.startswith(prefix) and path.endswith(suffix):
+            entries.append((path, read_entry(classloader, path)))
+    return entries
+
+def load_json_tree(classloader, prefix, suffix=".json", executor=None):
+    """
+    Loads every JSON file under prefix (e.g. "data/minecraft/tags/").
+
+    Returns an OrderedDict (in the jar's order) mapping the resource id of
+    each file, which is its path relative to prefix without the suffix
+    (e.g. "items/logs"), to the parsed document.
+
+    executor is a concurrent.futures executor to parse the files with; by
+    default they're parsed in this process.  Small trees are always parsed
+    in this process.
+    """
+    entries = read_tree(classloader, prefix, suffix)
+
+    if executor is None or len(entries) < MIN_PARALLEL_FILES:
+        documents = _parse_batch(entries)
+    else:
+        batches = [entries[i:i + BATCH_SIZE] for i in range(0, len(entries), BATCH_SIZE)]
+        documents = []
+        for result in executor.map(_parse_batch, batches):
+            documents.extend(result)
+
+    tree = OrderedDict()
+    for (path, _), document in zip(entries, documents):
+        tree[path[len(prefix):-len(suffix)]] = document
+    return tree
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+A compact binary output format, with random access to each section (e.g.
+"packets") of each jar's aggregate.
+
+Layout of a file:
+
+    b"BRGR" and the format version (1 byte)
+    the encoded value of each section of each aggregate, one after another
+    the string table: the number of strings, then each string as its UTF-8
+        length and bytes
+    the index, as UTF-8 JSON: a list with an entry for each aggregate, of
+        {"version": version id or None, "file": source jar or None,
+         "sections": {name: [offset, length]}}
+    the offsets of the string table and of the index (8 bytes each, big
+        endian), and b"BRGR"
+
+Values are encoded as a tag byte followed by data, with all numbers other
+than floats written as (LEB128) varints:
+
+    NONE, FALSE, TRUE: nothing
+    INT: the zigzag-encoded value
+    FLOAT: 8 bytes, big endian IEEE 754
+    STR: the position of the string in the string table
+    LIST: the number of items, then each item
+    DICT: the number of items, then for each the position of the key in the
+          string table followed by the value
+
+Every string is written out once, in the string table, however many times
+it is used.  Reading a section only decodes that section (and the strings it
+uses).
+"""
+
+import json
+import mmap
+
+from struct import calcsize, pack, unpack_from
+
+import six
+
+from burger.strings import StringPool
+
+MAGIC = b"BRGR"
+FORMAT_VERSION = 1
+
+TAG_NONE = 0
+TAG_FALSE = 1
+TAG_TRUE = 2
+TAG_INT = 3
+TAG_FLOAT = 4
+TAG_STR = 5
+TAG_LIST = 6
+TAG_DICT = 7
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def encode(value, pool, out=None):
+    """
+    Encodes a JSON-compatible value, adding its strings to pool (a
+    StringPool, whose numbers are the positions in the string table).
+    Returns the bytearray out (a new one if not given).
+    """
+    if out is None:
+        out = bytearray()
+
+    def write(value):
+        if value is None:
+            out.append(TAG_NONE)
+        elif value is True:
+            out.append(TAG_TRUE)
+        elif value is False:
+            out.append(TAG_FALSE)
+        elif isinstance(value, six.string_types):
+            out.append(TAG_STR)
+            _write_varint(out, pool.number(value))
+        elif isinstance(value, six.integer_types):
+            out.append(TAG_INT)
+            # Zigzag encoding, so that small negative numbers stay small
+            _write_varint(out, value * 2 if value >= 0 else -value * 2 - 1)
+        elif isinstance(value, float):
+            out.append(TAG_FLOAT)
+            out.extend(pack(">d", value))
+        elif isinstance(value, dict):
+            out.append(TAG_DICT)
+            _write_varint(out, len(value))
+            for key, item in six.iteritems(value):
+                if not isinstance(key, six.string_types):
+                    # Same as JSON, where keys are always strings
+                    key = json.dumps(key)
+                _write_varint(out, pool.number(key))
+                write(item)
+        elif isinstance(value, (list, tuple)):
+            out.append(TAG_LIST)
+            _write_varint(out, len(value))
+            for item in value:
+                write(item)
+        else:
+            raise TypeError("Can't encode %r" % (value,))
+
+    write(value)
+    return out
+
+def _aggregate_info(aggregate):
+    """Gets the version id and source file of an aggregate, for the index."""
+    version = aggregate.get("version")
+    source = aggregate.get("source")
+    return {
+        "version": version.get("id") if isinstance(version, dict) else None,
+        "file": source.get("file") if isinstance(source, dict) else None
+    }
+
+def write_binary(summary, fout):
+    """Writes a list of aggregates to the binary file object fout."""
+    pool = StringPool()
+    index = []
+
+    fout.write(MAGIC + bytearray([FORMAT_VERSION]))
+    position = len(MAGIC) + 1
+    for aggregate in summary:
+        entry = _aggregate_info(aggregate)
+        sections = entry["sections"] = {}
+        for name in sorted(aggregate):
+            data = encode(aggregate[name], pool)
+            fout.write(data)
+            sections[name] = [position, len(data)]
+            position += len(data)
+        index.append(entry)
+
+    strings_offset = position
+    table = bytearray()
+    _write_varint(table, len(pool))
+    for string in pool:
+        data = string.encode("utf-8")
+        _write_varint(table, len(data))
+        table.extend(data)
+    fout.write(table)
+
+    index_offset = strings_offset + len(table)
+    fout.write(json.dumps(index).encode("utf-8"))
+    fout.write(pack(">QQ", strings_offset, index_offset) + MAGIC)
+
+class SectionReader(object):
+    """
+    The common part of reading a file of sections with an index, such as
+    written by write_binary (or burger.container.write_container).  The file
+    is memory-mapped, and nothing is decoded until it is asked for.
+
+    Subclasses set MAGIC, FORMAT_VERSION, FOOTER (the struct format of the
+    offsets before the closing magic, the last of which is the index's) and
+    NAME, and implement _read_section.
+    """
+
+    MAGIC = None
+    FORMAT_VERSION = None
+    FOOTER = ">Q"
+    NAME = None
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        data = self._data
+        magic = self.MAGIC
+
+        if data[:len(magic)] != magic or data[-len(magic):] != magic:
+            raise ValueError("Not a Burger %s file" % self.NAME)
+        if data[len(magic)] != self.FORMAT_VERSION:
+            raise ValueError("Unsupported format version %s" % data[len(magic)])
+
+        footer = len(data) - len(magic) - calcsize(self.FOOTER)
+        offsets = unpack_from(self.FOOTER, data, footer)
+        self.index = json.loads(data[offsets[-1]:footer].decode("utf-8"))
+        self._read_offsets(*offsets[:-1])
+
+    def _read_offsets(self, *offsets):
+        """Called with the footer's offsets other than the index's."""
+        pass
+
+    def _read_section(self, offset, length):
+        raise NotImplementedError()
+
+    def close(self):
+        self._data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    def find(self, version):
+        """
+        Gets the position of the aggregate for the given version id, or None
+        if there isn't one.
+        """
+        for i, entry in enumerate(self.index):
+            if entry["version"] == version:
+                return i
+        return None
+
+    def sections(self, i):
+        """Gets the names of the sections of the i-th aggregate."""
+        return list(self.index[i]["sections"])
+
+    def section(self, i, name):
+        """Decodes one section of the i-th aggregate."""
+        offset, length = self.index[i]["sections"][name]
+        return self._read_section(offset, length)
+
+    def aggregate(self, i):
+        """Decodes the whole i-th aggregate."""
+        return dict((name, self.section(i, name)) for name in self.sections(i))
+
+class BinaryReader(SectionReader):
+    """
+    Reads files written by write_binary.  Reading one section of one
+    aggregate only decodes that section (and the strings it uses).
+    """
+
+    MAGIC = MAGIC
+    FORMAT_VERSION = FORMAT_VERSION
+    FOOTER = ">QQ"
+    NAME = "binary"
+
+    def _read_offsets(self, strings_offset):
+        # Positions of each string in the table; strings are only decoded
+        # when first used
+        count, position = self._read_varint(strings_offset)
+        offsets = []
+        for _ in six.moves.range(count):
+            length, position = self._read_varint(position)
+            offsets.append((position, length))
+            position += length
+        self._string_offsets = offsets
+        self._strings = [None] * count
+
+    def _read_section(self, offset, length):
+        value, end = self.decode(offset)
+        assert end == offset + length
+        return value
+
+    def _read_varint(self, position):
+        data = self._data
+        result = 0
+        shift = 0
+        while True:
+            byte = data[position]
+            position += 1
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return result, position
+            shift += 7
+
+    def string(self, number):
+        """Gets a string from the string table."""
+        string = self._strings[number]
+        if string is None:
+            position, length = self._string_offsets[number]
+            string = self._strings[number] = self._data[position:position + length].decode("utf-8")
+        return string
+
+    def decode(self, position):
+        """Decodes the value at position, returning it and where it ends."""
+        data = self._data
+        read_varint = self._read_varint
+        string = self.string
+
+        def read(position):
+            tag = data[position]
+            position += 1
+            if tag == TAG_STR:
+                number, position = read_varint(position)
+                return string(number), position
+            elif tag == TAG_INT:
+                value, position = read_varint(position)
+                return (value >> 1) ^ -(value & 1), position
+            elif tag == TAG_DICT:
+                count, position = read_varint(position)
+                result = {}
+                for _ in six.moves.range(count):
+                    key, position = read_varint(position)
+                    result[string(key)], position = read(position)
+                return result, position
+            elif tag == TAG_LIST:
+                count, position = read_varint(position)
+                result = []
+                for _ in six.moves.range(count):
+                    item, position = read(position)
+                    result.append(item)
+                return result, position
+            elif tag == TAG_FLOAT:
+                return unpack_from(">d", data, position)[0], position + 8
+            elif tag == TAG_NONE:
+                return None, position
+            elif tag == TAG_TRUE:
+                return True, position
+            elif tag == TAG_FALSE:
+                return False, position
+            raise ValueError("Unknown tag %s at %s" % (tag, position - 1))
+
+        return read(position)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Caching of intermediate results that are expensive to compute, keyed by the
+content of the classes they were computed from.
+
+Results are kept in memory (up to MAX_MEMORY_ENTRIES of each kind, the
+most recently used), so that e.g. processing several jars only computes
+results for unchanged classes once.
+If a cache directory is set (with set_cache_dir, munch's --cache-dir option,
+or the BURGER_CACHE_DIR environment variable), results are also stored on
+disk and reused by later runs.
+
+Values are stored pickled, and every get returns a fresh copy, so callers
+are free to modify what they get back.
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+from collections import OrderedDict
+
+from burger.classreader import read_class_bytes
+from burger.tracing import ENTRY, jar_cache, record, unwrap
+
+CACHE_DIR_ENV = "BURGER_CACHE_DIR"
+
+# How many results of each kind are kept in memory; older ones are only
+# kept on disk, if there's a cache directory
+MAX_MEMORY_ENTRIES = 100000
+
+_cache_dir = os.environ.get(CACHE_DIR_ENV) or None
+
+def set_cache_dir(path):
+    """Sets the directory results are stored in; None disables the disk cache."""
+    global _cache_dir
+    _cache_dir = path
+
+def get_cache_dir():
+    """Gets the directory results are stored in, or None if there isn't one."""
+    return _cache_dir
+
+_class_hashes = jar_cache()
+
+def class_hash(classloader, name):
+    """
+    Gets a hash of the content of the class `name`, or None if it isn't in
+    the classloader.  Hashes are remembered for the classloader's lifetime.
+    """
+    record(classloader, ENTRY, name + ".class")
+    classloader = unwrap(classloader)
+    hashes = _class_hashes.get(classloader)
+    if hashes is None:
+        hashes = _class_hashes[classloader] = {}
+
+    try:
+        return hashes[name]
+    except KeyError:
+        pass
+
+    if name + ".class" in classloader.path_map:
+        result = hashlib.sha1(read_class_bytes(classloader, name)).hexdigest()
+    else:
+        result = None
+    hashes[name] = result
+    return result
+
+class ResultCache(object):
+    """
+    A cache of results of one kind, e.g. the resolved fields of classes.
+
+    version should be changed whenever the code computing the results changes
+    in a way that affects them, so that old results on disk aren't reused.
+    """
+
+    def __init__(self, namespace, version):
+        self.namespace = namespace
+        self.version = version
+        # Key -> pickled value, least recently used first
+        self._memory = OrderedDict()
+
+    def key(self, *parts):
+        """Builds a key from the repr of the given (hashable) parts."""
+        digest = hashlib.sha1(repr((self.namespace, self.version, parts)).encode("utf8"))
+        return digest.hexdigest()
+
+    def _remember(self, key, data):
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        while len(self._memory) > MAX_MEMORY_ENTRIES:
+            self._memory.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(_cache_dir, self.namespace, key[:2], key + ".pickle")
+
+    def get(self, key, default=None):
+        """Gets the value stored for the given key, or default if there isn't one."""
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+        elif _cache_dir is not None:
+            try:
+                with open(self._path(key), "rb") as fin:
+                    data = fin.read()
+            except (IOError, OSError):
+                pass
+            else:
+                self._remember(key, data)
+
+        if data is None:
+            return default
+        try:
+            return pickle.loads(data)
+        except Exception:
+            # A corrupt or outdated entry; treat it as missing
+            del self._memory[key]
+            return default
+
+    def put(self, key, value):
+        """Stores a value for the given key."""
+        try:
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            # Not something that can be cached
+            return
+        self._remember(key, data)
+
+        if _cache_dir is None:
+            return
+        path = self._path(key)
+        try:
+            directory = os.path.dirname(path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            # Write to a temporary file first so that concurrent runs never
+            # see a partially written entry
+            fd, temp_path = tempfile.mkstemp(dir=directory)
+            with os.fdopen(fd, "wb") as fout:
+                fout.write(data)
+            os.replace(temp_path, path)
+        except (IOError, OSError):
+            pass
+
+_caches = {}
+
+def get_cache(namespace, version):
+    """Gets the (shared) ResultCache for the given namespace."""
+    cache = _caches.get(namespace)
+    if cache is None or cache.version != version:
+        cache = _caches[namespace] = ResultCache(namespace, version)
+    return cache
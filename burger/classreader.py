@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Cheap readers for class files, for when a full ClassFile isn't needed.
+
+jawa's ClassFile builds every constant, field, method and attribute table
+up front.  A lot of what toppings ask of a class is answerable from the
+first few hundred bytes, so the functions here walk the raw bytes directly
+and only decode the constants that are actually asked for.  LazyClassFile
+does the same for full ClassFiles, deferring everything after the header.
+"""
+
+import io
+
+from collections import namedtuple
+from struct import unpack, unpack_from
+
+import six
+
+from jawa.cf import ClassFile
+from jawa.util.utf import decode_modified_utf8
+
+# See https://docs.oracle.com/javase/specs/jvms/se8/html/jvms-4.html#jvms-4.1-200-E.1
+ACC_PUBLIC = 0x0001
+ACC_FINAL = 0x0010
+ACC_SUPER = 0x0020
+ACC_INTERFACE = 0x0200
+ACC_ABSTRACT = 0x0400
+ACC_SYNTHETIC = 0x1000
+ACC_ANNOTATION = 0x2000
+ACC_ENUM = 0x4000
+
+CONSTANT_Utf8 = 1
+CONSTANT_Long = 5
+CONSTANT_Double = 6
+CONSTANT_Class = 7
+CONSTANT_String = 8
+
+# Size of the body of each constant (after the tag byte), other than UTF8,
+# whose size is length-prefixed.
+# See https://docs.oracle.com/javase/specs/jvms/se8/html/jvms-4.html#jvms-4.4
+_CONSTANT_SIZES = {
+    3: 4, # Integer
+    4: 4, # Float
+    5: 8, # Long
+    6: 8, # Double
+    7: 2, # Class
+    8: 2, # String
+    9: 4, # Fieldref
+    10: 4, # Methodref
+    11: 4, # InterfaceMethodref
+    12: 4, # NameAndType
+    15: 3, # MethodHandle
+    16: 2, # MethodType
+    17: 4, # Dynamic
+    18: 4, # InvokeDynamic
+    19: 2, # Module
+    20: 2 # Package
+}
+
+class ClassHeader(namedtuple("ClassHeader", ["name", "super_", "interfaces", "access_flags"])):
+    """
+    The part of a class file that comes before its fields and methods.
+
+    name: The class's name, e.g. "java/lang/String"
+    super_: The superclass's name, or None (for java/lang/Object)
+    interfaces: A tuple of the names of directly implemented interfaces
+    access_flags: The raw access flags, to be checked against the ACC_ constants
+    """
+    __slots__ = ()
+
+    @property
+    def is_interface(self):
+        return bool(self.access_flags & ACC_INTERFACE)
+
+    @property
+    def is_enum(self):
+        return bool(self.access_flags & ACC_ENUM)
+
+    @property
+    def is_abstract(self):
+        return bool(self.access_flags & ACC_ABSTRACT)
+
+def _decode_utf8(data):
+    # Same approach as jawa: most constants are plain UTF8, so only fall back
+    # to the (much slower) modified UTF8 decoder when that fails.
+    try:
+        return data.decode("utf8")
+    except UnicodeDecodeError:
+        return decode_modified_utf8(data)
+
+def scan_constant_pool(data):
+    """
+    Walks the constant pool of the raw class file `data` without decoding it.
+
+    Returns a tuple (entries, end), where entries is a list (indexed by
+    constant index) of (tag, offset) pairs giving the position of the body of
+    each constant, and end is the offset of the first byte after the pool.
+    Unused slots (index 0 and the second half of longs and doubles) are None.
+    """
+    if data[:4] != b"\xca\xfe\xba\xbe":
+        raise ValueError("invalid magic number")
+
+    count = unpack_from(">H", data, 8)[0]
+    entries = [None] * count
+    offset = 10
+    index = 1
+    sizes = _CONSTANT_SIZES
+    while index < count:
+        tag = data[offset]
+        offset += 1
+        entries[index] = (tag, offset)
+        if tag == CONSTANT_Utf8:
+            offset += 2 + unpack_from(">H", data, offset)[0]
+        else:
+            offset += sizes[tag]
+            if tag == CONSTANT_Long or tag == CONSTANT_Double:
+                # These take up two entries in the pool.
+                index += 1
+        index += 1
+
+    return entries, offset
+
+def utf8_at(data, entries, index):
+    """Decodes the UTF8 constant at `index` from a scanned constant pool."""
+    tag, offset = entries[index]
+    assert tag == CONSTANT_Utf8
+    length = unpack_from(">H", data, offset)[0]
+    return _decode_utf8(data[offset + 2:offset + 2 + length])
+
+def class_name_at(data, entries, index):
+    """Decodes the name of the Class constant at `index` from a scanned pool."""
+    tag, offset = entries[index]
+    assert tag == CONSTANT_Class
+    return utf8_at(data, entries, unpack_from(">H", data, offset)[0])
+
+def parse_header(data):
+    """
+    Reads the ClassHeader out of the raw class file `data`.  Only the UTF8
+    constants for the class names are decoded.
+    """
+    entries, offset = scan_constant_pool(data)
+    access_flags, this, super_, interfaces_count = unpack_from(">HHHH", data, offset)
+    interfaces = unpack_from(">%dH" % interfaces_count, data, offset + 8)
+
+    return ClassHeader(
+        class_name_at(data, entries, this),
+        class_name_at(data, entries, super_) if super_ != 0 else None,
+        tuple(class_name_at(data, entries, i) for i in interfaces),
+        access_flags
+    )
+
+class ConstantStrings(namedtuple("ConstantStrings", ["ordered", "strings", "utf8"])):
+    """
+    The text constants of a class.
+
+    ordered: A tuple of the values of String constants, in constant pool order
+    strings: A frozenset of the same values, for membership tests
+    utf8: A frozenset of every UTF8 constant (which includes names and
+          descriptors, as well as the values of String constants)
+    """
+    __slots__ = ()
+
+def parse_constant_strings(data):
+    """
+    Reads the String and UTF8 constants out of the raw class file `data`,
+    without building a ConstantPool.
+    """
+    entries, _ = scan_constant_pool(data)
+
+    utf8 = {}
+    string_indexes = []
+    for index, entry in enumerate(entries):
+        if entry is None:
+            continue
+        tag, offset = entry
+        if tag == CONSTANT_Utf8:
+            length = unpack_from(">H", data, offset)[0]
+            utf8[index] = _decode_utf8(data[offset + 2:offset + 2 + length])
+        elif tag == CONSTANT_String:
+            string_indexes.append(unpack_from(">H", data, offset)[0])
+
+    ordered = tuple(utf8[index] for index in string_indexes)
+    return ConstantStrings(ordered, frozenset(ordered), frozenset(six.itervalues(utf8)))
+
+def read_constant_strings(classloader, name):
+    """
+    Gets the ConstantStrings for the class `name`.  This never builds a
+    ClassFile, and doesn't add anything to the classloader's cache.
+    """
+    return parse_constant_strings(read_class_bytes(classloader, name))
+
+def header_from_classfile(cf):
+    """Builds a ClassHeader from an already parsed ClassFile."""
+    return ClassHeader(
+        cf.this.name.value,
+        cf.super_.name.value if cf._super != 0 else None,
+        tuple(i.name.value for i in cf.interfaces),
+        cf.access_flags.value
+    )
+
+def read_class_bytes(classloader, name):
+    """Reads the raw bytes of the class `name` from the classloader."""
+    with classloader.open(name + ".class") as fin:
+        return fin.read()
+
+def read_header(classloader, name):
+    """
+    Gets the ClassHeader for the class `name`, without building a ClassFile
+    (unless one is already in the classloader's cache).
+    """
+    cf = classloader.class_cache.get(name)
+    if cf is not None:
+        return header_from_classfile(cf)
+    return parse_header(read_class_bytes(classloader, name))
+
+class LazyClassFile(ClassFile):
+    """
+    A ClassFile that only reads its constant pool and header when loaded.
+
+    The fields, methods and attributes tables (and with them every method's
+    Code attribute) are kept as raw bytes until one of them is first accessed.
+    This makes loading a class to check its name, superclass, interfaces,
+    access flags or constants much cheaper, and otherwise behaves exactly like
+    a regular ClassFile.  Pass it as `klass` when creating a ClassLoader.
+    """
+
+    def __init__(self, source=None):
+        # The remaining, unparsed part of the class file
+        self._members = None
+        super().__init__(source)
+
+    def _from_io(self, source):
+        read = source.read
+
+        if unpack(">I", read(4))[0] != ClassFile.MAGIC:
+            raise ValueError("invalid magic number")
+
+        # The version is swapped on disk to (minor, major), so swap it back.
+        self.version = unpack(">HH", read(4))[::-1]
+        self._constants.unpack(source)
+        self.access_flags.unpack(read(2))
+
+        self._this, self._super, interfaces_count = unpack(">HHH", read(6))
+        self._interfaces = unpack(
+            ">%dH" % interfaces_count,
+            read(2 * interfaces_count)
+        )
+
+        self._members = read()
+
+    def _load_members(self):
+        members = self._members
+        if members is None:
+            return
+        self._members = None
+
+        source = io.BytesIO(members)
+        self._fields.unpack(source)
+        self._methods.unpack(source)
+        self._attributes.unpack(source)
+
+    @property
+    def members_loaded(self):
+        """Whether the fields, methods and attributes have been read yet."""
+        return self._members is None
+
+    @property
+    def fields(self):
+        self._load_members()
+        return self._fields
+
+    @fields.setter
+    def fields(self, value):
+        self._fields = value
+
+    @property
+    def methods(self):
+        self._load_members()
+        return self._methods
+
+    @methods.setter
+    def methods(self, value):
+        self._methods = value
+
+    @property
+    def attributes(self):
+        self._load_members()
+        return self._attributes
+
+    @attributes.setter
+    def attributes(self, value):
+        self._attributes = value
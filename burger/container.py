@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+A section-indexed output container, and a lazy reader for it (and for the
+binary format in burger/binary.py).
+
+Consumers usually want one section of one version's output, e.g. "blocks"
+for 1.14.  The container stores each section of each aggregate as its own
+JSON document, with an index of where each one is, so that a section can be
+read (or served as-is, e.g. by a web viewer) without parsing anything else.
+
+Layout of a file:
+
+    b"BRGC" and the format version (1 byte)
+    each section of each aggregate as compact UTF-8 JSON, one after another
+    the index, as UTF-8 JSON: a list with an entry for each aggregate, of
+        {"version": version id or None, "file": source jar or None,
+         "sections": {name: [offset, length]}}
+    the offset of the index (8 bytes, big endian), and b"BRGC"
+
+open_output opens either format as a list-like of LazyAggregate, which are
+read-only mappings that only load a section when it's accessed.
+"""
+
+import json
+
+from collections.abc import Mapping, Sequence
+from struct import pack
+
+from burger import binary
+
+MAGIC = b"BRGC"
+FORMAT_VERSION = 1
+
+def write_container(summary, fout):
+    """Writes a list of aggregates to the binary file object fout."""
+    index = []
+
+    fout.write(MAGIC + bytearray([FORMAT_VERSION]))
+    position = len(MAGIC) + 1
+    for aggregate in summary:
+        entry = binary._aggregate_info(aggregate)
+        sections = entry["sections"] = {}
+        for name in sorted(aggregate):
+            data = json.dumps(aggregate[name], sort_keys=True, separators=(",", ":")).encode("utf-8")
+            fout.write(data)
+            sections[name] = [position, len(data)]
+            position += len(data)
+        index.append(entry)
+
+    fout.write(json.dumps(index).encode("utf-8"))
+    fout.write(pack(">Q", position) + MAGIC)
+
+class ContainerReader(binary.SectionReader):
+    """
+    Reads files written by write_container.  Sections are only parsed when
+    asked for.  This has the same interface as binary.BinaryReader, and can
+    also give a section's JSON as is.
+    """
+
+    MAGIC = MAGIC
+    FORMAT_VERSION = FORMAT_VERSION
+    FOOTER = ">Q"
+    NAME = "container"
+
+    def raw_section(self, i, name):
+        """Gets the JSON bytes of one section of the i-th aggregate."""
+        offset, length = self.index[i]["sections"][name]
+        return self._data[offset:offset + length]
+
+    def _read_section(self, offset, length):
+        return json.loads(self._data[offset:offset + length].decode("utf-8"))
+
+class LazyAggregate(Mapping):
+    """
+    One aggregate in an output file, as a read-only mapping of section name
+    to section.  Each section is loaded the first time it's accessed, and
+    then kept.
+    """
+
+    def __init__(self, reader, i):
+        self.reader = reader
+        self.position = i
+        self._names = reader.sections(i)
+        self._loaded = {}
+
+    @property
+    def version(self):
+        return self.reader.index[self.position]["version"]
+
+    def __getitem__(self, name):
+        try:
+            return self._loaded[name]
+        except KeyError:
+            pass
+        if name not in self._names:
+            raise KeyError(name)
+        section = self._loaded[name] = self.reader.section(self.position, name)
+        return section
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def is_loaded(self, name):
+        """Whether the given section has been loaded yet."""
+        return name in self._loaded
+
+    def __repr__(self):
+        return "<LazyAggregate %s (%s loaded of %s)>" % (self.version,
+                len(self._loaded), len(self._names))
+
+class LazyOutput(Sequence):
+    """A whole output file, as a read-only list of LazyAggregate."""
+
+    def __init__(self, reader):
+        self.reader = reader
+        self._aggregates = [LazyAggregate(reader, i) for i in range(len(reader))]
+
+    def __getitem__(self, i):
+        return self._aggregates[i]
+
+    def __len__(self):
+        return len(self._aggregates)
+
+    def find(self, version):
+        """Gets the LazyAggregate for the given version id, or None."""
+        i = self.reader.find(version)
+        return self._aggregates[i] if i is not None else None
+
+    def close(self):
+        self.reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def open_output(path):
+    """
+    Opens an output file written in the container (--sections) or binary
+    (--binary) format as a LazyOutput.
+    """
+    with open(path, "rb") as fin:
+        magic = fin.read(len(MAGIC))
+
+    if magic == MAGIC:
+        return LazyOutput(ContainerReader(path))
+    elif magic == binary.MAGIC:
+        return LazyOutput(binary.BinaryReader(path))
+    else:
+        raise ValueError("%s is not a Burger container or binary file" % path)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+A structure-aware diff of two aggregates, e.g. to build a changelog of the
+protocol between two versions.
+
+Every subtree is hashed (once, bottom up; see burger/hashing.py), so
+subtrees that didn't change are skipped by comparing their hashes without
+looking inside them.  Entries of dictionaries are matched by key, so blocks,
+items and entities are matched by their text id, and packets by their
+state, direction and id.  (Packets' classes are obfuscated names that are
+reassigned between versions, so they can't be used to match packets.)
+Lists, such as packet instructions, are aligned by the hashes of their
+items, so that an inserted instruction shows up as one addition rather than
+a change to everything after it.
+
+Changes are produced one at a time, as dicts with an "op" and the "path" of
+the changed node (a list of keys and list positions):
+
+    added: "new" is the added value
+    removed: "old" is the removed value
+    changed: "old" and "new" are the values, which aren't both containers
+        of the same type
+"""
+
+from collections.abc import Mapping
+from difflib import SequenceMatcher
+
+import six
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from burger.container import LazyOutput, open_output
+from burger.hashing import MerkleHasher
+from burger.strings import from_string_table
+
+def diff(old, new, path=(), hasher=None):
+    """Yields the changes (see the module docstring) from old to new."""
+    if hasher is None:
+        hasher = MerkleHasher()
+
+    if hasher(old) == hasher(new):
+        return
+
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old:
+            if key not in new:
+                yield {"op": "removed", "path": list(path) + [key], "old": old[key]}
+        for key in old:
+            if key in new:
+                for change in diff(old[key], new[key], tuple(path) + (key,), hasher):
+                    yield change
+        for key in new:
+            if key not in old:
+                yield {"op": "added", "path": list(path) + [key], "new": new[key]}
+    elif isinstance(old, (list, tuple)) and isinstance(new, (list, tuple)):
+        matcher = SequenceMatcher(None, [hasher(item) for item in old],
+                [hasher(item) for item in new], autojunk=False)
+        for op, i1, i2, j1, j2 in matcher.get_opcodes():
+            if op == "equal":
+                continue
+            common = min(i2 - i1, j2 - j1) if op == "replace" else 0
+            # Replaced items are compared one to one, as far as they go
+            for k in six.moves.range(common):
+                for change in diff(old[i1 + k], new[j1 + k], tuple(path) + (j1 + k,), hasher):
+                    yield change
+            for i in six.moves.range(i1 + common, i2):
+                yield {"op": "removed", "path": list(path) + [i], "old": old[i]}
+            for j in six.moves.range(j1 + common, j2):
+                yield {"op": "added", "path": list(path) + [j], "new": new[j]}
+    else:
+        yield {"op": "changed", "path": list(path), "old": old, "new": new}
+
+def _raw_section(aggregate, name):
+    """Gets the JSON bytes of a section, if aggregate is from a container."""
+    reader = getattr(aggregate, "reader", None)
+    if reader is None or not hasattr(reader, "raw_section"):
+        return None
+    return reader.raw_section(aggregate.position, name)
+
+def diff_aggregates(old, new):
+    """
+    Yields the changes from the aggregate old to new.  These can also be
+    LazyAggregate (see burger/container.py), in which case only the
+    sections that differ are loaded.
+    """
+    hasher = MerkleHasher()
+    for name in sorted(set(old) | set(new)):
+        if name == "source":
+            continue
+        if name not in new:
+            yield {"op": "removed", "path": [name], "old": old[name]}
+        elif name not in old:
+            yield {"op": "added", "path": [name], "new": new[name]}
+        else:
+            old_raw = _raw_section(old, name)
+            if old_raw is not None and old_raw == _raw_section(new, name):
+                continue
+            for change in diff(old[name], new[name], (name,), hasher):
+                yield change
+
+def load_aggregate(path):
+    """
+    Loads the single aggregate in an output file, in any of the output
+    formats (JSON, --string-table, --binary or --sections).  Binary and
+    container files are opened lazily.  Raises ValueError if the file can't
+    be read or isn't output.
+    """
+    try:
+        try:
+            output = open_output(path)
+        except ValueError:
+            with open(path, "rb") as fin:
+                output = json.loads(fin.read().decode("utf-8"))
+            if isinstance(output, dict) and "strings" in output and "data" in output:
+                output = from_string_table(output)
+            if isinstance(output, dict):
+                output = [output]
+    except (IOError, OSError) as e:
+        raise ValueError("Can't read %s: %s" % (path, e))
+    except ValueError as e:
+        raise ValueError("%s is not a jar or Burger output: %s" % (path, e))
+
+    if not isinstance(output, (list, LazyOutput)):
+        raise ValueError("%s is not a jar or Burger output" % path)
+    if len(output) != 1:
+        raise ValueError("%s contains %s aggregates, not 1" % (path, len(output)))
+    if not isinstance(output[0], Mapping):
+        raise ValueError("%s is not a jar or Burger output" % path)
+    return output[0]
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Content hashes (Merkle hashes) of every node of an aggregate.
+
+The hash of a dictionary or list is computed from the hashes of its
+children, so each is only computed once, and two subtrees have the same hash
+exactly when they have the same content.  Hashes only depend on content as
+it is written out as JSON: dictionary keys are hashed as JSON would write
+them and in sorted order, and tuples hash the same as lists.  The hash of a
+node of loaded output is therefore the same as that of the node it was
+written from, whatever version or run it came from.
+
+munch's --hashes option writes the hashes of the nodes near the top of each
+aggregate (each section, and each packet, block, entity and so on) to a
+sidecar file, so that whether e.g. a packet changed between two versions can
+be told by comparing two hashes, without loading either version's output.
+"""
+
+import binascii
+import hashlib
+
+from collections import OrderedDict
+
+import six
+
+from burger.binary import _aggregate_info
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+# By default, hashes are written down to e.g. "/packets/packet/<packet>"
+INDEX_DEPTH = 3
+
+def _json_key(key):
+    """Gets a dictionary key as it would be written as JSON."""
+    if isinstance(key, six.string_types):
+        return key
+    return json.dumps(key)
+
+class MerkleHasher(object):
+    """Computes and remembers the hashes of subtrees."""
+
+    def __init__(self):
+        # id(container) -> (container, hash); the container is kept so that
+        # its id isn't reused
+        self._hashes = {}
+
+    def __call__(self, value):
+        """Gets the hash of value, as bytes."""
+        if isinstance(value, dict):
+            cached = self._hashes.get(id(value))
+            if cached is not None:
+                return cached[1]
+            digest = hashlib.sha1(b"d")
+            for key, item in sorted(((_json_key(key), item)
+                    for key, item in six.iteritems(value)), key=lambda entry: entry[0]):
+                digest.update(self._scalar(key))
+                digest.update(self(item))
+        elif isinstance(value, (list, tuple)):
+            cached = self._hashes.get(id(value))
+            if cached is not None:
+                return cached[1]
+            digest = hashlib.sha1(b"l")
+            for item in value:
+                digest.update(self(item))
+        else:
+            return self._scalar(value)
+
+        result = digest.digest()
+        self._hashes[id(value)] = (value, result)
+        return result
+
+    def hexdigest(self, value):
+        """Gets the hash of value, as a hex string."""
+        return binascii.hexlify(self(value)).decode("ascii")
+
+    @staticmethod
+    def _scalar(value):
+        return hashlib.sha1(json.dumps(value).encode("utf-8")).digest()
+
+def pointer(path):
+    """Gets a JSON pointer (RFC 6901) for a path of keys and list positions."""
+    return "".join("/" + str(part).replace("~", "~0").replace("/", "~1")
+            for part in path)
+
+def node_hashes(value, depth=INDEX_DEPTH, hasher=None):
+    """
+    Gets the hashes of value and of each dictionary and list in it down to
+    the given depth, as an OrderedDict of JSON pointer -> hex hash.
+    """
+    if hasher is None:
+        hasher = MerkleHasher()
+    hashes = OrderedDict()
+
+    def visit(value, path):
+        hashes[pointer(path)] = hasher.hexdigest(value)
+        if len(path) >= depth:
+            return
+        if isinstance(value, dict):
+            for key in sorted(value, key=_json_key):
+                if isinstance(value[key], (dict, list, tuple)):
+                    visit(value[key], path + (_json_key(key),))
+        elif isinstance(value, (list, tuple)):
+            for i, item in enumerate(value):
+                if isinstance(item, (dict, list, tuple)):
+                    visit(item, path + (i,))
+
+    visit(value, ())
+    return hashes
+
+def write_index(summary, fout, depth=INDEX_DEPTH):
+    """
+    Writes the sidecar index of hashes for a list of aggregates to the file
+    object fout, as JSON: a list with an entry for each aggregate, of
+    {"version": version id or None, "file": source jar or None,
+     "hashes": {JSON pointer: hex hash}}.
+
+    The aggregate's source (which has the jar's path and size) isn't hashed,
+    so that the same content from different jars has the same hash.
+    """
+    hasher = MerkleHasher()
+    index = []
+    for aggregate in summary:
+        entry = _aggregate_info(aggregate)
+        content = dict((k, v) for k, v in six.iteritems(aggregate) if k != "source")
+        entry["hashes"] = node_hashes(content, depth, hasher)
+        index.append(entry)
+    json.dump(index, fout, indent=1)
+
+def load_index(path):
+    """Loads a sidecar index written by write_index."""
+    with open(path) as fin:
+        return json.load(fin)
+
+def changed_nodes(old_hashes, new_hashes):
+    """
+    Compares the hashes of two aggregates from an index.  Returns the
+    pointers of nodes that were added, removed and changed, as three sorted
+    lists.
+    """
+    added = sorted(p for p in new_hashes if p not in old_hashes)
+    removed = sorted(p for p in old_hashes if p not in new_hashes)
+    changed = sorted(p for p in new_hashes
+            if p in old_hashes and old_hashes[p] != new_hashes[p])
+    return added, removed, changed
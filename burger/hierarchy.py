@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+A jar-wide index of the class hierarchy, built from class headers only.
+
+Several toppings need to walk up (or down) the class hierarchy, e.g. to check
+whether a class is an enum or whether a block has a block entity.  Doing that
+with `classloader[name].super_` parses each whole class along the way; the
+index here only ever reads the header of each class, and remembers it.
+"""
+
+from collections import deque
+
+from burger.classreader import read_header
+from burger.tracing import LISTING, jar_cache, record, unwrap
+
+_hierarchies = jar_cache()
+
+def get_hierarchy(classloader):
+    """Gets the (shared) ClassHierarchy for the given classloader."""
+    # The hierarchy can answer questions about any class in the jar
+    record(classloader, LISTING)
+    classloader = unwrap(classloader)
+    hierarchy = _hierarchies.get(classloader)
+    if hierarchy is None:
+        hierarchy = _hierarchies[classloader] = ClassHierarchy(classloader)
+    return hierarchy
+
+class ClassHierarchy(object):
+    """
+    Superclass, interface and access flag information for every class in a
+    classloader.
+
+    Headers are read lazily as classes are asked about, so walking up from a
+    handful of classes is cheap.  Queries that need to know about subclasses
+    read the header of every class in the jar, once.
+
+    Classes that aren't in the jar (e.g. java/lang/Object) are treated as
+    having no superclass or interfaces.
+    """
+
+    def __init__(self, classloader):
+        self.classloader = classloader
+        # Class name -> ClassHeader, or None if the class isn't in the jar
+        self._headers = {}
+        # Class name -> list of names of direct subclasses and implementors;
+        # only built when first needed
+        self._subclasses = None
+
+    def header(self, name):
+        """Gets the ClassHeader for `name`, or None if it isn't in the jar."""
+        try:
+            return self._headers[name]
+        except KeyError:
+            pass
+
+        if name in self.classloader:
+            header = read_header(self.classloader, name)
+        else:
+            header = None
+        self._headers[name] = header
+        return header
+
+    def __contains__(self, name):
+        return self.header(name) is not None
+
+    def super_(self, name):
+        """
+        Gets the name of the superclass of `name`, or None if it doesn't have
+        one or isn't in the jar.
+        """
+        header = self.header(name)
+        return header.super_ if header else None
+
+    def interfaces(self, name):
+        """Gets the names of the interfaces directly implemented by `name`."""
+        header = self.header(name)
+        return header.interfaces if header else ()
+
+    def access_flags(self, name):
+        """Gets the raw access flags of `name`, or 0 if it isn't in the jar."""
+        header = self.header(name)
+        return header.access_flags if header else 0
+
+    def ancestors(self, name, interfaces=False):
+        """
+        Iterates over the superclasses of `name`, nearest first.  This includes
+        the first superclass that isn't in the jar (typically java/lang/Object
+        or java/lang/Enum), but stops there.
+
+        If interfaces is True, (all) implemented interfaces are included as
+        well, each after the class that implements it.  Each name is only
+        yielded once.
+        """
+        if not interfaces:
+            name = self.super_(name)
+            while name is not None:
+                yield name
+                name = self.super_(name)
+            return
+
+        seen = set([name])
+        pending = deque([name])
+        while pending:
+            current = pending.popleft()
+            parents = list(self.interfaces(current))
+            parent = self.super_(current)
+            if parent is not None:
+                parents.insert(0, parent)
+            for parent in parents:
+                if parent not in seen:
+                    seen.add(parent)
+                    pending.append(parent)
+                    yield parent
+
+    def is_subclass(self, name, parent):
+        """
+        Checks whether `name` extends or implements `parent`, directly or
+        indirectly.  A class is not considered a subclass of itself.
+        """
+        return any(ancestor == parent for ancestor in self.ancestors(name, True))
+
+    def _build_subclasses(self):
+        if self._subclasses is not None:
+            return self._subclasses
+
+        subclasses = {}
+        for name in self.classloader.classes:
+            header = self.header(name)
+            if header.super_ is not None:
+                subclasses.setdefault(header.super_, []).append(name)
+            for interface in header.interfaces:
+                subclasses.setdefault(interface, []).append(name)
+
+        self._subclasses = subclasses
+        return subclasses
+
+    def subclasses(self, name):
+        """
+        Gets the names of classes that directly extend or implement `name`.
+        This reads the header of every class in the jar the first time.
+        """
+        return list(self._build_subclasses().get(name, ()))
+
+    def descendants(self, name):
+        """
+        Iterates over all classes that extend or implement `name`, directly or
+        indirectly, nearest first.
+        """
+        subclasses = self._build_subclasses()
+        seen = set([name])
+        pending = deque([name])
+        while pending:
+            current = pending.popleft()
+            for child in subclasses.get(current, ()):
+                if child not in seen:
+                    seen.add(child)
+                    pending.append(child)
+                    yield child
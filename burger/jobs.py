@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Spreading jars over several machines (or processes) through a shared
+directory, without any other service: munch's --submit, --work and --merge
+options.
+
+A job directory looks like:
+
+    pending/    One JSON file per job that no worker has claimed yet
+    claimed/    Jobs a worker is working on, with the worker and the time
+                it claimed them
+    done/       Jobs whose result has been written
+    failed/     Jobs that failed, with the error
+    results/    Each done job's output, and its SHA-256 checksum
+    numbers/    An empty file for each job number that's been used
+    jars/       Downloaded jars, shared by every worker
+    cache/      The analysis cache (see burger/cache.py), unless another
+                cache directory is set
+
+A job is a jar path (which must be reachable by every worker) or a version
+to download.  A worker claims a job by renaming its file from pending/ to
+claimed/; renaming is atomic, so only one worker can succeed, and the
+others move on to the next job.  Results are written to a temporary file
+and renamed into place, and their checksum is written after them, so a
+result with a matching checksum is always complete.
+
+Job numbers are reserved by creating their file in numbers/ exclusively, so
+submitters running at the same time never give two jobs the same number.
+
+A job claimed by a worker that died (or was stopped) stays in claimed/.
+Before claiming a job, work moves jobs claimed more than a lease ago
+(LEASE_SECONDS by default) back to pending/, so that another worker runs
+them; a worker that's stopped with Ctrl-C puts its job back straight away.
+The lease should be longer than any one job takes, or a job that's still
+running will be run again as well (which is wasteful, but harmless, as both
+write the same result).
+
+merge reads every job's result, in the order they were submitted, checking
+its checksum.
+"""
+
+import errno
+import hashlib
+import os
+import re
+import socket
+import tempfile
+import time
+import traceback
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from burger import website
+from burger.cache import get_cache_dir, set_cache_dir
+from burger.runner import iter_run
+
+PENDING = "pending"
+CLAIMED = "claimed"
+DONE = "done"
+FAILED = "failed"
+RESULTS = "results"
+NUMBERS = "numbers"
+JARS = "jars"
+CACHE = "cache"
+
+# Seconds after which a claimed job is given to another worker
+LEASE_SECONDS = 6 * 60 * 60
+
+def _write_atomic(path, data):
+    """Writes data (bytes) to path so that it's never seen partially written."""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as fout:
+        fout.write(data)
+    os.replace(temp_path, path)
+
+def _reserve_number(job_dir, number):
+    """
+    Reserves the first job number from number on that no one else has,
+    returning it.
+    """
+    while True:
+        try:
+            fd = os.open(os.path.join(job_dir, NUMBERS, "%06d" % number),
+                    os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+            number += 1
+            continue
+        os.close(fd)
+        return number
+
+def _job_ids(job_dir):
+    """Gets the ids of every job, in the order they were submitted."""
+    ids = set()
+    for state in (PENDING, CLAIMED, DONE, FAILED):
+        directory = os.path.join(job_dir, state)
+        if os.path.isdir(directory):
+            ids.update(name[:-5] for name in os.listdir(directory) if name.endswith(".json"))
+    return sorted(ids)
+
+def _read_job(job_dir, job_id):
+    """Gets a job's description, and the state it's in."""
+    for state in (DONE, CLAIMED, PENDING, FAILED):
+        try:
+            with open(os.path.join(job_dir, state, job_id + ".json")) as fin:
+                return json.load(fin), state
+        except (IOError, OSError):
+            pass
+    raise ValueError("No job %s in %s" % (job_id, job_dir))
+
+def submit(job_dir, jars=(), versions=(), toppings=None):
+    """
+    Adds a job for each of the given jars and versions to job_dir, creating
+    it if needed.  Returns the ids of the new jobs.
+    """
+    for state in (PENDING, CLAIMED, DONE, FAILED, RESULTS, NUMBERS, JARS):
+        directory = os.path.join(job_dir, state)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    existing = _job_ids(job_dir)
+    number = int(existing[-1].split("-")[0]) + 1 if existing else 0
+    ids = []
+    jobs = [{"jar": os.path.abspath(jar), "version": None} for jar in jars] + \
+            [{"jar": None, "version": version} for version in versions]
+    for job in jobs:
+        number = _reserve_number(job_dir, number)
+        name = os.path.basename(job["jar"]) if job["jar"] else job["version"]
+        job_id = "%06d-%s" % (number, re.sub(r"[^\w.-]", "_", name))
+        job.update({"id": job_id, "toppings": toppings})
+        _write_atomic(os.path.join(job_dir, PENDING, job_id + ".json"),
+                json.dumps(job, sort_keys=True).encode("utf-8"))
+        ids.append(job_id)
+        number += 1
+    return ids
+
+def claim(job_dir, worker=None):
+    """
+    Claims the first pending job for worker, returning it, or None if there
+    are none.
+    """
+    pending = os.path.join(job_dir, PENDING)
+    for name in sorted(os.listdir(pending)):
+        if not name.endswith(".json"):
+            continue
+        claimed = os.path.join(job_dir, CLAIMED, name)
+        try:
+            os.rename(os.path.join(pending, name), claimed)
+        except OSError:
+            # Another worker got there first
+            continue
+        # Until the claim is recorded, the file's time stands in for it
+        os.utime(claimed, None)
+        with open(claimed) as fin:
+            job = json.load(fin)
+        job.update({"worker": worker, "claimed": time.time()})
+        _write_atomic(claimed, json.dumps(job, sort_keys=True).encode("utf-8"))
+        return job
+    return None
+
+def release(job_dir, job_id):
+    """Puts a claimed job back in pending/.  Returns whether it was there."""
+    try:
+        os.rename(os.path.join(job_dir, CLAIMED, job_id + ".json"),
+                os.path.join(job_dir, PENDING, job_id + ".json"))
+        return True
+    except OSError:
+        return False
+
+def reclaim(job_dir, lease=LEASE_SECONDS, verbose=False):
+    """
+    Puts jobs that were claimed more than lease seconds ago back in
+    pending/, as their workers have presumably died.  Returns their ids.
+    """
+    claimed_dir = os.path.join(job_dir, CLAIMED)
+    now = time.time()
+    ids = []
+    for name in sorted(os.listdir(claimed_dir)):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(claimed_dir, name)
+        try:
+            with open(path) as fin:
+                job = json.load(fin)
+            claimed = job.get("claimed") or os.path.getmtime(path)
+        except (IOError, OSError, ValueError):
+            # Done, or taken back by someone else, in the meantime
+            continue
+        if now - claimed > lease and release(job_dir, name[:-5]):
+            if verbose:
+                print("Reclaimed %s from %s" % (name[:-5], job.get("worker")))
+            ids.append(name[:-5])
+    return ids
+
+def _result_paths(job_dir, job_id):
+    path = os.path.join(job_dir, RESULTS, job_id + ".json")
+    return path, path + ".sha256"
+
+def _finish_job(job_dir, job, state):
+    """
+    Writes a claimed job to state (done/ or failed/), and removes its claim.
+    The claim may already be gone, if the job was reclaimed and finished by
+    another worker.
+    """
+    job_id = job["id"]
+    _write_atomic(os.path.join(job_dir, state, job_id + ".json"),
+            json.dumps(job, sort_keys=True).encode("utf-8"))
+    try:
+        os.remove(os.path.join(job_dir, CLAIMED, job_id + ".json"))
+    except OSError:
+        pass
+
+def work(job_dir, verbose=False, cache_toppings=False, worker=None, lease=LEASE_SECONDS):
+    """
+    Runs pending jobs in job_dir until there are none left, first taking
+    back jobs claimed more than lease seconds ago (unless lease is None).
+    Returns the number of jobs run.
+    """
+    if worker is None:
+        worker = "%s-%d" % (socket.gethostname(), os.getpid())
+    if get_cache_dir() is None:
+        set_cache_dir(os.path.join(job_dir, CACHE))
+
+    count = 0
+    while True:
+        if lease is not None:
+            reclaim(job_dir, lease, verbose)
+        job = claim(job_dir, worker)
+        if job is None:
+            return count
+        count += 1
+        job_id = job["id"]
+        if verbose:
+            print("%s: running %s" % (worker, job_id))
+
+        try:
+            if job["jar"] is not None:
+                jar = job["jar"]
+            else:
+                jar = website.client_jar(job["version"], verbose, os.path.join(job_dir, JARS))
+            aggregate = next(iter_run([jar], job["toppings"], verbose,
+                    cache_toppings=cache_toppings))
+        except KeyboardInterrupt:
+            # Let another worker run it
+            release(job_dir, job_id)
+            raise
+        except Exception:
+            job["error"] = traceback.format_exc()
+            if verbose:
+                print("%s: %s failed" % (worker, job_id))
+            _finish_job(job_dir, job, FAILED)
+            continue
+
+        data = json.dumps({"job": job, "worker": worker, "aggregate": aggregate},
+                sort_keys=True).encode("utf-8")
+        path, checksum_path = _result_paths(job_dir, job_id)
+        _write_atomic(path, data)
+        _write_atomic(checksum_path, hashlib.sha256(data).hexdigest().encode("ascii"))
+        _finish_job(job_dir, job, DONE)
+
+def read_result(job_dir, job_id):
+    """
+    Gets the aggregate in a job's result.  Raises ValueError if there isn't
+    one, or its checksum doesn't match.
+    """
+    path, checksum_path = _result_paths(job_dir, job_id)
+    try:
+        with open(path, "rb") as fin:
+            data = fin.read()
+        with open(checksum_path, "rb") as fin:
+            checksum = fin.read().decode("ascii").strip()
+    except (IOError, OSError):
+        raise ValueError("Job %s has no result" % job_id)
+    if hashlib.sha256(data).hexdigest() != checksum:
+        raise ValueError("The result of job %s doesn't match its checksum" % job_id)
+    return json.loads(data.decode("utf-8"))["aggregate"]
+
+def merge(job_dir):
+    """
+    Gets the aggregates of every job in job_dir, in the order they were
+    submitted.  Raises ValueError if any aren't done.
+    """
+    aggregates = []
+    problems = []
+    for job_id in _job_ids(job_dir):
+        job, state = _read_job(job_dir, job_id)
+        if state == FAILED:
+            problems.append("%s failed:\n%s" % (job_id, job.get("error", "")))
+            continue
+        try:
+            aggregates.append(read_result(job_dir, job_id))
+        except ValueError as e:
+            problems.append("%s (%s)" % (e, state))
+    if problems:
+        raise ValueError("%d jobs aren't done:\n%s" % (len(problems), "\n".join(problems)))
+    return aggregates
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Loading of every locale's language file, from the jar and/or from an asset
+store laid out like the launcher's (an assets directory containing
+indexes/<id>.json and objects/<xx>/<hash>).
+
+Older versions ship every locale inside the jar; newer ones only ship
+en_us, with the rest downloaded by the launcher as assets.  Files are parsed
+in this process, or with an executor if one is given (toppings don't start
+processes of their own; see burger/assets.py).  The result is a columnar
+table: one list of keys, and for each locale a list of values in the same
+order.  All keys and values are interned in a StringPool, so that strings
+repeated across locales (and across versions, if the same pool is used for
+several jars) are only kept once.
+"""
+
+import os
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from burger.toppings.language import LanguageTopping
+from burger.tracing import PREFIX, read_entry, record, unwrap
+
+# Where language files are in the jar, and in an asset index
+JAR_PREFIX = "assets/minecraft/lang/"
+ASSET_PREFIXES = ("minecraft/lang/", "lang/")
+SUFFIXES = (".json", ".lang")
+
+# Below this many files, parsing them in the current process is faster than
+# sending them to an executor
+MIN_PARALLEL_FILES = 8
+
+def _locale_name(file_name):
+    """Gets the locale of a language file's name, e.g. de_DE.lang -> de_de."""
+    return file_name[:file_name.rfind(".")].lower()
+
+def _parse_locale(source):
+    """
+    Parses one language file, possibly in another process, the same way as
+    the language topping parses the jar's English one.
+
+    source is a tuple of (locale, is_json, data, path), where either data
+    is the file's contents or path is where to read them from.  Returns a
+    tuple of (locale, list of (key, value)).
+    """
+    locale, is_json, data, path = source
+    if data is None:
+        with open(path, "rb") as fin:
+            data = fin.read()
+    entries = LanguageTopping.parse_lang(data.decode("utf-8-sig"), False, is_json)
+    return locale, [(category + "." + name, value) for category, name, value in entries]
+
+def jar_sources(classloader):
+    """Gets the sources (see _parse_locale) of the language files in the jar."""
+    record(classloader, PREFIX, JAR_PREFIX)
+    sources = {}
+    for path in unwrap(classloader).path_map:
+        if path.startswith(JAR_PREFIX) and path.endswith(SUFFIXES):
+            file_name = path[len(JAR_PREFIX):]
+            if "/" in file_name:
+                continue
+            sources[_locale_name(file_name)] = (_locale_name(file_name),
+                    file_name.endswith(".json"), read_entry(classloader, path), None)
+    return sources
+
+def find_asset_index(assets_dir, index_id=None, version_id=None):
+    """
+    Finds the path of the asset index to use in the given asset store.
+
+    If index_id isn't given, it's looked up from the launcher's version JSON
+    for version_id (in the versions directory next to the assets directory);
+    failing that, the only index in the store is used.  Returns None if no
+    index could be found.
+    """
+    indexes_dir = os.path.join(assets_dir, "indexes")
+    if index_id is None and version_id is not None:
+        version_json = os.path.join(assets_dir, os.pardir, "versions",
+                version_id, version_id + ".json")
+        if os.path.exists(version_json):
+            with open(version_json) as fin:
+                meta = json.load(fin)
+            if "assetIndex" in meta:
+                index_id = meta["assetIndex"]["id"]
+            elif "assets" in meta:
+                index_id = meta["assets"]
+
+    if index_id is None:
+        if not os.path.isdir(indexes_dir):
+            return None
+        indexes = [name for name in os.listdir(indexes_dir) if name.endswith(".json")]
+        if len(indexes) != 1:
+            return None
+        return os.path.join(indexes_dir, indexes[0])
+
+    path = os.path.join(indexes_dir, index_id + ".json")
+    return path if os.path.exists(path) else None
+
+def asset_sources(assets_dir, index_path):
+    """
+    Gets the sources (see _parse_locale) of the language files listed in
+    the given asset index.
+    """
+    with open(index_path) as fin:
+        index = json.load(fin)
+
+    sources = {}
+    for name, info in index["objects"].items():
+        for prefix in ASSET_PREFIXES:
+            if name.startswith(prefix) and name.endswith(SUFFIXES):
+                file_name = name[len(prefix):]
+                if "/" in file_name:
+                    continue
+                hash = info["hash"]
+                path = os.path.join(assets_dir, "objects", hash[:2], hash)
+                sources[_locale_name(file_name)] = (_locale_name(file_name),
+                        file_name.endswith(".json"), None, path)
+                break
+    return sources
+
+def parse_locales(sources, executor=None):
+    """
+    Parses the given sources, with executor (a concurrent.futures executor)
+    if it's given, or in this process.  Returns a dict of locale -> list of
+    (key, value).
+    """
+    sources = list(sources)
+    if executor is None or len(sources) < MIN_PARALLEL_FILES:
+        return dict(_parse_locale(source) for source in sources)
+    return dict(executor.map(_parse_locale, sources))
+
+def build_table(locales, pool):
+    """
+    Builds the columnar table for the given parsed locales (from
+    parse_locales), interning every key and value in pool.
+
+    Returns a dict with "locales" (the sorted locale names), "keys" (the
+    sorted union of every locale's keys), and "values", a dict of locale ->
+    list of values lined up with "keys" (None where a locale lacks a key).
+    """
+    keys = set()
+    for entries in locales.values():
+        keys.update(key for key, _ in entries)
+    keys = [pool.intern(key) for key in sorted(keys)]
+    positions = dict((key, i) for i, key in enumerate(keys))
+
+    values = {}
+    for locale in sorted(locales):
+        column = [None] * len(keys)
+        for key, value in locales[locale]:
+            column[positions[key]] = pool.intern(value)
+        values[pool.intern(locale)] = column
+
+    return {
+        "locales": sorted(values),
+        "keys": keys,
+        "values": values
+    }
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+A sampling profiler, for munch's --profile-sample option.
+
+Rather than tracing every call (as cProfile does, which slows Burger down
+several times over and mostly measures its own overhead in hot loops like
+walk_method and packetinstructions), a timer interrupts the process every
+few milliseconds of CPU time with SIGPROF, and the signal handler notes the
+stack it interrupted.  The count of each stack is then roughly proportional
+to the time spent in it.
+
+Frames are labelled to make the result easier to read:
+
+    topping:packets
+        A topping's act method (so every sample is under the topping that
+        was running).
+    callback:EntityContext.on_invoke
+        A WalkerCallback method called by walk_method, so that time spent
+        evaluating a method is attributed to whichever callback handled it.
+
+The samples are written either as collapsed stacks (one "frame;frame;...
+count" line per stack, as read by flamegraph.pl and most flame graph tools)
+or as a speedscope (https://www.speedscope.app) file.
+
+Only the main thread is sampled, and only on platforms with setitimer
+(not Windows).  Jars processed by an executor in other processes aren't
+sampled.
+"""
+
+import os
+import signal
+
+from collections import Counter
+
+import six
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from burger.util import walk_method
+
+# Seconds of CPU time between samples
+DEFAULT_INTERVAL = 0.005
+
+_TOPPINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "toppings")
+
+class SamplingProfiler(object):
+    """
+    Samples the main thread's stack while started.  Can also be used as a
+    context manager.
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        if not hasattr(signal, "setitimer"):
+            raise ValueError("Sampling isn't supported on this platform")
+        self.interval = interval
+        # Stack (a tuple of frame keys, outermost first) -> samples
+        self.samples = Counter()
+        self._previous_handler = None
+
+    def start(self):
+        self._previous_handler = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self._previous_handler or signal.SIG_DFL)
+        self._previous_handler = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _sample(self, signum, frame):
+        # Kept cheap: only code objects are noted, and labelled later
+        stack = []
+        walk_code = walk_method.__code__
+        while frame is not None:
+            code = frame.f_code
+            if frame.f_back is not None and frame.f_back.f_code is walk_code \
+                    and "self" in frame.f_locals:
+                stack.append((code, type(frame.f_locals["self"]).__name__))
+            else:
+                stack.append(code)
+            frame = frame.f_back
+        stack.reverse()
+        self.samples[tuple(stack)] += 1
+
+    def stacks(self):
+        """
+        Gets a list of (list of frame labels, outermost first, samples) for
+        each distinct stack that was sampled.
+        """
+        labels = {}
+        result = []
+        for stack, count in six.iteritems(self.samples):
+            names = []
+            for key in stack:
+                if key not in labels:
+                    labels[key] = _label(key)
+                names.append(labels[key])
+            result.append((names, count))
+        result.sort(key=lambda entry: entry[0])
+        return result
+
+    def write_collapsed(self, fout):
+        """Writes the samples as collapsed stacks."""
+        for names, count in self.stacks():
+            fout.write("%s %d\n" % (";".join(name.replace(";", ":") for name in names), count))
+
+    def write_speedscope(self, fout, name="burger"):
+        """Writes the samples as a speedscope file, weighted in seconds."""
+        frames = []
+        frame_indexes = {}
+        samples = []
+        weights = []
+        for names, count in self.stacks():
+            sample = []
+            for label in names:
+                if label not in frame_indexes:
+                    frame_indexes[label] = len(frames)
+                    frames.append({"name": label})
+                sample.append(frame_indexes[label])
+            samples.append(sample)
+            weights.append(count * self.interval)
+
+        json.dump({
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights
+            }],
+            "name": name,
+            "exporter": "burger"
+        }, fout)
+
+    def write(self, path):
+        """
+        Writes the samples to path: as a speedscope file if it ends with
+        ".json", and as collapsed stacks otherwise.
+        """
+        with open(path, "w") as fout:
+            if path.endswith(".json"):
+                self.write_speedscope(fout, os.path.basename(path))
+            else:
+                self.write_collapsed(fout)
+
+def _label(key):
+    """Gets the label of a frame key noted by SamplingProfiler._sample."""
+    if isinstance(key, tuple):
+        code, class_name = key
+        return "callback:%s.%s" % (class_name, code.co_name)
+
+    path = os.path.abspath(key.co_filename)
+    if key.co_name == "act" and os.path.dirname(path) == _TOPPINGS_DIR:
+        return "topping:" + os.path.splitext(os.path.basename(path))[0]
+    return "%s (%s:%d)" % (key.co_name, os.path.basename(path), key.co_firstlineno)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+A registry of the available toppings, read from their source without
+importing them.
+
+Each module in burger/toppings is parsed (not run) to find its Topping
+subclass, along with that class's docstring and its PROVIDES and DEPENDS
+lists, which must be literals.  That's enough to list toppings and to work
+out which ones need to run; only those are then imported, with
+ToppingInfo.load.
+"""
+
+import ast
+import importlib
+import os
+
+TOPPINGS_DIR = os.path.join(os.path.dirname(__file__), "toppings")
+
+class ToppingInfo(object):
+    """What's known about a topping without importing it."""
+
+    def __init__(self, name, class_name, provides, depends, doc):
+        self.name = name
+        self.class_name = class_name
+        self.PROVIDES = provides
+        self.DEPENDS = depends
+        self.__doc__ = doc
+        self._topping = None
+
+    @property
+    def module(self):
+        return "burger.toppings." + self.name
+
+    def load(self):
+        """Imports the topping, returning its class."""
+        if self._topping is None:
+            module = importlib.import_module(self.module)
+            self._topping = getattr(module, self.class_name)
+        return self._topping
+
+    def __repr__(self):
+        return "<ToppingInfo %s.%s>" % (self.module, self.class_name)
+
+def _read_topping(name, path):
+    """Gets the ToppingInfo for the topping module at path, or None."""
+    with open(path, "rb") as fin:
+        tree = ast.parse(fin.read(), path)
+
+    found = []
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+        bases = [getattr(base, "id", getattr(base, "attr", None)) for base in node.bases]
+        if "Topping" in bases:
+            found.append(node)
+
+    if len(found) == 0:
+        print("Topping '%s' contains no topping" % name)
+        return None
+    elif len(found) >= 2:
+        print("Topping '%s' contains more than one topping" % name)
+        return None
+
+    node = found[0]
+    attributes = {}
+    for statement in node.body:
+        if isinstance(statement, ast.Assign) and len(statement.targets) == 1:
+            target = statement.targets[0]
+            if isinstance(target, ast.Name) and target.id in ("PROVIDES", "DEPENDS"):
+                attributes[target.id] = ast.literal_eval(statement.value)
+
+    return ToppingInfo(name, node.name, attributes.get("PROVIDES", []),
+            attributes.get("DEPENDS", []), ast.get_docstring(node, clean=False))
+
+_registry = None
+
+def get_registry():
+    """
+    Gets a dict of topping name (the name of its module) -> ToppingInfo for
+    every available topping.  The toppings directory is only read once.
+    """
+    global _registry
+    if _registry is None:
+        registry = {}
+        for file_ in sorted(os.listdir(TOPPINGS_DIR)):
+            if not file_.endswith(".py"):
+                continue
+            elif file_.startswith("__"):
+                continue
+            elif file_ == "topping.py":
+                continue
+
+            name = file_[:-3]
+            info = _read_topping(name, os.path.join(TOPPINGS_DIR, file_))
+            if info is not None:
+                registry[name] = info
+        _registry = registry
+    return dict(_registry)
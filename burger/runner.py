@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Loading toppings, ordering them by their dependencies, and running them on
+jars.  This is what munch does for each jar, kept separate from munch's
+option handling so that it can also be used by the server (see
+burger/server.py) and by other programs, through run and iter_run:
+
+    >>> import burger
+    >>> for aggregate in burger.iter_run(["1.13.2.jar", "1.14.jar"], toppings=["packets"]):
+    ...     print(aggregate["version"]["id"], len(aggregate["packets"]["packet"]))
+"""
+
+import os
+import time
+import traceback
+
+from contextlib import contextmanager
+
+import six
+
+from jawa.transforms import simple_swap, expand_constants
+
+from burger.cache import get_cache_dir, set_cache_dir
+from burger.classreader import LazyClassFile
+from burger.registry import get_registry
+from burger.roundedfloats import transform_floats
+from burger.strings import StringPool, intern_strings
+from burger.toppingcache import ToppingCache
+from burger.tracing import AccessStats, AccountingClassLoader, forget_jar
+from burger.transaction import new_aggregate
+
+def resolve_toppings(all_toppings, names=None):
+    """
+    Gets the toppings to run, in the order to run them: the toppings with the
+    given names (or all of them if names is None), and the toppings they
+    depend on.  Raises ValueError if a dependency can't be met.
+
+    all_toppings can be a dict of either topping classes or ToppingInfo (as
+    from get_registry), and the result has the same type.
+    """
+    # Get the toppings we want
+    if names is None:
+        loaded_toppings = all_toppings.values()
+    else:
+        loaded_toppings = []
+        for topping in names:
+            if topping not in all_toppings:
+                print("Topping '%s' doesn't exist" % topping)
+            else:
+                loaded_toppings.append(all_toppings[topping])
+
+    class DependencyNode:
+        def  __init__(self, topping):
+            self.topping = topping
+            self.provides = topping.PROVIDES
+            self.depends = topping.DEPENDS
+            self.childs = []
+
+        def __repr__(self):
+            return str(self.topping)
+
+    # Order topping execution by building dependency tree
+    topping_nodes = []
+    topping_provides = {}
+    for topping in loaded_toppings:
+        topping_node = DependencyNode(topping)
+        topping_nodes.append(topping_node)
+        for provides in topping_node.provides:
+            topping_provides[provides] = topping_node
+
+    # Include missing dependencies
+    for topping in topping_nodes:
+        for dependency in topping.depends:
+            if not dependency in topping_provides:
+                for other_topping in all_toppings.values():
+                    if dependency in other_topping.PROVIDES:
+                        topping_node = DependencyNode(other_topping)
+                        topping_nodes.append(topping_node)
+                        for provides in topping_node.provides:
+                            topping_provides[provides] = topping_node
+
+    # Find dependency childs
+    for topping in topping_nodes:
+        for dependency in topping.depends:
+            if not dependency in topping_provides:
+                raise ValueError("(%s) requires (%s)" % (topping, dependency))
+            if not topping_provides[dependency] in topping.childs:
+                topping.childs.append(topping_provides[dependency])
+
+    # Run leaves first
+    to_be_run = []
+    while len(topping_nodes) > 0:
+        stuck = True
+        for topping in topping_nodes:
+            if len(topping.childs) == 0:
+                stuck = False
+                for parent in topping_nodes:
+                    if topping in parent.childs:
+                        parent.childs.remove(topping)
+                to_be_run.append(topping.topping)
+                topping_nodes.remove(topping)
+        if stuck:
+            raise ValueError("Can't resolve dependencies")
+
+    return to_be_run
+
+def open_jar(path):
+    """Creates the classloader toppings are run with for the given jar."""
+    return AccountingClassLoader(path, max_cache=0, klass=LazyClassFile, bytecode_transforms=[simple_swap, expand_constants])
+
+def close_jar(classloader):
+    """
+    Drops everything kept for a classloader from open_jar (parsed classes,
+    and indexes like the class hierarchy), and closes its jar.  It can't be
+    used afterwards.
+    """
+    forget_jar(classloader)
+    classloader.class_cache.clear()
+    for source in set(classloader.path_map.values()):
+        if hasattr(source, "close"):
+            source.close()
+
+def new_jar_aggregate(path, classloader):
+    """Creates the aggregate for a jar, with only its "source" filled in."""
+    names = classloader.path_map.keys()
+    num_classes = sum(1 for name in names if name.endswith(".class"))
+
+    return new_aggregate({
+        "source": {
+            "file": path,
+            "classes": num_classes,
+            "other": len(names),
+            "size": os.path.getsize(path)
+        }
+    })
+
+def process_jar(path, to_be_run, verbose=False, classloader=None, timings=None,
+        cache_toppings=False):
+    """
+    Runs the given toppings (in order, as from resolve_toppings) on a jar,
+    and returns the aggregate.  A classloader from open_jar can be given to
+    reuse one that's already been used for the same jar.
+
+    If timings is given, a tuple of (topping, seconds taken, whether it
+    succeeded, AccessStats of what it read from the jar) is added to it for
+    each topping that was run.  Reading is only counted if classloader is an
+    AccountingClassLoader, as from open_jar.
+
+    If cache_toppings is true, toppings' results are reused when the
+    entries and aggregate keys they read are unchanged since a previous run
+    (see burger/toppingcache.py).
+    """
+    if classloader is None:
+        classloader = open_jar(path)
+    cache = ToppingCache() if cache_toppings else None
+    aggregate = new_jar_aggregate(path, classloader)
+
+    available = []
+    for topping in to_be_run:
+        missing = [dep for dep in topping.DEPENDS if dep not in available]
+        if len(missing) != 0:
+            if verbose:
+                print("Dependencies failed for %s: Missing %s" % (topping, missing))
+            continue
+
+        seconds, succeeded, stats, _ = run_topping(topping, aggregate, classloader, verbose, cache)
+        if succeeded:
+            available.extend(topping.PROVIDES)
+        if timings is not None:
+            timings.append((topping, seconds, succeeded, stats))
+
+    return aggregate
+
+def run_topping(topping, aggregate, classloader, verbose=False, cache=None):
+    """
+    Runs one topping on an aggregate (from process_jar), undoing its changes
+    if it fails.  If cache is a ToppingCache, a stored result is reused if
+    there is one for the same inputs.
+
+    Returns a tuple of (seconds taken, whether it succeeded, AccessStats of
+    what it read from the jar, the set of keys of the aggregate it changed).
+    """
+    journal = aggregate.journal
+    stats = AccessStats()
+    if isinstance(classloader, AccountingClassLoader):
+        classloader.stats = stats
+    start = time.time()
+    succeeded = False
+    changed = set()
+    journal.begin()
+    if cache is not None and topping.CACHE:
+        output = cache.lookup(topping, classloader, aggregate)
+        if output is not None:
+            cache.apply(aggregate, output)
+            changed = journal.commit()
+            if isinstance(classloader, AccountingClassLoader):
+                classloader.stats = None
+            return time.time() - start, True, stats, changed
+        trace, topping_classloader = cache.trace(classloader, aggregate)
+    else:
+        topping_classloader = classloader
+    try:
+        topping.act(aggregate, topping_classloader, verbose)
+        if cache is not None and topping.CACHE:
+            cache.store(topping, trace, classloader, aggregate, journal.changed_keys())
+        changed = journal.commit()
+        succeeded = True
+    except:
+        journal.rollback() # If the topping failed, don't leave things in an incomplete state
+        if verbose:
+            print("Failed to run %s" % topping)
+            traceback.print_exc()
+    aggregate.observe(None)
+    if isinstance(classloader, AccountingClassLoader):
+        classloader.stats = None
+    return time.time() - start, succeeded, stats, changed
+
+@contextmanager
+def using_string_pool(to_be_run, pool):
+    """
+    Has the toppings that intern strings as they run (those with a
+    STRING_POOL, such as language) intern them in pool within the with
+    block, rather than in the process-wide pool.
+    """
+    toppings = [topping for topping in to_be_run if hasattr(topping, "STRING_POOL")]
+    for topping in toppings:
+        topping.STRING_POOL = pool
+    try:
+        yield
+    finally:
+        for topping in toppings:
+            topping.STRING_POOL = None
+
+def run_options(to_be_run):
+    """
+    Gets the settings the given toppings are run with, which are kept in
+    class attributes and module globals: each topping's options (see
+    Topping.options) and the cache directory.  Processes that weren't
+    forked from this one (e.g. with the spawn start method, the default on
+    macOS and Windows) don't see changes made to those here, so they're
+    sent along with the jars and applied with apply_run_options.
+    """
+    return {
+        "cache_dir": get_cache_dir(),
+        "toppings": [topping.options() for topping in to_be_run]
+    }
+
+def apply_run_options(to_be_run, options):
+    """Applies settings from run_options, e.g. in another process."""
+    set_cache_dir(options["cache_dir"])
+    for topping, topping_options in zip(to_be_run, options["toppings"]):
+        for name, value in six.iteritems(topping_options):
+            setattr(topping, name, value)
+
+def _run_jar(path, to_be_run, verbose, cache_toppings, options=None, pool=None):
+    """
+    process_jar, also returning the timings; run by executors, with the
+    settings from run_options.  Toppings intern strings in pool, or in a
+    pool of their own for just this jar if None.
+    """
+    if options is not None:
+        apply_run_options(to_be_run, options)
+    if pool is None:
+        pool = StringPool()
+    timings = []
+    with using_string_pool(to_be_run, pool):
+        aggregate = process_jar(path, to_be_run, verbose, timings=timings,
+                cache_toppings=cache_toppings)
+    return aggregate, timings
+
+def iter_run(jars, toppings=None, verbose=False, executor=None, on_jar=None, on_topping=None,
+        cache_toppings=False, on_access=None, scheduler=None):
+    """
+    Runs toppings on each of the given jars, yielding each jar's aggregate
+    in the same order as the jars, as soon as it's done.
+
+    toppings: The names of the toppings to run (as in munch's --toppings),
+              along with the toppings they depend on; all of them if None.
+    executor: A concurrent.futures executor to process the jars with, e.g. a
+              ProcessPoolExecutor to process several at once.  Toppings keep
+              state while running, so an executor should use processes,
+              not threads.  The toppings' options and the cache directory
+              are sent to each worker (see run_options), so any start
+              method works.  Jars are processed one at a time if None.
+    scheduler: A Scheduler (see burger/scheduler.py) to spread each
+               topping on each jar over its worker processes, instead of
+               executor.
+    on_topping: Called with (jar, topping, seconds taken, whether it
+                succeeded) for each topping run on each jar.
+    on_jar: Called with (jar, aggregate) for each jar once it's done.
+    on_access: Called with (jar, topping, AccessStats) for each topping run
+               on each jar, with what it read from the jar.
+    cache_toppings: Whether to reuse toppings' results when their inputs are
+                    unchanged (see burger/toppingcache.py).
+
+    Strings in the aggregates are interned in a StringPool for this call,
+    so that the aggregates share them with each other, and nothing is kept
+    once they are no longer used.
+
+    Raises ValueError (straight away, not when iterated) if the toppings'
+    dependencies can't be met.
+    """
+    jars = list(jars)
+    # Only the toppings that will run are imported
+    to_be_run = [info.load() for info in resolve_toppings(get_registry(), toppings)]
+    pool = StringPool()
+
+    def results():
+        if scheduler is not None:
+            for _, aggregate, timings in scheduler.run(jars, to_be_run, verbose, cache_toppings):
+                yield aggregate, timings
+        elif executor is None:
+            for path in jars:
+                yield _run_jar(path, to_be_run, verbose, cache_toppings, pool=pool)
+        else:
+            options = run_options(to_be_run)
+            futures = [executor.submit(_run_jar, path, to_be_run, verbose, cache_toppings, options)
+                    for path in jars]
+            for future in futures:
+                yield future.result()
+
+    def aggregates():
+        for path, (aggregate, timings) in zip(jars, results()):
+            if on_topping is not None:
+                for topping, seconds, succeeded, _ in timings:
+                    on_topping(path, topping, seconds, succeeded)
+            if on_access is not None:
+                for topping, _, _, stats in timings:
+                    on_access(path, topping, stats)
+            # Share strings with the aggregates of the other jars
+            aggregate = transform_floats(intern_strings(aggregate, pool))
+            if on_jar is not None:
+                on_jar(path, aggregate)
+            yield aggregate
+
+    return aggregates()
+
+def run(jars, toppings=None, verbose=False, executor=None, on_jar=None, on_topping=None,
+        cache_toppings=False, on_access=None, scheduler=None):
+    """Like iter_run, but returns a list of every jar's aggregate."""
+    return list(iter_run(jars, toppings, verbose, executor, on_jar, on_topping,
+            cache_toppings, on_access, scheduler))
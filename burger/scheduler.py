@@ -0,0 +1,440 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Running toppings on many jars over several worker processes, with each
+(jar, topping) pair as a separate task, so that one slow topping on one jar
+doesn't leave the other workers idle.
+
+Each worker keeps the classloaders of the jars it has worked on (and so
+their parsed classes, class hierarchy and so on; see WarmClassLoaders), and
+its own copy of each of those jars' aggregates.  When a task is done, the
+keys of the aggregate it changed are sent back to the scheduler, which
+sends them on to any other worker before it next runs a task on that jar.
+
+A task is ready once the toppings it depends on have run on its jar.  An
+idle worker is given, in order of preference:
+
+    - a ready task of a jar it already has open
+    - the first task of a jar no worker has started
+    - a ready task of a jar another worker has open (stealing it, at the
+      cost of opening the jar again)
+
+Toppings only run at the same time on the same jar if they don't write to
+the same keys of the aggregate.  Which keys a topping writes is guessed
+from its PROVIDES ("identify.*" toppings write to "classes", others to the
+key named by the first part), and learned from what it actually changes.
+When two tasks that ran at the same time turn out to have changed the same
+key, the later topping (in run order) should have seen the earlier one's
+changes, so its output is discarded and it is run again, along with any
+task that depends on it.  Toppings are assumed to only read the keys of the
+toppings they depend on.
+
+The scheduler keeps counts of what each worker did, and how much of the
+time it was busy, for report.
+"""
+
+import multiprocessing
+import time
+import traceback
+
+from six.moves import queue
+
+from burger.runner import apply_run_options, new_jar_aggregate, run_options, run_topping, using_string_pool
+from burger.server import WarmClassLoaders
+from burger.strings import StringPool
+from burger.toppingcache import ToppingCache
+
+# How many jars' classloaders each worker keeps
+MAX_WARM_JARS = 4
+
+# Seconds to wait for a result before checking that the workers are alive
+POLL_SECONDS = 1
+
+# Seconds to wait for workers to stop when a run ends early, before
+# terminating them
+SHUTDOWN_SECONDS = 5
+
+def _guess_writes(topping):
+    """Guesses the keys of the aggregate topping writes to from PROVIDES."""
+    writes = set()
+    for provides in topping.PROVIDES:
+        key = provides.split(".")[0]
+        writes.add("classes" if key == "identify" else key)
+    return writes
+
+def _worker(worker_id, to_be_run, verbose, cache_toppings, options, tasks, results):
+    """
+    The loop of a worker process, run with the settings from run_options.
+    Messages are ("task", jar number, path, topping index, changes to apply
+    first), ("drop", jar number) to forget a jar's aggregate, and None to
+    stop.  Jars are numbered rather than going by path, as the same jar may
+    be given more than once.
+    """
+    apply_run_options(to_be_run, options)
+    classloaders = WarmClassLoaders(MAX_WARM_JARS)
+    cache = ToppingCache() if cache_toppings else None
+    aggregates = {}
+
+    # Strings are interned again by iter_run, in the run's own pool
+    with using_string_pool(to_be_run, StringPool()):
+        while True:
+            message = tasks.get()
+            if message is None:
+                break
+            if message[0] == "drop":
+                aggregates.pop(message[1], None)
+                continue
+
+            _, number, path, index, changes = message
+            start = time.time()
+            result = {"worker": worker_id, "jar": number, "index": index, "source": None}
+            try:
+                classloader = classloaders.get(path)
+                aggregate = aggregates.get(number)
+                if aggregate is None:
+                    aggregate = aggregates[number] = new_jar_aggregate(path, classloader)
+                    result["source"] = dict.get(aggregate, "source")
+
+                journal = aggregate.journal
+                journal.begin()
+                for output in changes:
+                    ToppingCache.apply(aggregate, output)
+                journal.commit()
+
+                seconds, succeeded, stats, changed = run_topping(to_be_run[index], aggregate,
+                        classloader, verbose, cache)
+                result.update({
+                    "seconds": seconds,
+                    "succeeded": succeeded,
+                    "stats": stats,
+                    "output": [(key, dict.__contains__(aggregate, key), dict.get(aggregate, key))
+                            for key in sorted(changed, key=repr)]
+                })
+            except Exception:
+                result["error"] = traceback.format_exc()
+            result["busy"] = time.time() - start
+            results.put(result)
+
+class _Jar(object):
+    """The scheduler's state for one jar."""
+
+    def __init__(self, number, path, count):
+        self.number = number
+        self.path = path
+        self.source = None
+        # Indexes of tasks that haven't started
+        self.pending = set(range(count))
+        # Index -> (worker, indexes of the tasks whose changes it had)
+        self.running = {}
+        # Index -> changes made (a list as for ToppingCache.apply), for
+        # tasks that are done
+        self.done = {}
+        # Index -> worker that ran it, for tasks that are done
+        self.ran_by = {}
+        # Indexes of running tasks whose output will be discarded
+        self.discard = set()
+        # What the toppings that succeeded provide
+        self.available = set()
+        # Index -> (topping, seconds, succeeded, AccessStats)
+        self.timings = {}
+
+    @property
+    def started(self):
+        return len(self.running) != 0 or len(self.done) != 0
+
+    @property
+    def finished(self):
+        return len(self.pending) == 0 and len(self.running) == 0
+
+class WorkerStats(object):
+    """What one worker did."""
+
+    def __init__(self):
+        self.tasks = 0
+        # Tasks of jars that another worker had open
+        self.stolen = 0
+        # Jars opened
+        self.jars = 0
+        # Tasks that had to be run again
+        self.retried = 0
+        self.busy_seconds = 0.0
+
+class Scheduler(object):
+    """
+    Runs toppings on jars over a number of worker processes (one per CPU by
+    default).  Used through iter_run's scheduler argument, or run directly.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.worker_stats = []
+        self.wall_seconds = 0.0
+
+    def run(self, jars, to_be_run, verbose=False, cache_toppings=False):
+        """
+        Runs the given toppings (in order, as from resolve_toppings) on each
+        jar, yielding a tuple of (jar, aggregate, timings as from
+        process_jar) for each, in the same order as the jars.
+        """
+        jars = [_Jar(number, path, len(to_be_run)) for number, path in enumerate(jars)]
+        self._to_be_run = to_be_run
+        self._verbose = verbose
+        self._writes = [_guess_writes(topping) for topping in to_be_run]
+        self._providers = [set(j for j, other in enumerate(to_be_run)
+                if set(other.PROVIDES) & set(topping.DEPENDS))
+                for topping in to_be_run]
+        self.worker_stats = [WorkerStats() for _ in range(self.workers)]
+        # For each worker, jar number -> indexes of the tasks whose changes its
+        # copy of the aggregate has
+        self._applied = [{} for _ in range(self.workers)]
+
+        results = multiprocessing.Queue()
+        task_queues = self._task_queues = [multiprocessing.Queue() for _ in range(self.workers)]
+        options = run_options(to_be_run)
+        processes = [multiprocessing.Process(target=_worker, args=(i, to_be_run, verbose,
+                cache_toppings, options, task_queues[i], results)) for i in range(self.workers)]
+        # Workers aren't daemonic, so that what they run can start processes
+        # of its own (daemonic processes can't); they're always stopped below
+        for process in processes:
+            process.start()
+
+        start = time.time()
+        completed = False
+        try:
+            idle = list(range(self.workers))
+            next_jar = 0
+            while next_jar < len(jars):
+                # Give out every task that can be run
+                for worker in list(idle):
+                    task = self._next_task(worker, jars)
+                    if task is not None:
+                        jar, index = task
+                        task_queues[worker].put(("task", jar.number, jar.path, index,
+                                self._changes_for(worker, jar)))
+                        idle.remove(worker)
+
+                while next_jar < len(jars) and jars[next_jar].finished:
+                    jar = jars[next_jar]
+                    for worker in range(self.workers):
+                        if self._applied[worker].pop(jar.number, None) is not None:
+                            task_queues[worker].put(("drop", jar.number))
+                    yield jar.path, self._aggregate(jar), [jar.timings[i]
+                            for i in sorted(jar.timings)]
+                    next_jar += 1
+                if next_jar == len(jars):
+                    break
+                if len(idle) == self.workers:
+                    raise ValueError("No task of %s can be run" % jars[next_jar].path)
+
+                try:
+                    result = results.get(timeout=POLL_SECONDS)
+                except queue.Empty:
+                    if not all(process.is_alive() for process in processes):
+                        raise ValueError("A worker process exited unexpectedly")
+                    continue
+                idle.append(result["worker"])
+                self._finish(result, jars)
+            completed = True
+        finally:
+            self.wall_seconds = time.time() - start
+            for task_queue in task_queues:
+                task_queue.put(None)
+            for process in processes:
+                # After an error, workers may still be busy with a task
+                process.join(None if completed else SHUTDOWN_SECONDS)
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+
+    def _ready(self, jar, index):
+        """Whether a pending task can be started now."""
+        if not self._providers[index] <= set(jar.done):
+            return False
+        writes = self._writes[index]
+        for other in range(index):
+            if other not in jar.done and writes & self._writes[other]:
+                return False
+        for other in jar.running:
+            if writes & self._writes[other]:
+                return False
+        return True
+
+    def _ready_tasks(self, jar):
+        """Gets the indexes of the ready tasks of a jar, skipping any whose
+        dependencies failed."""
+        ready = []
+        for index in sorted(jar.pending):
+            if not self._ready(jar, index):
+                continue
+            topping = self._to_be_run[index]
+            missing = [dep for dep in topping.DEPENDS if dep not in jar.available]
+            if len(missing) != 0:
+                if self._verbose:
+                    print("Dependencies failed for %s: Missing %s" % (topping, missing))
+                jar.pending.remove(index)
+                jar.done[index] = []
+                # That may make later tasks ready
+                return self._ready_tasks(jar)
+            ready.append(index)
+        return ready
+
+    def _next_task(self, worker, jars):
+        """Picks the (jar, index) of the task worker should run next, or None."""
+        started = [jar for jar in jars if jar.started and not jar.finished]
+
+        # A jar the worker already has open
+        for jar in started:
+            if jar.number in self._applied[worker]:
+                ready = self._ready_tasks(jar)
+                if len(ready) != 0:
+                    return self._start(worker, jar, ready[0])
+
+        # A jar no one has started
+        for jar in jars:
+            if not jar.started and not jar.finished:
+                ready = self._ready_tasks(jar)
+                if len(ready) != 0:
+                    return self._start(worker, jar, ready[0])
+
+        # Stealing from the jar with the most to do
+        candidates = [(len(self._ready_tasks(jar)), i) for i, jar in enumerate(started)]
+        candidates = [candidate for candidate in candidates if candidate[0] != 0]
+        if len(candidates) != 0:
+            jar = started[max(candidates)[1]]
+            self.worker_stats[worker].stolen += 1
+            return self._start(worker, jar, self._ready_tasks(jar)[0])
+        return None
+
+    def _start(self, worker, jar, index):
+        if jar.number not in self._applied[worker]:
+            self._applied[worker][jar.number] = set()
+            self.worker_stats[worker].jars += 1
+        jar.pending.remove(index)
+        jar.running[index] = (worker, set(jar.done))
+        self.worker_stats[worker].tasks += 1
+        return jar, index
+
+    def _changes_for(self, worker, jar):
+        """Gets the changes worker's copy of jar doesn't have yet, and notes
+        that it will."""
+        applied = self._applied[worker][jar.number]
+        missing = sorted(set(jar.done) - applied)
+        applied.update(missing)
+        return [jar.done[index] for index in missing]
+
+    def _finish(self, result, jars):
+        """Takes in the result of a task."""
+        jar = jars[result["jar"]]
+        index = result["index"]
+        worker = result["worker"]
+        stats = self.worker_stats[worker]
+        stats.busy_seconds += result["busy"]
+        if "error" in result:
+            raise ValueError("Failed to process %s:\n%s" % (jar.path, result["error"]))
+
+        if result["source"] is not None:
+            jar.source = result["source"]
+        _, had = jar.running.pop(index)
+        changed = set(key for key, _, _ in result["output"])
+        self._writes[index] |= changed
+
+        if index in jar.discard:
+            # Something it depends on is being run again
+            jar.discard.remove(index)
+            self._retry(jar, index, worker)
+            return
+
+        # Tasks that ran at the same time and changed the same keys
+        clashes = [other for other in set(jar.done) - had
+                if changed & set(key for key, _, _ in jar.done[other])]
+        if any(other < index for other in clashes):
+            # It should have seen the earlier topping's changes
+            self._retry(jar, index, worker)
+            return
+
+        applied = self._applied[worker].get(jar.number)
+        if applied is not None:
+            applied.add(index)
+        jar.done[index] = result["output"]
+        jar.ran_by[index] = worker
+        topping = self._to_be_run[index]
+        if result["succeeded"]:
+            jar.available.update(topping.PROVIDES)
+        jar.timings[index] = (topping, result["seconds"], result["succeeded"], result["stats"])
+
+        # Later toppings that didn't see these changes
+        for other in clashes:
+            self._rerun(jar, other)
+
+    def _retry(self, jar, index, worker):
+        """Discards the result of a task that just finished, to run it again."""
+        self.worker_stats[worker].retried += 1
+        jar.pending.add(index)
+        # The worker's copy has the discarded changes
+        self._forget(jar, worker)
+
+    def _rerun(self, jar, index):
+        """
+        Discards the output of a task that's done or running, and of those
+        that depend on it, so that they're run again.
+        """
+        if index in jar.running:
+            jar.discard.add(index)
+        elif index in jar.done:
+            del jar.done[index]
+            jar.timings.pop(index, None)
+            worker = jar.ran_by.pop(index, None)
+            if worker is not None:
+                self.worker_stats[worker].retried += 1
+            jar.pending.add(index)
+            # Copies of the aggregate with its changes start again from
+            # the scheduler's
+            for worker, applied in enumerate(self._applied):
+                if index in applied.get(jar.number, ()):
+                    self._forget(jar, worker)
+            jar.available = set()
+            for topping, _, succeeded, _ in jar.timings.values():
+                if succeeded:
+                    jar.available.update(topping.PROVIDES)
+        else:
+            return
+
+        for other, providers in enumerate(self._providers):
+            if index in providers:
+                self._rerun(jar, other)
+
+    def _forget(self, jar, worker):
+        """Has worker drop its copy of jar's aggregate."""
+        if self._applied[worker].pop(jar.number, None) is not None:
+            self._task_queues[worker].put(("drop", jar.number))
+
+    def _aggregate(self, jar):
+        """Puts together the final aggregate of a finished jar."""
+        aggregate = {"source": jar.source}
+        for index in sorted(jar.done):
+            for key, present, value in jar.done[index]:
+                if present:
+                    aggregate[key] = value
+                else:
+                    aggregate.pop(key, None)
+        return aggregate
+
+    def report(self):
+        """Formats a table of what each worker did in the last run."""
+        lines = ["%-8s %7s %7s %7s %7s %9s %7s" % ("worker", "tasks", "stolen", "jars",
+                "retried", "busy s", "util")]
+        total = WorkerStats()
+        for i, stats in enumerate(self.worker_stats):
+            lines.append("%-8s %7d %7d %7d %7d %9.3f %6.1f%%" % (i, stats.tasks, stats.stolen,
+                    stats.jars, stats.retried, stats.busy_seconds,
+                    _percent(stats.busy_seconds, self.wall_seconds)))
+            for name, value in vars(stats).items():
+                setattr(total, name, getattr(total, name) + value)
+        lines.append("%-8s %7d %7d %7d %7d %9.3f %6.1f%%" % ("total", total.tasks, total.stolen,
+                total.jars, total.retried, total.busy_seconds,
+                _percent(total.busy_seconds, self.wall_seconds * max(len(self.worker_stats), 1))))
+        lines.append("%.3f seconds with %d workers" % (self.wall_seconds, len(self.worker_stats)))
+        return "\n".join(lines)
+
+def _percent(part, whole):
+    return 100.0 * part / whole if whole else 0.0
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+A long-running server that runs toppings on jars on request, started with
+munch's --serve option.
+
+Toppings are imported once, and the classloaders of recently used jars are
+kept, along with everything cached for them (parsed classes, the class
+hierarchy, the tag index and so on), so that a request for a jar that's
+already been seen doesn't start from nothing.  When a jar's classloader is
+dropped, so is everything cached for it, and each request interns language
+strings in a StringPool of its own, so that memory doesn't grow with every
+jar that's ever been analyzed.
+
+The server speaks HTTP on a local address:
+
+    GET /toppings
+        The names of the available toppings, as a JSON list.
+    POST /analyze
+        Runs toppings on jars.  The body is a JSON dict of "jars" (a list of
+        paths, on the server's machine) and optionally "toppings" (a list of
+        topping names; all of them if not given).  The response is a line
+        of JSON for each jar, written as soon as that jar is done: either
+        {"jar": path, "aggregate": aggregate} or {"jar": path, "error":
+        message}.
+
+Requests are handled one at a time, as toppings aren't safe to run on
+several jars at once.
+"""
+
+import os
+import threading
+import traceback
+
+from collections import OrderedDict
+
+import six
+from six.moves import BaseHTTPServer, socketserver
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from burger.roundedfloats import transform_floats
+from burger.registry import get_registry
+from burger.runner import resolve_toppings, open_jar, close_jar, process_jar, using_string_pool
+from burger.strings import StringPool
+
+# How many jars' classloaders are kept
+MAX_WARM_JARS = 4
+
+class WarmClassLoaders(object):
+    """
+    The classloaders of the most recently used jars.  A jar that's changed
+    on disk since its classloader was created gets a new one.
+    """
+
+    def __init__(self, max_jars=MAX_WARM_JARS):
+        self.max_jars = max_jars
+        # Path -> ((mtime, size), classloader), least recently used first
+        self._loaders = OrderedDict()
+
+    def get(self, path):
+        path = os.path.realpath(path)
+        stat = os.stat(path)
+        key = (stat.st_mtime, stat.st_size)
+
+        entry = self._loaders.pop(path, None)
+        if entry is None or entry[0] != key:
+            if entry is not None:
+                close_jar(entry[1])
+            entry = (key, open_jar(path))
+        self._loaders[path] = entry
+
+        while len(self._loaders) > self.max_jars:
+            close_jar(self._loaders.popitem(last=False)[1][1])
+        return entry[1]
+
+    def paths(self):
+        return list(self._loaders)
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def _send_json(self, code, value):
+        data = json.dumps(value).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/toppings":
+            self._send_json(200, sorted(self.server.all_toppings))
+        else:
+            self._send_json(404, {"error": "Unknown path " + self.path})
+
+    def do_POST(self):
+        if self.path != "/analyze":
+            self._send_json(404, {"error": "Unknown path " + self.path})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            job = json.loads(self.rfile.read(length).decode("utf-8"))
+            jars = job["jars"]
+            to_be_run = [info.load() for info in
+                    resolve_toppings(self.server.all_toppings, job.get("toppings"))]
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        # The response is streamed, one line per jar, so it has no length
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        self.close_connection = True
+
+        # Strings are interned per request, rather than in the process-wide
+        # pool
+        pool = StringPool()
+        for path in jars:
+            try:
+                with self.server.lock, using_string_pool(to_be_run, pool):
+                    classloader = self.server.classloaders.get(path)
+                    aggregate = process_jar(path, to_be_run, self.server.verbose, classloader)
+                result = {"jar": path, "aggregate": transform_floats(aggregate)}
+            except Exception as e:
+                if self.server.verbose:
+                    traceback.print_exc()
+                result = {"jar": path, "error": str(e)}
+            self.wfile.write(json.dumps(result).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+class BurgerServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, verbose=False, max_jars=MAX_WARM_JARS):
+        BaseHTTPServer.HTTPServer.__init__(self, address, _Handler)
+        self.verbose = verbose
+        self.all_toppings = get_registry()
+        # Import every topping now, rather than in the first request for it
+        for info in self.all_toppings.values():
+            info.load()
+        self.classloaders = WarmClassLoaders(max_jars)
+        self.lock = threading.Lock()
+
+def parse_address(address):
+    """Parses "host:port" or "port" (on localhost) into a (host, port) tuple."""
+    host, _, port = six.text_type(address).rpartition(":")
+    return (host or "127.0.0.1", int(port))
+
+def serve(address, verbose=False):
+    """Runs the server on the given (host, port) until interrupted."""
+    server = BurgerServer(address, verbose)
+    if verbose:
+        print("Serving on %s:%s" % server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
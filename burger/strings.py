@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Interning of strings that are repeated many times in the output.
+
+The same class names, ids, field names and language keys show up thousands
+of times across the aggregate, and again in the aggregate of every other
+version processed.  Interning them in a StringPool keeps one copy of each
+in memory, and the string table format writes each one out once.
+
+iter_run interns each call's aggregates in a pool of its own, which is
+dropped with them.  The process-wide pool here is only used by code that
+isn't given one, and is never emptied.
+"""
+
+import six
+
+class StringPool(object):
+    """
+    A table of distinct strings.  Interning a string returns the one copy of
+    it kept in the table, so that equal strings share memory; each string
+    also gets a number (its position in the table), which serializers can
+    use to refer to it.
+    """
+
+    def __init__(self):
+        # Number -> string, and the reverse
+        self.strings = []
+        self._numbers = {}
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __contains__(self, value):
+        return value in self._numbers
+
+    def __iter__(self):
+        return iter(self.strings)
+
+    def intern(self, value):
+        """Gets the pooled copy of value, adding it if needed."""
+        number = self._numbers.get(value)
+        if number is None:
+            number = self._numbers[value] = len(self.strings)
+            self.strings.append(value)
+        return self.strings[number]
+
+    def number(self, value):
+        """Gets the number of value in the table, adding it if needed."""
+        number = self._numbers.get(value)
+        if number is None:
+            number = self._numbers[value] = len(self.strings)
+            self.strings.append(value)
+        return number
+
+# The pool used when no other is given
+_pool = StringPool()
+
+def get_string_pool():
+    """Gets the process-wide StringPool."""
+    return _pool
+
+def intern(value):
+    """Interns a string in the process-wide pool."""
+    return _pool.intern(value)
+
+def intern_strings(value, pool=None):
+    """
+    Interns every string in value, including dictionary keys, replacing them
+    with their pooled copies in place (dictionaries keep their order).
+    Returns value, or the pooled copy if value is itself a string.  pool is
+    the process-wide pool if not given.
+
+    Running this over each aggregate means that equal strings in different
+    aggregates (e.g. for each version) are only kept in memory once.
+    """
+    if pool is None:
+        pool = _pool
+
+    if isinstance(value, six.string_types):
+        return pool.intern(value)
+    elif isinstance(value, dict):
+        items = list(six.iteritems(value))
+        value.clear()
+        for key, item in items:
+            if isinstance(key, six.string_types):
+                key = pool.intern(key)
+            value[key] = intern_strings(item, pool)
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            value[i] = intern_strings(item, pool)
+    elif isinstance(value, tuple):
+        value = tuple(intern_strings(item, pool) for item in value)
+    return value
+
+# Prefix of string values in the string table format, which distinguishes
+# them from numbers
+STRING_REF = "$"
+
+def to_string_table(value):
+    """
+    Converts a JSON-compatible value into the string table format, a dict of:
+
+    strings: A list of every distinct string (keys and values)
+    data: value, with each dict key replaced by the decimal position of the
+          key in strings, and each string value replaced by "$" followed by
+          its position
+
+    Each string is therefore only written out once, however many times it is
+    used.
+    """
+    pool = StringPool()
+
+    def convert(value):
+        if isinstance(value, six.string_types):
+            return STRING_REF + str(pool.number(value))
+        elif isinstance(value, dict):
+            return dict((str(pool.number(key)), convert(item))
+                    for key, item in six.iteritems(value))
+        elif isinstance(value, (list, tuple)):
+            return [convert(item) for item in value]
+        return value
+
+    data = convert(value)
+    return {
+        "strings": pool.strings,
+        "data": data
+    }
+
+def from_string_table(table):
+    """Converts a value in the string table format back to its original form."""
+    strings = table["strings"]
+
+    def convert(value):
+        if isinstance(value, six.string_types):
+            assert value.startswith(STRING_REF)
+            return strings[int(value[len(STRING_REF):])]
+        elif isinstance(value, dict):
+            return dict((strings[int(key)], convert(item))
+                    for key, item in six.iteritems(value))
+        elif isinstance(value, list):
+            return [convert(item) for item in value]
+        return value
+
+    return convert(table["data"])
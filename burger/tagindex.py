@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+A jar-wide index of tags (data/minecraft/tags/), with references to other
+tags already resolved.
+
+Each distinct entry (e.g. "minecraft:oak_log") is given a number, and the
+full contents of each tag, including the contents of the tags it
+references, are kept as a bitset of those numbers.  The contents are
+computed once, with referenced tags always resolved before the tags that
+reference them, so checking whether a tag contains something or getting
+everything in it doesn't require walking the references again.
+"""
+
+from burger.assets import load_json_tree
+from burger.tracing import PREFIX, jar_cache, record, unwrap
+
+TAGS_PREFIX = "data/minecraft/tags/"
+
+_indexes = jar_cache()
+
+def get_tag_index(classloader, verbose=False):
+    """Gets the (shared) TagIndex for the given classloader."""
+    record(classloader, PREFIX, TAGS_PREFIX)
+    classloader = unwrap(classloader)
+    index = _indexes.get(classloader)
+    if index is None:
+        documents = load_json_tree(classloader, TAGS_PREFIX)
+        index = _indexes[classloader] = TagIndex(documents, verbose)
+    return index
+
+class TagIndex(object):
+    """
+    The tags in a jar, keyed by type and name (e.g. "items/logs").
+
+    documents is a mapping of those keys to the parsed tag JSON.  References
+    to other tags (e.g. "#minecraft:oak_logs") are resolved within the same
+    type; a reference that forms a cycle is skipped.
+    """
+
+    def __init__(self, documents, verbose=False):
+        self.documents = documents
+        # Entry number -> entry, and the reverse
+        self.ids = []
+        self._numbers = {}
+        # Tag key -> list of everything in it (in order, with duplicates, as
+        # it would be written out by hand)
+        self._values = {}
+        # Tag key -> bitset of the entries in it
+        self._bits = {}
+        # Tag key -> tuple of the entries in it, in order, without duplicates
+        self._members = {}
+
+        for key in self.topological_order(verbose):
+            self._resolve(key)
+
+    def _intern(self, entry):
+        number = self._numbers.get(entry)
+        if number is None:
+            number = self._numbers[entry] = len(self.ids)
+            self.ids.append(entry)
+        return number
+
+    def _references(self, key):
+        """Gets the keys of the tags directly referenced by the given tag."""
+        type = key[:key.find("/")]
+        references = []
+        for entry in self.documents[key]["values"]:
+            if entry.startswith("#"):
+                assert entry.startswith("#minecraft:")
+                references.append(type + "/" + entry[len("#minecraft:"):])
+        return references
+
+    def topological_order(self, verbose=False):
+        """
+        Gets the keys of all tags, ordered so that every tag comes after the
+        tags it references.
+        """
+        order = []
+        visiting = set()
+        visited = set()
+
+        def visit(key):
+            if key in visiting:
+                if verbose:
+                    print("Already flattening " + key + " -- is there a cycle?", visiting)
+                return
+            if key in visited:
+                return
+
+            visiting.add(key)
+            for reference in self._references(key):
+                visit(reference)
+            visiting.discard(key)
+            visited.add(key)
+            order.append(key)
+
+        for key in self.documents:
+            visit(key)
+        return order
+
+    def _resolve(self, key):
+        type = key[:key.find("/")]
+        values = []
+        bits = 0
+        for entry in self.documents[key]["values"]:
+            if entry.startswith("#"):
+                reference = type + "/" + entry[len("#minecraft:"):]
+                if reference not in self._values:
+                    # Part of a cycle; not resolved yet
+                    continue
+                values.extend(self._values[reference])
+                bits |= self._bits[reference]
+            else:
+                values.append(entry)
+                bits |= 1 << self._intern(entry)
+
+        self._values[key] = values
+        self._bits[key] = bits
+
+    def __contains__(self, key):
+        return key in self._bits
+
+    def keys(self):
+        """Gets the keys of all tags, in the jar's order."""
+        return self.documents.keys()
+
+    def values(self, key):
+        """
+        Gets everything in the given tag, with references to other tags
+        replaced by their contents, in order.  This may contain duplicates.
+        """
+        return list(self._values[key])
+
+    def bits(self, key):
+        """Gets the bitset of the entries in the given tag."""
+        return self._bits[key]
+
+    def contains(self, key, entry):
+        """Checks whether the given tag contains entry, directly or indirectly."""
+        number = self._numbers.get(entry)
+        return number is not None and bool(self._bits[key] >> number & 1)
+
+    def members(self, key):
+        """
+        Gets the entries in the given tag as a tuple, in order and without
+        duplicates.
+        """
+        members = self._members.get(key)
+        if members is None:
+            seen = set()
+            members = []
+            for entry in self._values[key]:
+                if entry not in seen:
+                    seen.add(entry)
+                    members.append(entry)
+            members = self._members[key] = tuple(members)
+        return members
+
+    def member_set(self, key):
+        """Gets the entries in the given tag as a frozenset."""
+        bits = self._bits[key]
+        ids = self.ids
+        result = []
+        number = 0
+        while bits:
+            if bits & 1:
+                result.append(ids[number])
+            bits >>= 1
+            number += 1
+        return frozenset(result)
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Reuse of toppings' results when their inputs haven't changed.
+
+Each time a topping runs, the jar entries and aggregate keys it reads are
+recorded (see burger/tracing.py), along with their fingerprints, and stored
+as a trace alongside the changes it made to the aggregate.  Before a topping
+is run again, e.g. on the next jar or in a later run with a cache directory
+(see burger/cache.py), each stored trace for it is checked against the
+current jar and aggregate; if every input still has the same fingerprint,
+the stored changes are applied instead of running the topping.
+
+Results are keyed by the source of the whole burger package (as toppings
+also depend on the shared code they call, such as burger/util.py), the
+topping's own source file, and its option attributes (upper-case class
+attributes like COMPACT), so changing any of those doesn't reuse old
+results.  Toppings with CACHE set to False are always run.
+"""
+
+import hashlib
+import inspect
+import os
+
+import six
+
+from burger.cache import get_cache
+from burger.hashing import MerkleHasher
+from burger.tracing import AGGREGATE, InputTrace, TracingClassLoader, fingerprint
+
+CACHE_VERSION = 2
+
+# How many traces (with different inputs) are kept for each topping
+MAX_TRACES = 8
+
+_MISSING = object()
+
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Digest of the burger package's source, from _package_digest
+_package_source = None
+
+def _package_digest():
+    """Gets a digest of the source of every module in the burger package."""
+    global _package_source
+    if _package_source is None:
+        paths = []
+        for directory, subdirectories, files in os.walk(_PACKAGE_DIR):
+            subdirectories[:] = sorted(name for name in subdirectories if name != "__pycache__")
+            paths.extend(os.path.join(directory, name) for name in files if name.endswith(".py"))
+        digest = hashlib.sha1()
+        for path in sorted(paths):
+            digest.update(os.path.relpath(path, _PACKAGE_DIR).replace(os.sep, "/").encode("utf-8"))
+            with open(path, "rb") as fin:
+                digest.update(hashlib.sha1(fin.read()).digest())
+        _package_source = digest.hexdigest()
+    return _package_source
+
+def _aggregate_fingerprint(aggregate, key):
+    """
+    Gets the fingerprint of a key of the aggregate, or if key is a tuple,
+    of every key of the aggregate but those in it.
+    """
+    if isinstance(key, tuple):
+        return MerkleHasher().hexdigest(dict((name, value)
+                for name, value in dict.items(aggregate) if name not in key))
+    value = dict.get(aggregate, key, _MISSING)
+    if value is _MISSING:
+        return None
+    return MerkleHasher().hexdigest(value)
+
+class _ReadRecorder(object):
+    """Records the aggregate keys a topping reads in a trace."""
+
+    def __init__(self, aggregate, trace):
+        self.aggregate = aggregate
+        self.trace = trace
+        self._written = set()
+        # Whether every key has been read
+        self._read_all = False
+
+    def read(self, key):
+        if key is None:
+            if not self._read_all:
+                self._read_all = True
+                # Every key but those it already read (which are inputs of
+                # their own) and those it wrote, which are as they were
+                # before it ran
+                skip = self._written | set(value for kind, value in self.trace.inputs
+                        if kind == AGGREGATE)
+                skip = tuple(sorted(skip, key=repr))
+                self.trace.add(AGGREGATE, skip, _aggregate_fingerprint(self.aggregate, skip))
+        # Reading back what the topping wrote itself isn't an input
+        elif key not in self._written and (AGGREGATE, key) not in self.trace.inputs:
+            self.trace.add(AGGREGATE, key, _aggregate_fingerprint(self.aggregate, key))
+
+    def written(self, key):
+        self._written.add(key)
+
+class ToppingCache(object):
+    """Stored results of toppings, with the inputs they were computed from."""
+
+    def __init__(self):
+        self._results = get_cache("toppings", CACHE_VERSION)
+        # Topping -> its identifying key
+        self._topping_keys = {}
+
+    def _topping_key(self, topping):
+        key = self._topping_keys.get(topping)
+        if key is None:
+            with open(inspect.getsourcefile(topping), "rb") as fin:
+                source = hashlib.sha1(fin.read()).hexdigest()
+            options = tuple(sorted(six.iteritems(topping.options())))
+            key = self._topping_keys[topping] = (topping.__module__, topping.__name__,
+                    _package_digest(), source, options)
+        return key
+
+    def trace(self, classloader, aggregate):
+        """
+        Starts recording a topping's inputs.  Returns the InputTrace and the
+        TracingClassLoader to run the topping with.
+        """
+        trace = InputTrace()
+        aggregate.observe(_ReadRecorder(aggregate, trace))
+        return trace, TracingClassLoader(classloader, trace)
+
+    def lookup(self, topping, classloader, aggregate):
+        """
+        Gets the stored changes (for apply) of a run of topping whose inputs
+        are all unchanged, or None.
+        """
+        traces = self._results.get(self._results.key("traces", self._topping_key(topping)), [])
+        current = {}
+        for inputs, output_key in traces:
+            for (kind, value), expected in inputs:
+                if (kind, value) not in current:
+                    if kind == AGGREGATE:
+                        current[(kind, value)] = _aggregate_fingerprint(aggregate, value)
+                    else:
+                        current[(kind, value)] = fingerprint(classloader, kind, value)
+                if current[(kind, value)] != expected:
+                    break
+            else:
+                output = self._results.get(output_key)
+                if output is not None:
+                    return output
+        return None
+
+    def store(self, topping, trace, classloader, aggregate, changed_keys):
+        """
+        Stores the result of a successful run of topping: the values of the
+        given keys of the aggregate, with the inputs recorded in trace.
+        """
+        aggregate.observe(None)
+        inputs = tuple(((kind, value), expected if kind == AGGREGATE
+                else fingerprint(classloader, kind, value))
+                for (kind, value), expected in six.iteritems(trace.inputs))
+        output = [(key, dict.__contains__(aggregate, key), dict.get(aggregate, key))
+                for key in sorted(changed_keys, key=repr)]
+
+        topping_key = self._topping_key(topping)
+        output_key = self._results.key("output", topping_key, inputs)
+        self._results.put(output_key, output)
+
+        traces_key = self._results.key("traces", topping_key)
+        traces = [entry for entry in self._results.get(traces_key, []) if entry[0] != inputs]
+        traces.insert(0, (inputs, output_key))
+        self._results.put(traces_key, traces[:MAX_TRACES])
+
+    @staticmethod
+    def apply(aggregate, output):
+        """Makes the changes stored for a topping to the aggregate."""
+        for key, present, value in output:
+            if present:
+                aggregate[key] = value
+            else:
+                aggregate.pop(key, None)
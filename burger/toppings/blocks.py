@@ -26,10 +26,317 @@ from .topping import Topping
 from jawa.constants import *
 from jawa.util.descriptor import method_descriptor
 
-from burger.util import WalkerCallback, walk_method, try_eval_lambda
+from burger.util import try_eval_lambda, decode_method, OP_PUSH, OP_NEW, \
+        OP_GET_FIELD, OP_PUT_FIELD, OP_INVOKE, OP_INVOKEDYNAMIC, OP_LOAD, \
+        OP_STORE, OP_DUP, OP_POP, OP_NEW_ARRAY, OP_ARRAY_STORE, OP_ARRAY_LOAD, \
+        OP_NOP
 
 import six.moves
 
+def _builder_setters(builder_cf, light_setter):
+    """
+    Finds the block builder's property setters, returning a table from each
+    setter's name + descriptor to a tuple of its effects.  Each effect is a
+    tuple (key, arg index, constant): the block's key is set to the given
+    argument, or to the constant if the index is None.
+
+    Every candidate method is only disassembled once.
+    """
+    # Sets hardness and resistance
+    hardness_setter = builder_cf.methods.find_one(args='FF')
+    hardness_key = hardness_setter.name.value + hardness_setter.descriptor.value
+
+    def invoked(method):
+        # The name + descriptor of every method invoked by the given method
+        result = set()
+        for ins in method.code.disassemble():
+            if ins.mnemonic == "invokevirtual":
+                const = ins.operands[0]
+                result.add(const.name_and_type.name.value + const.name_and_type.descriptor.value)
+        return result
+
+    # There's also one that sets both to the same value
+    hardness_key_2 = None
+    for method in builder_cf.methods.find(args='F'):
+        if hardness_key in invoked(method):
+            hardness_key_2 = method.name.value + method.descriptor.value
+    assert hardness_key_2 != None
+    # ... and one that sets them both to 0
+    hardness_key_3 = None
+    for method in builder_cf.methods.find(args=''):
+        if hardness_key_2 in invoked(method):
+            hardness_key_3 = method.name.value + method.descriptor.value
+    assert hardness_key_3 != None
+
+    setters = {
+        hardness_key: (("hardness", 0, None), ("resistance", 1, None)),
+        hardness_key_2: (("hardness", 0, None), ("resistance", 0, None)),
+        hardness_key_3: (("hardness", None, 0.0), ("resistance", None, 0.0))
+    }
+    if light_setter != None:
+        setters[light_setter.name.value + light_setter.descriptor.value] = (("light", 0, None),)
+    return setters
+
+class _RegistrationWalker(object):
+    """
+    Evaluates the block registration code, in the same way as walk_method
+    with a WalkerCallback would, but in a single loop over the decoded
+    instructions (see decode_method) with the builder setters looked up in a
+    table built by _builder_setters.
+
+    listclass is only given for 1.14+ (where registration happens in the
+    block list class); otherwise registration is done through static methods
+    in the block superclass (1.13).
+    """
+
+    def __init__(self, aggregate, cf, superclass, builder_class, setters,
+            language, verbose, listclass=None):
+        self.cf = cf
+        self.superclass = superclass
+        self.builder_class = builder_class
+        self.setters = setters
+        self.language = language
+        self.verbose = verbose
+        self.listclass = listclass
+        self.identifier = aggregate["classes"]["identifier"]
+
+        blocks = aggregate.setdefault("blocks", {})
+        self.block = blocks.setdefault("block", {})
+        self.ordered_blocks = blocks.setdefault("ordered_blocks", [])
+        self.block_fields = blocks.setdefault("block_fields", {})
+
+        self.cur_id = 0
+        # Name + descriptor -> decoded method, for methods that are walked
+        # more than once (1.16+ uses helper methods for e.g. logs)
+        self.decoded = {}
+
+    def register(self, text_id, current_block):
+        current_block["text_id"] = text_id
+        current_block["numeric_id"] = self.cur_id
+        self.cur_id += 1
+        lang_key = "minecraft.%s" % text_id
+        if self.language != None and lang_key in self.language:
+            current_block["display_name"] = self.language[lang_key]
+        self.block[text_id] = current_block
+        self.ordered_blocks.append(text_id)
+
+    def invoke_static(self, class_name, method_name, desc, args):
+        superclass = self.superclass
+        if self.listclass is None and class_name == superclass:
+            # Call to the static register method.
+            self.register(args[0], args[1])
+        elif class_name == self.listclass:
+            if len(desc.args) == 2 and desc.args[0].name == "java/lang/String" and desc.args[1].name == superclass:
+                # Call to the static register method.
+                self.register(args[0], args[1])
+                return args[1]
+            elif len(desc.args) == 1 and desc.args[0].name == "int" and desc.returns.name == "java/util/function/ToIntFunction":
+                # 20w12a+: a method that takes a light level and returns a function
+                # that checks if the current block state has the lit state set,
+                # using light level 0 if not and the given light level if so.
+                # For our purposes, just simplify it to always be the given light level.
+                return args[0]
+            else:
+                # In 20w12a+ (1.16), some blocks (e.g. logs) use a separate method
+                # for initialization.  Call them.
+                sub_method = self.cf.methods.find_one(name=method_name, args=desc.args_descriptor, returns=desc.returns_descriptor)
+                return self.walk(sub_method, args)
+        elif class_name == self.builder_class:
+            if desc.args and desc.args[0].name == superclass: # Copy constructor
+                copy = dict(args[0])
+                del copy["text_id"]
+                del copy["numeric_id"]
+                del copy["class"]
+                if "display_name" in copy:
+                    del copy["display_name"]
+                return copy
+            else:
+                return {} # Append current block
+
+    def invoke_dynamic(self, ins, desc, args):
+        if self.listclass is None:
+            raise Exception("Unexpected invokedynamic: %s" % str(ins))
+        # 1.15-pre2 introduced a Supplier<BlockEntityType> parameter,
+        # and while most blocks handled it in their own constructor,
+        # chests put it directly in initialization.  We don't care about
+        # the value (we get block entities in a different way).
+
+        # 20w12a changed light levels to use a lambda, and we do
+        # care about those.  The light level is a ToIntFunction<BlockState>.
+        if desc.returns.name == "java/util/function/ToIntFunction":
+            # Try to invoke the function.
+            try:
+                args.append(object()) # The state that the lambda gets
+                return try_eval_lambda(ins, args, self.cf)
+            except Exception as ex:
+                if self.verbose:
+                    print("Failed to call lambda for light data:", ex)
+                return None
+        else:
+            return object()
+
+    def walk(self, method, input_args=None):
+        key = method.name.value + method.descriptor.value
+        if key not in self.decoded:
+            self.decoded[key] = decode_method(method)
+        code, last_ins = self.decoded[key]
+
+        verbose = self.verbose
+        superclass = self.superclass
+        builder_class = self.builder_class
+        listclass = self.listclass
+        setters = self.setters
+        block = self.block
+        block_fields = self.block_fields
+
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        locals = {}
+        cur_index = 0
+
+        if not method.access_flags.acc_static:
+            locals[cur_index] = object()
+            cur_index += 1
+        if input_args != None:
+            assert len(input_args) == len(method.args)
+            for arg in input_args:
+                locals[cur_index] = arg
+                cur_index += 1
+        else:
+            for arg in method.args:
+                locals[cur_index] = object()
+                cur_index += 1
+
+        for op in code:
+            kind = op[0]
+            if kind == OP_PUSH:
+                push(op[2])
+            elif kind == OP_INVOKE:
+                _, ins, is_static, class_name, method_name, method_desc, desc = op
+                num_args = len(desc.args)
+                if num_args:
+                    args = stack[-num_args:]
+                    del stack[-num_args:]
+                else:
+                    args = []
+
+                if is_static:
+                    ret = self.invoke_static(class_name, method_name, desc, args)
+                else:
+                    obj = pop()
+                    if method_name == "hasNext":
+                        # We've reached the end of block registration
+                        # (and have started iterating over registry keys)
+                        break
+
+                    effects = setters.get(method_name + method_desc)
+                    if effects is not None:
+                        for field, index, value in effects:
+                            if index is not None:
+                                value = args[index]
+                            if value is not None:
+                                obj[field] = value
+                    elif method_name == "<init>":
+                        # Call to the constructor for the block
+                        if listclass is None:
+                            # We can't hardcode index 0 because sand has an extra parameter, so use the last one
+                            # There are also cases where it's an arg-less constructor; we don't want to do anything there.
+                            if args:
+                                obj.update(args[-1])
+                        else:
+                            # The majority of blocks have a 1-arg constructor simply taking the builder.
+                            # However, sand has public BlockSand(int color, Block.Builder builder), and
+                            # signs (as of 1.15-pre1) have public BlockSign(Block.builder builder, WoodType type)
+                            for idx, arg in enumerate(desc.args):
+                                if arg.name == builder_class:
+                                    obj.update(args[idx])
+                                    break
+
+                    returns = desc.returns.name
+                    if returns == builder_class or (listclass is not None and returns == superclass):
+                        ret = obj
+                    elif returns == self.identifier:
+                        # Probably getting the air identifier from the registry
+                        ret = "air"
+                    else:
+                        ret = object()
+
+                if desc.returns.name != "void":
+                    push(ret)
+            elif kind == OP_NEW:
+                push({"class": op[2]})
+            elif kind == OP_DUP:
+                push(stack[-1])
+            elif kind == OP_GET_FIELD:
+                _, ins, is_static, class_name, field_name, field_desc = op
+                if not is_static:
+                    pop()
+                if class_name == superclass:
+                    # Probably getting the static AIR resource location
+                    push("air")
+                elif listclass is None:
+                    push(object())
+                elif class_name == listclass:
+                    push(block[block_fields[field_name]])
+                elif field_desc == "Ljava/util/function/ToIntFunction;":
+                    # Light level lambda, used by candles.  Not something we
+                    # can evaluate (it depends on the block state).
+                    push(None)
+                else:
+                    push(object())
+            elif kind == OP_PUT_FIELD:
+                _, ins, is_static, class_name, field_name, field_desc = op
+                value = pop()
+                if not is_static:
+                    pop()
+                if listclass is None:
+                    raise Exception("unexpected putfield: %s" % ins)
+                if isinstance(value, dict):
+                    value["field"] = field_name
+                    block_fields[field_name] = value["text_id"]
+            elif kind == OP_LOAD:
+                push(locals[op[2]])
+            elif kind == OP_STORE:
+                locals[op[2]] = pop()
+            elif kind == OP_POP:
+                pop()
+            elif kind == OP_INVOKEDYNAMIC:
+                num_args = len(op[2].args)
+                if num_args:
+                    args = stack[-num_args:]
+                    del stack[-num_args:]
+                else:
+                    args = []
+                push(self.invoke_dynamic(op[1], op[2], args))
+            elif kind == OP_NEW_ARRAY:
+                push([op[2]] * pop())
+            elif kind == OP_ARRAY_STORE:
+                value = pop()
+                index = pop()
+                array = pop()
+                if isinstance(array, list) and isinstance(index, int):
+                    array[index] = value
+                elif verbose:
+                    print("Failed to execute %s: array %s index %s value %s" % (op[1], array, index, value))
+            elif kind == OP_ARRAY_LOAD:
+                index = pop()
+                array = pop()
+                if isinstance(array, list) and isinstance(index, int):
+                    push(array[index])
+                elif verbose:
+                    print("Failed to execute %s: array %s index %s" % (op[1], array, index))
+            elif kind == OP_NOP:
+                pass
+            elif verbose:
+                print("Unknown instruction %s: stack is %s" % (op[1], stack))
+
+        if last_ins.mnemonic in ("ireturn", "lreturn", "freturn", "dreturn", "areturn"):
+            # Non-void method returning
+            return pop()
+        elif last_ins.mnemonic != "return" and verbose:
+            print("Unexpected final instruction %s: stack is %s" % (last_ins, stack))
+
 class BlocksTopping(Topping):
     """Gets most available block types."""
 
@@ -105,31 +412,6 @@ class BlocksTopping(Topping):
         builder_class = ctor.args[0].name
 
         builder_cf = classloader[builder_class]
-        # Sets hardness and resistance
-        hardness_setter = builder_cf.methods.find_one(args='FF')
-        # There's also one that sets both to the same value
-        hardness_setter_2 = None
-        for method in builder_cf.methods.find(args='F'):
-            for ins in method.code.disassemble():
-                if ins.mnemonic == "invokevirtual":
-                    const = ins.operands[0]
-                    if (const.name_and_type.name.value == hardness_setter.name.value and
-                            const.name_and_type.descriptor.value == hardness_setter.descriptor.value):
-                        hardness_setter_2 = method
-                        break
-        assert hardness_setter_2 != None
-        # ... and one that sets them both to 0
-        hardness_setter_3 = None
-        for method in builder_cf.methods.find(args=''):
-            for ins in method.code.disassemble():
-                if ins.mnemonic == "invokevirtual":
-                    const = ins.operands[0]
-                    if (const.name_and_type.name.value == hardness_setter_2.name.value and
-                            const.name_and_type.descriptor.value == hardness_setter_2.descriptor.value):
-                        hardness_setter_3 = method
-                        break
-        assert hardness_setter_3 != None
-
         light_setter = builder_cf.methods.find_one(args='I')
         if light_setter == None:
             # 20w12a replaced the simple setter with one that takes a lambda
@@ -138,147 +420,14 @@ class BlocksTopping(Topping):
             # such as sea pickles have varying light levels by state.
             light_setter = builder_cf.methods.find_one(args='Ljava/util/function/ToIntFunction;')
         assert light_setter != None
-
-        blocks = aggregate.setdefault("blocks", {})
-        block = blocks.setdefault("block", {})
-        ordered_blocks = blocks.setdefault("ordered_blocks", [])
-        block_fields = blocks.setdefault("block_fields", {})
+        setters = _builder_setters(builder_cf, light_setter)
 
         # Find the static block registration method
         method = lcf.methods.find_one(name='<clinit>')
 
-        class Walker(WalkerCallback):
-            def __init__(self):
-                self.cur_id = 0
-
-            def on_new(self, ins, const):
-                class_name = const.name.value
-                return {"class": class_name}
-
-            def on_invoke(self, ins, const, obj, args):
-                method_name = const.name_and_type.name.value
-                method_desc = const.name_and_type.descriptor.value
-                desc = method_descriptor(method_desc)
-
-                if ins.mnemonic == "invokestatic":
-                    if const.class_.name.value == listclass:
-                        if len(desc.args) == 2 and desc.args[0].name == "java/lang/String" and desc.args[1].name == superclass:
-                            # Call to the static register method.
-                            text_id = args[0]
-                            current_block = args[1]
-                            current_block["text_id"] = text_id
-                            current_block["numeric_id"] = self.cur_id
-                            self.cur_id += 1
-                            lang_key = "minecraft.%s" % text_id
-                            if language != None and lang_key in language:
-                                current_block["display_name"] = language[lang_key]
-                            block[text_id] = current_block
-                            ordered_blocks.append(text_id)
-                            return current_block
-                        elif len(desc.args) == 1 and desc.args[0].name == "int" and desc.returns.name == "java/util/function/ToIntFunction":
-                            # 20w12a+: a method that takes a light level and returns a function
-                            # that checks if the current block state has the lit state set,
-                            # using light level 0 if not and the given light level if so.
-                            # For our purposes, just simplify it to always be the given light level.
-                            return args[0]
-                        else:
-                            # In 20w12a+ (1.16), some blocks (e.g. logs) use a separate method
-                            # for initialization.  Call them.
-                            sub_method = lcf.methods.find_one(name=method_name, args=desc.args_descriptor, returns=desc.returns_descriptor)
-                            return walk_method(lcf, sub_method, self, verbose, args)
-                    elif const.class_.name.value == builder_class:
-                        if desc.args[0].name == superclass: # Copy constructor
-                            copy = dict(args[0])
-                            del copy["text_id"]
-                            del copy["numeric_id"]
-                            del copy["class"]
-                            if "display_name" in copy:
-                                del copy["display_name"]
-                            return copy
-                        else:
-                            return {} # Append current block
-                else:
-                    if method_name == "hasNext":
-                        # We've reached the end of block registration
-                        # (and have started iterating over registry keys)
-                        raise StopIteration()
-
-                    if method_name == hardness_setter.name.value and method_desc == hardness_setter.descriptor.value:
-                        obj["hardness"] = args[0]
-                        obj["resistance"] = args[1]
-                    elif method_name == hardness_setter_2.name.value and method_desc == hardness_setter_2.descriptor.value:
-                        obj["hardness"] = args[0]
-                        obj["resistance"] = args[0]
-                    elif method_name == hardness_setter_3.name.value and method_desc == hardness_setter_3.descriptor.value:
-                        obj["hardness"] = 0.0
-                        obj["resistance"] = 0.0
-                    elif method_name == light_setter.name.value and method_desc == light_setter.descriptor.value:
-                        if args[0] != None:
-                            obj["light"] = args[0]
-                    elif method_name == "<init>":
-                        # Call to the constructor for the block
-                        # The majority of blocks have a 1-arg constructor simply taking the builder.
-                        # However, sand has public BlockSand(int color, Block.Builder builder), and
-                        # signs (as of 1.15-pre1) have public BlockSign(Block.builder builder, WoodType type)
-                        # (Prior to that 1.15-pre1, we were able to assume that the last argument was the builder)
-                        # There are also cases of arg-less constructors, which we just ignore as they are presumably not blocks.
-                        for idx, arg in enumerate(desc.args):
-                            if arg.name == builder_class:
-                                obj.update(args[idx])
-                                break
-
-                    if desc.returns.name == builder_class or desc.returns.name == superclass:
-                        return obj
-                    elif desc.returns.name == aggregate["classes"]["identifier"]:
-                        # Probably getting the air identifier from the registry
-                        return "air"
-                    elif desc.returns.name != "void":
-                        return object()
-
-            def on_get_field(self, ins, const, obj):
-                if const.class_.name.value == superclass:
-                    # Probably getting the static AIR resource location
-                    return "air"
-                elif const.class_.name.value == listclass:
-                    return block[block_fields[const.name_and_type.name.value]]
-                elif const.name_and_type.descriptor == "Ljava/util/function/ToIntFunction;":
-                    # Light level lambda, used by candles.  Not something we
-                    # can evaluate (it depends on the block state).
-                    return None
-                else:
-                    return object()
-
-            def on_put_field(self, ins, const, obj, value):
-                if isinstance(value, dict):
-                    field = const.name_and_type.name.value
-                    value["field"] = field
-                    block_fields[field] = value["text_id"]
-
-            def on_invokedynamic(self, ins, const, args):
-                # 1.15-pre2 introduced a Supplier<BlockEntityType> parameter,
-                # and while most blocks handled it in their own constructor,
-                # chests put it directly in initialization.  We don't care about
-                # the value (we get block entities in a different way), but
-                # we still need to override this as the default implementation
-                # raises an exception
-
-                # 20w12a changed light levels to use a lambda, and we do
-                # care about those.  The light level is a ToIntFunction<BlockState>.
-                method_desc = const.name_and_type.descriptor.value
-                desc = method_descriptor(method_desc)
-                if desc.returns.name == "java/util/function/ToIntFunction":
-                    # Try to invoke the function.
-                    try:
-                        args.append(object()) # The state that the lambda gets
-                        return try_eval_lambda(ins, args, lcf)
-                    except Exception as ex:
-                        if verbose:
-                            print("Failed to call lambda for light data:", ex)
-                        return None
-                else:
-                    return object()
-
-        walk_method(lcf, method, Walker(), verbose)
+        walker = _RegistrationWalker(aggregate, lcf, superclass, builder_class,
+                setters, language, verbose, listclass=listclass)
+        walker.walk(method)
 
     @staticmethod
     def _process_1point13(aggregate, classloader, verbose):
@@ -297,120 +446,15 @@ class BlocksTopping(Topping):
         builder_class = ctor.args[0].name
 
         builder_cf = classloader[builder_class]
-        # Sets hardness and resistance
-        hardness_setter = builder_cf.methods.find_one(args='FF')
-        # There's also one that sets both to the same value
-        hardness_setter_2 = None
-        for method in builder_cf.methods.find(args='F'):
-            for ins in method.code.disassemble():
-                if ins == "invokevirtual":
-                    const = ins.operands[0]
-                    if (const.name_and_type.name.value == hardness_setter.name.value and
-                            const.name_and_type.descriptor.value == hardness_setter.descriptor.value):
-                        hardness_setter_2 = method
-                        break
-        assert hardness_setter_2 != None
-        # ... and one that sets them both to 0
-        hardness_setter_3 = None
-        for method in builder_cf.methods.find(args=''):
-            for ins in method.code.disassemble():
-                if ins == "invokevirtual":
-                    const = ins.operands[0]
-                    if (const.name_and_type.name.value == hardness_setter_2.name.value and
-                            const.name_and_type.descriptor.value == hardness_setter_2.descriptor.value):
-                        hardness_setter_3 = method
-                        break
-        assert hardness_setter_3 != None
-
         light_setter = builder_cf.methods.find_one(args='I')
-
-        blocks = aggregate.setdefault("blocks", {})
-        block = blocks.setdefault("block", {})
-        ordered_blocks = blocks.setdefault("ordered_blocks", [])
+        setters = _builder_setters(builder_cf, light_setter)
 
         # Find the static block registration method
         method = cf.methods.find_one(args='', returns="V", f=lambda m: m.access_flags.acc_public and m.access_flags.acc_static)
 
-        class Walker(WalkerCallback):
-            def __init__(self):
-                self.cur_id = 0
-
-            def on_new(self, ins, const):
-                class_name = const.name.value
-                return {"class": class_name}
-
-            def on_invoke(self, ins, const, obj, args):
-                method_name = const.name_and_type.name.value
-                method_desc = const.name_and_type.descriptor.value
-                desc = method_descriptor(method_desc)
-
-                if ins == "invokestatic":
-                    if const.class_.name == superclass:
-                        # Call to the static register method.
-                        text_id = args[0]
-                        current_block = args[1]
-                        current_block["text_id"] = text_id
-                        current_block["numeric_id"] = self.cur_id
-                        self.cur_id += 1
-                        lang_key = "minecraft.%s" % text_id
-                        if language != None and lang_key in language:
-                            current_block["display_name"] = language[lang_key]
-                        block[text_id] = current_block
-                        ordered_blocks.append(text_id)
-                    elif const.class_.name == builder_class:
-                        if desc.args[0].name == superclass: # Copy constructor
-                            copy = dict(args[0])
-                            del copy["text_id"]
-                            del copy["numeric_id"]
-                            del copy["class"]
-                            if "display_name" in copy:
-                                del copy["display_name"]
-                            return copy
-                        else:
-                            return {} # Append current block
-                else:
-                    if method_name == "hasNext":
-                        # We've reached the end of block registration
-                        # (and have started iterating over registry keys)
-                        raise StopIteration()
-
-                    if method_name == hardness_setter.name and method_desc == hardness_setter.descriptor:
-                        obj["hardness"] = args[0]
-                        obj["resistance"] = args[1]
-                    elif method_name == hardness_setter_2.name and method_desc == hardness_setter_2.descriptor:
-                        obj["hardness"] = args[0]
-                        obj["resistance"] = args[0]
-                    elif method_name == hardness_setter_3.name and method_desc == hardness_setter_3.descriptor:
-                        obj["hardness"] = 0.0
-                        obj["resistance"] = 0.0
-                    elif method_name == light_setter.name and method_desc == light_setter.descriptor:
-                        obj["light"] = args[0]
-                    elif method_name == "<init>":
-                        # Call to the constructor for the block
-                        # We can't hardcode index 0 because sand has an extra parameter, so use the last one
-                        # There are also cases where it's an arg-less constructor; we don't want to do anything there.
-                        if len(args) > 0:
-                            obj.update(args[-1])
-
-                    if desc.returns.name == builder_class:
-                        return obj
-                    elif desc.returns.name == aggregate["classes"]["identifier"]:
-                        # Probably getting the air identifier from the registry
-                        return "air"
-                    elif desc.returns.name != "void":
-                        return object()
-
-            def on_get_field(self, ins, const, obj):
-                if const.class_.name == superclass:
-                    # Probably getting the static AIR resource location
-                    return "air"
-                else:
-                    return object()
-
-            def on_put_field(self, ins, const, obj, value):
-                raise Exception("unexpected putfield: %s" % ins)
-
-        walk_method(cf, method, Walker(), verbose)
+        walker = _RegistrationWalker(aggregate, cf, superclass, builder_class,
+                setters, language, verbose)
+        walker.walk(method)
 
     @staticmethod
     def _process_1point12(aggregate, classloader, verbose):
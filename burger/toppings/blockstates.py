@@ -2,6 +2,8 @@
 # -*- coding: utf8 -*-
 
 from .topping import Topping
+from burger.cache import get_cache, class_hash
+from burger.hierarchy import get_hierarchy
 
 from jawa.constants import *
 from jawa.util.descriptor import method_descriptor, field_descriptor
@@ -22,6 +24,22 @@ PLANES = { "HORIZONTAL": HORIZONTAL, "VERTICAL": VERTICAL }
 # Classes that represent predicates in various versions
 PREDICATE_CLASSES = ("com/google/common/base/Predicate", "java/util/function/Predicate")
 
+# Version of the cached results of find_field; increase this whenever
+# find_field changes in a way that affects its results.
+FIELD_CACHE_VERSION = 2
+
+def _property_key(cls, field_name, field, array_index=None):
+    """
+    Gets the key that handled property data is shared by: the class that
+    declares the field and the field's name there, along with the name the
+    block class cls uses for it (field_name, which is part of the data) and
+    the property's position in an array.  A field that doesn't have a
+    declaring class is only shared within cls.
+    """
+    if isinstance(field, dict) and "declared_in" in field:
+        return (field["declared_in"], field["declared_name"], field_name, array_index)
+    return (cls, None, field_name, array_index)
+
 class BlockStateTopping(Topping):
     """Gets tile entity (block entity) types."""
 
@@ -223,12 +241,13 @@ class BlockStateTopping(Topping):
                 properties_by_class[cls] = []
 
         assert len(_property_types) == 4
+        hierarchy = get_hierarchy(classloader)
         property_types = {}
         for type in _property_types:
-            cf = classloader[type]
-            if cf.super_.name.value in _property_types:
+            if hierarchy.super_(type) in _property_types:
                 property_types[type] = "direction"
             else:
+                cf = classloader[type]
                 attribute = cf.attributes.find_one(name='Signature')
                 signature = attribute.signature.value
                 # Somewhat ugly behavior until an actual parser is added for these
@@ -242,62 +261,88 @@ class BlockStateTopping(Topping):
                     print("Unknown property type %s with signature %s" % (type, signature))
 
         # Part 2: figure out what each field is.
-        is_enum_cache = {}
         def is_enum(cls):
             """
             Checks if the given class is an enum.
-            This needs to be recursive due to inner classes for enums.
+            This needs to check all superclasses due to inner classes for enums.
             """
-            if cls in is_enum_cache:
-                return is_enum_cache[cls]
-            if cls not in classloader:
-                is_enum_cache[cls] = False
-                return False
-
-            cf = classloader[cls]
-            super = cf.super_.name.value
-            if super == "java/lang/Enum":
-                is_enum_cache[cls] = True
-            elif super == "java/lang/Object":
-                is_enum_cache[cls] = False
-            else:
-                is_enum_cache[cls] = is_enum(super)
-
-            return is_enum_cache[cls]
+            return "java/lang/Enum" in hierarchy.ancestors(cls)
 
         fields_by_class = {}
+        # Class name -> set of names of the classes its fields were computed
+        # from (including itself)
+        deps_by_class = {}
+
+        # The fields of each class are cached between jars (and runs) by the
+        # content of the class, as most classes with properties don't change
+        # between versions.  Since the fields of a class also depend on its
+        # superclasses and on other classes it gets fields from, the hashes
+        # of those are stored along with the fields and checked on use.
+        field_cache = get_cache("blockstates.fields", FIELD_CACHE_VERSION)
+        # Everything other than class content that the fields depend on
+        field_context = (sorted(six.iteritems(property_types)), plane,
+                aggregate["classes"].get("sounds.list"))
 
         def find_field(cls, field_name):
             """
             cls: name of the class
             field_name: name of the field to find.  If None, returns all fields
             """
-            if cls in fields_by_class:
-                if field_name is not None:
-                    if field_name not in fields_by_class[cls] and verbose:
-                        print("Requested field %s.%s but that wasn't found last time" % (cls, field_name))
-                    return fields_by_class[cls][field_name]
-                else:
-                    return fields_by_class[cls]
-            elif cls == aggregate["classes"].get("sounds.list"):
-                # If we already know what the sounds list class is, just ignore it
-                # as going through it would take a while for no reason
-                return object()
+            if cls not in fields_by_class:
+                if cls == aggregate["classes"].get("sounds.list"):
+                    # If we already know what the sounds list class is, just ignore it
+                    # as going through it would take a while for no reason
+                    return object()
+                load_fields(cls)
 
-            cf = classloader[cls]
+            if field_name is not None:
+                if field_name not in fields_by_class[cls] and verbose:
+                    print("Requested field %s.%s but that wasn't found" % (cls, field_name))
+                return fields_by_class[cls][field_name]
+            else:
+                return fields_by_class[cls]
+
+        def load_fields(cls):
+            """
+            Fills in fields_by_class and deps_by_class for the given class,
+            either from the cache or by evaluating its static initializer.
+            """
+            key = field_cache.key(class_hash(classloader, cls), field_context)
+            cached = field_cache.get(key)
+            if cached is not None:
+                fields, dep_hashes = cached
+                if all(class_hash(classloader, dep) == dep_hash
+                        for dep, dep_hash in six.iteritems(dep_hashes)):
+                    fields_by_class[cls] = fields
+                    deps_by_class[cls] = set(dep_hashes)
+                    return
 
             fields_by_class[cls] = {}
-            super_name = cf.super_.name.value
+            deps = deps_by_class[cls] = set([cls])
+            resolve_fields(cls, deps)
+
+            dep_hashes = dict((dep, class_hash(classloader, dep)) for dep in deps)
+            field_cache.put(key, (fields_by_class[cls], dep_hashes))
+
+        def resolve_fields(cls, deps):
+            """
+            Evaluates the static initializer of the given class to find its
+            fields, adding the names of any other classes used to deps.
+            """
+            def depend_on(name):
+                deps.update(deps_by_class.get(name, (name,)))
+
+            cf = classloader[cls]
+
+            super_name = hierarchy.super_(cls)
             if not super_name.startswith("java/lang"):
                 # Add fields from superclass
                 fields_by_class[cls].update(find_field(super_name, None))
+                depend_on(super_name)
 
             init = cf.methods.find_one(name="<clinit>")
             if not init:
-                if field_name is not None:
-                    return fields_by_class[cls][field_name]
-                else:
-                    return fields_by_class[cls]
+                return
 
             stack = []
             locals = {}
@@ -321,6 +366,7 @@ class BlockStateTopping(Topping):
                             # loaded with getstatic, and we don't want to change
                             # the true location of it
                             value["declared_in"] = cls
+                            value["declared_name"] = name
                         if value["class"] == plane:
                             # Convert to an instance of Plane
                             # Now is the easiest time to do this, and for
@@ -339,6 +385,7 @@ class BlockStateTopping(Topping):
                     name = const.name_and_type.name.value
                     if not target.startswith("java/"):
                         stack.append(find_field(target, name))
+                        depend_on(target)
                     else:
                         stack.append(object())
                 elif ins in ("ldc", "ldc_w", "ldc2_w"):
@@ -413,6 +460,7 @@ class BlockStateTopping(Topping):
                     elif const.name_and_type.name == "values":
                         # Enum values
                         fields = find_field(const.class_.name.value, None)
+                        depend_on(const.class_.name.value)
                         stack.append([fld for fld in fields
                                       if isinstance(fld, dict) and fld["is_enum"]])
                     elif desc.returns.name != "void":
@@ -441,6 +489,8 @@ class BlockStateTopping(Topping):
                         "class": type_name,
                         "is_enum": is_enum(type_name)
                     }
+                    deps.add(type_name)
+                    deps.update(hierarchy.ancestors(type_name))
                     stack.append(obj)
                 elif ins == "checkcast":
                     # We don't have type information, so no checking or casting
@@ -453,11 +503,6 @@ class BlockStateTopping(Topping):
                 elif verbose:
                     print("%s initializer contains unimplemented ins %s" % (cls, ins))
 
-            if field_name is not None:
-                return fields_by_class[cls][field_name]
-            else:
-                return fields_by_class[cls]
-
         # Part 3: convert those fields into actual well-formed properties.
         # Property handlers.
         def base_handle_property(prop):
@@ -604,6 +649,11 @@ class BlockStateTopping(Topping):
             'direction': handle_direction_property
         }
 
+        # _property_key -> handled property data.  Many block classes share
+        # the same property fields (e.g. every slab or stair), so each field
+        # only needs to be handled once.
+        property_index = {}
+
         def process_property(property):
             field_name = property["field_name"]
             try:
@@ -612,7 +662,10 @@ class BlockStateTopping(Topping):
                     field = field[property["array_index"]]
                 property["field"] = field
 
-                property["data"] = property_handlers[field["type"]](property)
+                key = _property_key(cls, field_name, field, property.get("array_index"))
+                if key not in property_index:
+                    property_index[key] = property_handlers[field["type"]](property)
+                property["data"] = property_index[key]
             except:
                 if verbose:
                     print("Failed to handle property %s (declared %s.%s)" % (property, cls, field_name))
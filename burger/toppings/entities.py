@@ -25,6 +25,7 @@ THE SOFTWARE.
 import six
 
 from .topping import Topping
+from burger.hierarchy import get_hierarchy
 from burger.util import WalkerCallback, class_from_invokedynamic, walk_method
 
 from jawa.constants import *
@@ -404,8 +405,10 @@ class EntityTopping(Topping):
         set_size_name = set_size.name.value
         set_size_desc = set_size.descriptor.value
 
+        hierarchy = get_hierarchy(classloader)
+
         def compute_size(class_name):
-            if class_name == "java/lang/Object":
+            if class_name == "java/lang/Object" or class_name is None:
                 return None
 
             if class_name in size_cache:
@@ -435,7 +438,7 @@ class EntityTopping(Topping):
                     tmp = []
             else:
                 # No result, so use the superclass
-                result = compute_size(cf.super_.name.value)
+                result = compute_size(hierarchy.super_(class_name))
 
             size_cache[class_name] = result
             return result
@@ -450,14 +453,14 @@ class EntityTopping(Topping):
     @staticmethod
     def abstract_entities(classloader, entities, verbose):
         entity_classes = {e["class"]: e["name"] for e in six.itervalues(entities)}
+        hierarchy = get_hierarchy(classloader)
 
         # Add some abstract classes, to help with metadata, and for reference only;
         # these are not spawnable
         def abstract_entity(abstract_name, *subclass_names):
             for name in subclass_names:
                 if name in entities:
-                    cf = classloader[entities[name]["class"]]
-                    parent = cf.super_.name.value
+                    parent = hierarchy.super_(entities[name]["class"])
                     if parent not in entity_classes:
                         entities["~abstract_" + abstract_name] = { "class": parent, "name": "~abstract_" + abstract_name }
                     elif verbose:
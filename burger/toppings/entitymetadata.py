@@ -1,6 +1,7 @@
 import six
 
 from .topping import Topping
+from burger.hierarchy import get_hierarchy
 from burger.util import WalkerCallback, walk_method, string_from_invokedymanic
 
 from jawa.constants import *
@@ -73,6 +74,7 @@ class EntityMetadataTopping(Topping):
         dataserializers_by_field = {serializer["field"]: serializer for serializer in six.itervalues(dataserializers)}
 
         entity_classes = {e["class"]: e["name"] for e in six.itervalues(entities)}
+        hierarchy = get_hierarchy(classloader)
         parent_by_class = {}
         metadata_by_class = {}
         bitfields_by_class = {}
@@ -89,7 +91,7 @@ class EntityMetadataTopping(Topping):
                 return len(metadata_by_class[cls]) + fill_class(parent_by_class[cls])
 
             cf = classloader[cls]
-            super = cf.super_.name.value
+            super = hierarchy.super_(cls)
             parent_by_class[cls] = super
             index = fill_class(super)
 
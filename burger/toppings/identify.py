@@ -23,9 +23,10 @@ THE SOFTWARE.
 """
 
 from .topping import Topping
+from burger.classreader import read_constant_strings
+from burger.hierarchy import get_hierarchy
 
-from jawa.constants import String
-
+import itertools
 import traceback
 
 # We can identify almost every class we need just by
@@ -102,21 +103,25 @@ def identify(classloader, path, verbose):
     """
     possible_match = None
 
-    for c in classloader.search_constant_pool(path=path, type_=String):
-        value = c.string.value
+    # Only the string constants are needed for almost every check, so read
+    # just those rather than loading the class; the set of them is used for
+    # the checks that look for another constant in the same class.
+    constants = read_constant_strings(classloader, path)
+    strings = constants.strings
+
+    for value in constants.ordered:
         for match_list, match_name in MATCHES:
             if check_match(value, match_list):
-                class_file = classloader[path]
-                return match_name, class_file.this.name.value
+                return match_name, path
 
         for match_list, match_name in MAYBE_MATCHES:
             if check_match(value, match_list):
-                class_file = classloader[path]
-                possible_match = (match_name, class_file.this.name.value)
+                possible_match = (match_name, path)
                 # Continue searching through the other constants in the class
 
         if 'BaseComponent' in value:
-            class_file = classloader[path]
+            hierarchy = get_hierarchy(classloader)
+            class_name = path
             # We want the interface for chat components, but it has no
             # string constants, so we need to use the abstract class and then
             # get its first implemented interface.
@@ -125,69 +130,56 @@ def identify(classloader, path, verbose):
             # want, but the interface we do want extends Brigadier's Message interface.
             # So, loop up until a good-looking interface is present.
             # In other versions, the interface extends Iterable.  In some versions, it extends both.
-            while len(class_file.interfaces) in (1, 2):
-                parent = class_file.interfaces[0].name.value
+            while len(hierarchy.interfaces(class_name)) in (1, 2):
+                parent = hierarchy.interfaces(class_name)[0]
                 if "com/mojang/brigadier" in parent or "java/lang/Iterable" == parent:
                     break
-                class_file = classloader[parent]
+                class_name = parent
             else:
                 # There wasn't the same number of interfaces, can't do anything really
                 if verbose:
-                    print(class_file, "(parent of " + path + ", BaseComponent) has an unexpected number of interfaces:", class_file.interfaces)
+                    print(class_name, "(parent of " + path + ", BaseComponent) has an unexpected number of interfaces:", hierarchy.interfaces(class_name))
                 # Just hope for the best with the current class file
 
-            return 'chatcomponent', class_file.this.name.value
+            return 'chatcomponent', class_name
 
         if value == 'ambient.cave':
             # This is found in both the sounds list class and sounds event class.
             # However, the sounds list class also has a constant specific to it.
             # Note that this method will not work in 1.8, but the list class doesn't exist then either.
-            class_file = classloader[path]
-
-            for c2 in class_file.constants.find(type_=String):
-                if c2 == 'Accessed Sounds before Bootstrap!':
-                    return 'sounds.list', class_file.this.name.value
+            if 'Accessed Sounds before Bootstrap!' in strings:
+                return 'sounds.list', path
             else:
-                return 'sounds.event', class_file.this.name.value
+                return 'sounds.event', path
 
         if value == 'piston_head':
             # piston_head is a technical block, which is important as that means it has no item form.
             # This constant is found in both the block list class and the class containing block registrations.
-            class_file = classloader[path]
-
-            for c2 in class_file.constants.find(type_=String):
-                if c2 == 'Accessed Blocks before Bootstrap!':
-                    return 'block.list', class_file.this.name.value
+            if 'Accessed Blocks before Bootstrap!' in strings:
+                return 'block.list', path
             else:
-                return 'block.register', class_file.this.name.value
+                return 'block.register', path
 
         if value == 'diamond_pickaxe':
             # Similarly, diamond_pickaxe is only an item.  This exists in 3 classes, though:
             # - The actual item registration code
             # - The item list class
             # - The item renderer class (until 1.13), which we don't care about
-            class_file = classloader[path]
-
-            for c2 in class_file.constants.find(type_=String):
-                if c2 == 'textures/misc/enchanted_item_glint.png':
-                    # Item renderer, which we don't care about
-                    return
-
-                if c2 == 'Accessed Items before Bootstrap!':
-                    return 'item.list', class_file.this.name.value
+            if 'textures/misc/enchanted_item_glint.png' in strings:
+                # Item renderer, which we don't care about
+                return
+            elif 'Accessed Items before Bootstrap!' in strings:
+                return 'item.list', path
             else:
-                return 'item.register', class_file.this.name.value
+                return 'item.register', path
 
         if value in ('Ice Plains', 'mutated_ice_flats', 'ice_spikes'):
             # Finally, biomes.  There's several different names that were used for this one biome
             # Only classes are the list class and the one with registration.  Note that the list didn't exist in 1.8.
-            class_file = classloader[path]
-
-            for c2 in class_file.constants.find(type_=String):
-                if c2 == 'Accessed Biomes before Bootstrap!':
-                    return 'biome.list', class_file.this.name.value
+            if 'Accessed Biomes before Bootstrap!' in strings:
+                return 'biome.list', path
             else:
-                return 'biome.register', class_file.this.name.value
+                return 'biome.register', path
 
         if value == 'minecraft':
             class_file = classloader[path]
@@ -203,7 +195,7 @@ def identify(classloader, path, verbose):
             fields = class_file.fields.find(**find_args)
 
             if len(list(fields)) == 2:
-                return 'identifier', class_file.this.name.value
+                return 'identifier', path
 
         if value == 'PooledMutableBlockPosition modified after it was released.':
             # Keep on going up the class hierarchy until we find a logger,
@@ -214,15 +206,14 @@ def identify(classloader, path, verbose):
             # Also, this is the _only_ string constant available to us.
             # Finally, note that PooledMutableBlockPos was introduced in 1.9.
             # This technique will not work in 1.8.
-            cf = classloader[path]
+            hierarchy = get_hierarchy(classloader)
             logger_type = "Lorg/apache/logging/log4j/Logger;"
-            while not cf.fields.find_one(type_=logger_type):
-                if cf.super_.name == "java/lang/Object":
-                    cf = None
+            for class_name in itertools.chain((path,), hierarchy.ancestors(path)):
+                if class_name not in hierarchy:
+                    # Reached java/lang/Object
                     break
-                cf = classloader[cf.super_.name.value]
-            if cf:
-                return 'position', cf.this.name.value
+                if classloader[class_name].fields.find_one(type_=logger_type):
+                    return 'position', class_name
 
         if value == 'Getting block state':
             # This message is found in Chunk, in the method getBlockState.
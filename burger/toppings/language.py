@@ -22,6 +22,10 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 from .topping import Topping
+from burger.strings import get_string_pool
+from burger.tracing import open_entry
+
+import io
 import six
 
 try:
@@ -38,6 +42,12 @@ class LanguageTopping(Topping):
 
     DEPENDS = []
 
+    # Whether to intern language keys and values in STRING_POOL
+    INTERN = True
+    # The StringPool language keys and values are interned in; None means
+    # the process-wide pool.  iter_run sets this to its own pool.
+    STRING_POOL = None
+
     @staticmethod
     def act(aggregate, classloader, verbose=False):
         aggregate["language"] = {}
@@ -73,46 +83,78 @@ class LanguageTopping(Topping):
             True
         )
 
+    @staticmethod
+    def string_pool():
+        """Gets the StringPool to intern language strings in."""
+        pool = LanguageTopping.STRING_POOL
+        if pool is None:
+            pool = get_string_pool()
+        return pool
+
     @staticmethod
     def load_language(aggregate, classloader, path, verbose=False, is_json=False):
-        try:
-            with classloader.open(path) as fin:
-                contents = fin.read().decode("utf-8")
-        except:
+        if path not in classloader.path_map:
             if verbose:
                 print("Can't find file %s in jar" % path)
             return
 
-        for category, name, value in LanguageTopping.parse_lang(contents, verbose, is_json):
-            cat = aggregate["language"].setdefault(category, {})
-            cat[name] = value
+        pool = LanguageTopping.string_pool() if LanguageTopping.INTERN else None
+        language = aggregate["language"]
+        # The file is decoded as it is read, rather than reading and decoding
+        # all of it up front.
+        with open_entry(classloader, path) as raw:
+            fin = io.TextIOWrapper(raw, encoding="utf-8")
+            if is_json:
+                entries = LanguageTopping.parse_lang_json(json.load(fin))
+            else:
+                entries = LanguageTopping.parse_lang_lines(fin, verbose)
+
+            # Most consecutive entries are in the same category
+            last_category = None
+            cat = None
+            for category, name, value in entries:
+                if pool is not None:
+                    category = pool.intern(category)
+                    name = pool.intern(name)
+                    value = pool.intern(value)
+                if category != last_category:
+                    cat = language.setdefault(category, {})
+                    last_category = category
+                cat[name] = value
 
     @staticmethod
     def parse_lang(contents, verbose, is_json):
         if is_json:
-            contents = json.loads(contents)
-            for tag, value in six.iteritems(contents):
-                category, name = tag.split(".", 1)
-
-                yield (category, name, value)
+            return LanguageTopping.parse_lang_json(json.loads(contents))
         else:
-            contents = contents.split("\n")
-            lineno = 0
-            for line in contents:
-                lineno = lineno + 1
-                line = line.strip()
-
-                if not line:
-                    continue
-                if line[0] == "#":
-                    continue
-
-                if not "=" in line or not "." in line:
-                    if verbose:
-                        print("Language file line %s is malformed: %s" % (lineno, line))
-                    continue
-
-                tag, value = line.split("=", 1)
-                category, name = tag.split(".", 1)
-
-                yield (category, name, value)
\ No newline at end of file
+            return LanguageTopping.parse_lang_lines(contents.split("\n"), verbose)
+
+    @staticmethod
+    def parse_lang_json(contents):
+        for tag, value in six.iteritems(contents):
+            category, name = tag.split(".", 1)
+
+            yield (category, name, value)
+
+    @staticmethod
+    def parse_lang_lines(lines, verbose):
+        """Parses a .lang file from an iterable of its lines."""
+        lineno = 0
+        for line in lines:
+            lineno = lineno + 1
+            line = line.strip()
+
+            if not line:
+                continue
+            if line[0] == "#":
+                continue
+
+            if not "=" in line or not "." in line:
+                if verbose:
+                    print("Language file line %s is malformed: %s" % (lineno, line))
+                continue
+
+            tag, value = line.split("=", 1)
+            category, name = tag.split(".", 1)
+
+            yield (category, name, value)
@@ -0,0 +1,53 @@
+from .topping import Topping
+from .language import LanguageTopping
+
+from burger import locales
+
+class LanguagesTopping(Topping):
+    """Provides every locale's language file, as a columnar table."""
+
+    PROVIDES = [
+        "languages"
+    ]
+
+    # The asset index for other locales is found from the version's id
+    DEPENDS = [
+        "language",
+        "version.id"
+    ]
+
+    # Other locales may be read from the launcher's assets, outside the jar
+    CACHE = False
+
+    # Only if true is anything loaded, into "languages" (see
+    # burger.locales).  Locales not in the jar are loaded from ASSETS_DIR, a
+    # launcher-style assets directory, if it is set; ASSET_INDEX is the id
+    # of the asset index to use there (if not set, it's found from the
+    # version, or the only index is used).
+    ALL_LOCALES = False
+    ASSETS_DIR = None
+    ASSET_INDEX = None
+
+    @staticmethod
+    def act(aggregate, classloader, verbose=False):
+        if not LanguagesTopping.ALL_LOCALES:
+            return
+
+        sources = {}
+        if LanguagesTopping.ASSETS_DIR is not None:
+            version_id = aggregate.get("version", {}).get("id")
+            index_path = locales.find_asset_index(LanguagesTopping.ASSETS_DIR,
+                    LanguagesTopping.ASSET_INDEX, version_id)
+            if index_path is not None:
+                if verbose:
+                    print("Loading locales from asset index %s" % index_path)
+                sources.update(locales.asset_sources(LanguagesTopping.ASSETS_DIR, index_path))
+            elif verbose:
+                print("Can't find an asset index in %s" % LanguagesTopping.ASSETS_DIR)
+        # Files in the jar take priority
+        sources.update(locales.jar_sources(classloader))
+
+        if verbose:
+            print("Loading %s locales" % len(sources))
+        parsed = locales.parse_locales(sources.values())
+        aggregate["languages"] = locales.build_table(parsed, LanguageTopping.string_pool())
@@ -23,21 +23,102 @@ THE SOFTWARE.
 """
 
 from .topping import Topping
+from burger.assets import load_json_tree
+from burger.tagindex import get_tag_index
 
 from jawa.util.descriptor import method_descriptor
 from jawa.constants import *
 
-try:
-    import json
-except ImportError:
-    import simplejson as json
-
 import six
-import copy
+import itertools
+
+def _build_shape(raw):
+    """Builds the shape of a shaped recipe from its raw rows and subs."""
+    shape = []
+    for row in raw["rows"]:
+        shape_row = []
+        for char in row:
+            if not char.isspace():
+                shape_row.append(raw["subs"][char])
+            else:
+                shape_row.append(None)
+        shape.append(shape_row)
+    return shape
+
+def expand_recipe(recipe, tags, cache=None, unique=False):
+    """
+    Expands a recipe whose ingredients contain choices or tag references
+    (as output in compact mode) into one recipe per combination of items,
+    as output normally.  Recipes with only plain items yield themselves.
+
+    tags: The tags output by the tags topping
+    cache: An optional dict from tag name to the items in that tag, which is
+           filled in as needed; pass the same one to share the items between
+           calls (with the same unique).
+    unique: If true, an item listed more than once in a tag only gives one
+            recipe.  The normal output has one recipe per entry.
+    """
+    if cache is None:
+        cache = {}
+
+    def alternatives(item):
+        # The choices for an item that is a choice or tag reference, or None.
+        # Choices inside of choices become nested lists.
+        if item["type"] == "tag":
+            tag = item["tag"]
+            if tag not in cache:
+                cache[tag] = []
+                seen = set()
+                for id in tags["items/" + tag]["values"]:
+                    if unique:
+                        if id in seen:
+                            continue
+                        seen.add(id)
+                    if id.startswith("minecraft:"):
+                        id = id[len("minecraft:"):]
+                    cache[tag].append({"type": "item", "name": id})
+            return cache[tag]
+        elif item["type"] == "choice":
+            result = []
+            for choice in item["choices"]:
+                nested = alternatives(choice)
+                result.append(nested if nested is not None else choice)
+            return result
+        else:
+            return None
+
+    def options(item):
+        nested = alternatives(item)
+        return nested if nested is not None else (item,)
+
+    if recipe["type"] == "shapeless":
+        for ingredients in itertools.product(*[options(item) for item in recipe["ingredients"]]):
+            result = dict(recipe)
+            result["ingredients"] = list(ingredients)
+            yield result
+    elif recipe["type"] == "shape":
+        keys = list(recipe["raw"]["subs"])
+        for subs in itertools.product(*[options(recipe["raw"]["subs"][key]) for key in keys]):
+            result = dict(recipe)
+            result["raw"] = {
+                "rows": recipe["raw"]["rows"],
+                "subs": dict(zip(keys, subs))
+            }
+            result["shape"] = _build_shape(result["raw"])
+            yield result
+    else:
+        yield recipe
 
 class RecipesTopping(Topping):
     """Provides a list of most possible crafting recipes."""
 
+    # If true, recipes with a choice of items for an ingredient (either a
+    # list or a tag) are output once, with the choice kept as a choice
+    # ({"type": "choice", "choices": [...]}) or tag reference
+    # ({"type": "tag", "tag": name}), rather than once per combination of
+    # items.  Use expand_recipe to get the individual recipes.
+    COMPACT = False
+
     PROVIDES = [
         "recipes"
     ]
@@ -75,26 +156,36 @@ class RecipesTopping(Topping):
 
         recipes = []
 
+        tag_index = get_tag_index(classloader, verbose)
+        # Tag name -> parsed items in that tag, shared between every recipe
+        # using that tag when expanding
+        tag_items = {}
+
         def parse_item(blob, allow_lists=True):
             """
             Converts a JSON item into a burger item.
-            If the blob is a list, then a list is returned (if allowed).
+            If the blob is a list or tag, then a choice or tag reference is
+            returned (if allowed); see expand_recipe.
             """
-            # If the key involves a list, then convert to a list and parse them all.
             if isinstance(blob, list):
                 if allow_lists:
-                    return [parse_item(entry) for entry in blob]
+                    return {
+                        "type": "choice",
+                        "choices": [parse_item(entry) for entry in blob]
+                    }
                 else:
                     raise Exception("A list of items is not allowed in this context")
             elif "tag" in blob:
                 if allow_lists:
-                    res = []
                     tag = blob["tag"]
                     if tag.startswith("minecraft:"):
                         tag = tag[len("minecraft:"):]
-                    for id in aggregate["tags"]["items/" + tag]["values"]:
-                        res.append(parse_item({"item": id}))
-                    return res
+                    if "items/" + tag not in tag_index:
+                        raise Exception("Unknown item tag %s" % tag)
+                    return {
+                        "type": "tag",
+                        "tag": tag
+                    }
                 else:
                     raise Exception("A tag is not allowed in this context")
             # There's some wierd stuff regarding 0 or 32767 here; I'm not worrying about it though
@@ -120,96 +211,58 @@ class RecipesTopping(Topping):
 
             return result
 
-        for name in classloader.path_map.keys():
-            if name.startswith(prefix) and name.endswith(".json"):
-                recipe_id = "minecraft:" + name[len(prefix):-len(".json")]
-                try:
-                    with classloader.open(name) as fin:
-                        data = json.load(fin)
+        for name, data in six.iteritems(load_json_tree(classloader, prefix)):
+            recipe_id = "minecraft:" + name
+            try:
+                assert "type" in data
+                recipe_type = data["type"]
+                if recipe_type.startswith("minecraft:"):
+                    recipe_type = recipe_type[len("minecraft:"):]
 
-                    assert "type" in data
-                    recipe_type = data["type"]
-                    if recipe_type.startswith("minecraft:"):
-                        recipe_type = recipe_type[len("minecraft:"):]
+                if recipe_type not in ("crafting_shaped", "crafting_shapeless"):
+                    # We only care about regular recipes, not furnace/loom/whatever ones.
+                    continue
 
-                    if recipe_type not in ("crafting_shaped", "crafting_shapeless"):
-                        # We only care about regular recipes, not furnace/loom/whatever ones.
-                        continue
+                recipe = {}
+                recipe["id"] = recipe_id # new for 1.12, but used ingame
 
-                    recipe = {}
-                    recipe["id"] = recipe_id # new for 1.12, but used ingame
+                if "group" in data:
+                    recipe["group"] = data["group"]
 
-                    if "group" in data:
-                        recipe["group"] = data["group"]
 
+                assert "result" in data
+                recipe["makes"] = parse_item(data["result"], False)
+                if "count" not in recipe["makes"]:
+                    recipe["makes"]["count"] = 1 # default, TODO should we keep specifying this?
 
-                    assert "result" in data
-                    recipe["makes"] = parse_item(data["result"], False)
-                    if "count" not in recipe["makes"]:
-                        recipe["makes"]["count"] = 1 # default, TODO should we keep specifying this?
+                if recipe_type == "crafting_shapeless":
+                    recipe["type"] = 'shapeless'
 
-                    matching_recipes = [recipe]
+                    assert "ingredients" in data
 
-                    if recipe_type == "crafting_shapeless":
-                        recipe["type"] = 'shapeless'
+                    recipe["ingredients"] = [parse_item(ingredient) for ingredient in data["ingredients"]]
+                elif recipe_type == "crafting_shaped":
+                    recipe["type"] = 'shape'
 
-                        assert "ingredients" in data
+                    assert "pattern" in data
+                    assert "key" in data
 
-                        recipe["ingredients"] = []
-                        for ingredient in data["ingredients"]:
-                            item = parse_item(ingredient)
-                            if isinstance(item, list):
-                                tmp = []
-                                for recipe_choice in matching_recipes:
-                                    for real_item in item:
-                                        recipe_choice_work = copy.deepcopy(recipe_choice)
-                                        recipe_choice_work["ingredients"].append(real_item)
-                                        tmp.append(recipe_choice_work)
-                                matching_recipes = tmp
-                            else:
-                                for recipe_choice in matching_recipes:
-                                    recipe_choice["ingredients"].append(item)
-                    elif recipe_type == "crafting_shaped":
-                        recipe["type"] = 'shape'
-
-                        assert "pattern" in data
-                        assert "key" in data
-
-                        pattern = data["pattern"]
-                        recipe["raw"] = {
-                            "rows": pattern,
-                            "subs": {}
-                        }
-                        for (id, value) in six.iteritems(data["key"]):
-                            item = parse_item(value)
-                            if isinstance(item, list):
-                                tmp = []
-                                for recipe_choice in matching_recipes:
-                                    for real_item in item:
-                                        recipe_choice_work = copy.deepcopy(recipe_choice)
-                                        recipe_choice_work["raw"]["subs"][id] = real_item
-                                        tmp.append(recipe_choice_work)
-                                matching_recipes = tmp
-                            else:
-                                for recipe_choice in matching_recipes:
-                                    recipe_choice["raw"]["subs"][id] = item
-
-                        for recipe_choice in matching_recipes:
-                            shape = []
-                            for row in recipe_choice["raw"]["rows"]:
-                                shape_row = []
-                                for char in row:
-                                    if not char.isspace():
-                                        shape_row.append(recipe_choice["raw"]["subs"][char])
-                                    else:
-                                        shape_row.append(None)
-                                shape.append(shape_row)
-                            recipe_choice["shape"] = shape
-
-                    recipes.extend(matching_recipes)
-                except Exception as e:
-                    print("Failed to parse %s: %s" % (recipe_id, e))
-                    raise
+                    recipe["raw"] = {
+                        "rows": data["pattern"],
+                        "subs": {}
+                    }
+                    for (id, value) in six.iteritems(data["key"]):
+                        recipe["raw"]["subs"][id] = parse_item(value)
+
+                    recipe["shape"] = _build_shape(recipe["raw"])
+
+                if RecipesTopping.COMPACT:
+                    recipes.append(recipe)
+                else:
+                    recipes.extend(expand_recipe(recipe, aggregate["tags"], tag_items))
+            except Exception as e:
+                print("Failed to parse %s: %s" % (recipe_id, e))
+                raise
 
         return recipes
 
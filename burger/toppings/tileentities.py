@@ -1,9 +1,11 @@
 #!/usr/bin/env python
 # -*- coding: utf8 -*-
 
+import itertools
 import six
 
 from .topping import Topping
+from burger.hierarchy import get_hierarchy
 
 from jawa.constants import ConstantClass, String
 from burger.util import class_from_invokedynamic
@@ -86,40 +88,32 @@ class TileEntityTopping(Topping):
         te_classes = te["classes"]
 
         blocks = aggregate["blocks"]["block"]
+        hierarchy = get_hierarchy(classloader)
         # Brewing stands are a fairly simple block entity with a clear hierarchy
         brewing_stand = blocks["brewing_stand"]
-        cf = classloader[brewing_stand["class"]]
 
-        blockcontainer = cf.super_.name.value
-        cf = classloader[blockcontainer]
-        assert len(cf.interfaces) == 1
+        blockcontainer = hierarchy.super_(brewing_stand["class"])
+        interfaces = hierarchy.interfaces(blockcontainer)
+        assert len(interfaces) == 1
 
-        tileentityprovider = cf.interfaces[0].name.value
+        tileentityprovider = interfaces[0]
         cf = classloader[tileentityprovider]
         methods = list(cf.methods.find(returns="L" + aggregate["classes"]["tileentity.superclass"] + ";"))
         assert len(methods) == 1
         create_te_name = methods[0].name.value
         create_te_desc = methods[0].descriptor.value
 
-        has_be_by_class = {}
-        has_be_by_class[blockcontainer] = True
-        has_be_by_class[aggregate["classes"]["block.superclass"]] = False
+        block_superclass = aggregate["classes"]["block.superclass"]
 
         def has_be(cls):
-            if cls in has_be_by_class:
-                return has_be_by_class[cls]
-
-            cf = classloader[cls]
-
-            if has_be(cf.super_.name.value):
-                has_be_by_class[cls] = True
-                return True
-
-            for interface in cf.interfaces:
-                # Final case: if it implements the interface but doesn't directly
-                # extend BlockContainer, it's still a TE
-                if interface.name.value == tileentityprovider:
-                    has_be_by_class[cls] = True
+            for name in itertools.chain((cls,), hierarchy.ancestors(cls)):
+                if name == blockcontainer:
+                    return True
+                elif name == block_superclass:
+                    return False
+                elif tileentityprovider in hierarchy.interfaces(name):
+                    # Final case: if it implements the interface but doesn't directly
+                    # extend BlockContainer, it's still a TE
                     return True
 
             return False
@@ -139,7 +133,7 @@ class TileEntityTopping(Topping):
             create_te = None
             while not create_te:
                 cf = classloader[cls]
-                cls = cf.super_.name.value
+                cls = hierarchy.super_(cls)
                 create_te = cf.methods.find_one(f=lambda m: m.name == create_te_name and m.descriptor == create_te_desc)
 
             for ins in create_te.code.disassemble():
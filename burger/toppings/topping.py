@@ -22,10 +22,27 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
+import six
 
 class Topping(object):
     PROVIDES = None
     DEPENDS = None
+    # Whether the topping's result can be reused when the jar entries and
+    # aggregate keys it read are unchanged (see burger/toppingcache.py);
+    # toppings that read anything else should set this to False
+    CACHE = True
+
+    @classmethod
+    def options(cls):
+        """
+        Gets the topping's settings, which are the upper-case attributes
+        set on its class (e.g. COMPACT) other than PROVIDES, DEPENDS and
+        CACHE, as a dict.  Only simple values (not e.g. a StringPool) are
+        included.
+        """
+        return dict((name, value) for name, value in six.iteritems(vars(cls))
+                if name.isupper() and name not in ("PROVIDES", "DEPENDS", "CACHE")
+                and isinstance(value, (bool, six.integer_types, float, six.string_types, type(None))))
 
     @staticmethod
     def act(aggregate, classloader, verbose=False):
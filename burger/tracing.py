@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Recording what a topping reads from the jar, and what that costs.
+
+Toppings are given a TracingClassLoader, which passes everything through to
+the real classloader and notes each input the topping uses in an
+InputTrace:
+
+    ("entry", path): a single entry (e.g. a class, as "name.class"), or the
+        fact that it's missing
+    ("prefix", prefix): every entry whose path starts with prefix
+    ("listing",): the whole jar, e.g. when iterating over path_map
+    ("aggregate", key): a key of the aggregate (None for all of it), which
+        is noted with its fingerprint at the time it was first read
+
+Code that keeps jar-wide indexes (the class hierarchy, the tag index, ...)
+should look them up with unwrap(classloader), so that they're shared by
+every topping, and note what they depend on with record(classloader, ...).
+They should be kept in a dictionary from jar_cache, so that forget_jar can
+drop them when the jar is no longer used (e.g. by the server).
+
+fingerprint gets a fingerprint of an input's current content (from the zip
+entries' CRCs and sizes, without reading them), so that a topping's result
+can be reused when none of its inputs changed; see burger/toppingcache.py.
+
+Separately, jars are opened with an AccountingClassLoader, which adds up the
+classes loaded and parsed, the entries and bytes read, and the time spent on
+them, in the AccessStats of the topping that's running.  That includes what
+shared indexes read on the topping's behalf.  Code that reads entries from
+the zip files in path_map directly should call account(classloader, path),
+or use open_entry or read_entry, which also handle jars that are
+directories.
+"""
+
+import hashlib
+import os
+import time
+import weakref
+
+from collections.abc import Mapping
+from contextlib import contextmanager
+
+import six
+
+from jawa.classloader import ClassLoader
+
+ENTRY = "entry"
+PREFIX = "prefix"
+LISTING = "listing"
+AGGREGATE = "aggregate"
+
+class InputTrace(object):
+    """The inputs used by one run of a topping."""
+
+    def __init__(self):
+        # (kind, value) -> fingerprint, if known when the input was used (for
+        # the aggregate, which changes), or None
+        self.inputs = {}
+
+    def add(self, kind, value=None, fingerprint=None):
+        if (kind, value) not in self.inputs:
+            self.inputs[(kind, value)] = fingerprint
+
+    def __iter__(self):
+        return iter(self.inputs)
+
+    def __len__(self):
+        return len(self.inputs)
+
+class _TracingPathMap(Mapping):
+    """A read-only view of a classloader's path_map that records access."""
+
+    def __init__(self, path_map, trace):
+        self._path_map = path_map
+        self._trace = trace
+
+    def __getitem__(self, path):
+        self._trace.add(ENTRY, path)
+        return self._path_map[path]
+
+    def __contains__(self, path):
+        self._trace.add(ENTRY, path)
+        return path in self._path_map
+
+    def get(self, path, default=None):
+        self._trace.add(ENTRY, path)
+        return self._path_map.get(path, default)
+
+    def __iter__(self):
+        self._trace.add(LISTING)
+        return iter(self._path_map)
+
+    def __len__(self):
+        self._trace.add(LISTING)
+        return len(self._path_map)
+
+class TracingClassLoader(object):
+    """
+    Wraps a classloader, recording the entries that are read through it in
+    trace.  Anything else is passed straight through.
+    """
+
+    def __init__(self, classloader, trace):
+        self._classloader = classloader
+        self.trace = trace
+
+    def __getattr__(self, name):
+        return getattr(self._classloader, name)
+
+    def __getitem__(self, path):
+        return self.load(path)
+
+    def __contains__(self, path):
+        self.trace.add(ENTRY, path)
+        self.trace.add(ENTRY, path + ".class")
+        return path in self._classloader
+
+    def load(self, path):
+        self.trace.add(ENTRY, path + ".class")
+        return self._classloader.load(path)
+
+    def open(self, path, mode="r"):
+        self.trace.add(ENTRY, path)
+        return self._classloader.open(path, mode)
+
+    def dependencies(self, path):
+        self.trace.add(ENTRY, path + ".class")
+        return self._classloader.dependencies(path)
+
+    def search_constant_pool(self, path, **options):
+        self.trace.add(ENTRY, path + ".class")
+        return self._classloader.search_constant_pool(path=path, **options)
+
+    @property
+    def path_map(self):
+        return _TracingPathMap(self._classloader.path_map, self.trace)
+
+    @property
+    def classes(self):
+        self.trace.add(LISTING)
+        return self._classloader.classes
+
+def unwrap(classloader):
+    """Gets the real classloader behind a TracingClassLoader."""
+    while isinstance(classloader, TracingClassLoader):
+        classloader = classloader._classloader
+    return classloader
+
+def record(classloader, kind, value=None):
+    """Notes an input, if classloader is a TracingClassLoader."""
+    if isinstance(classloader, TracingClassLoader):
+        classloader.trace.add(kind, value)
+
+# Every dictionary from jar_cache
+_jar_caches = []
+
+def jar_cache():
+    """
+    Creates a dictionary for keeping something for each classloader (the
+    real one; see unwrap), which forget_jar clears.
+    """
+    cache = weakref.WeakKeyDictionary()
+    _jar_caches.append(cache)
+    return cache
+
+def forget_jar(classloader):
+    """Drops everything kept for classloader in every jar_cache."""
+    classloader = unwrap(classloader)
+    for cache in _jar_caches:
+        cache.pop(classloader, None)
+
+_entry_indexes = jar_cache()
+_fingerprints = jar_cache()
+
+def _entry_index(classloader):
+    """
+    Gets a dict of entry path -> (CRC, size) for every entry in the
+    classloader.  Entries that aren't in a zip file are hashed instead.
+    """
+    index = _entry_indexes.get(classloader)
+    if index is None:
+        index = {}
+        for path, source in six.iteritems(classloader.path_map):
+            if hasattr(source, "getinfo"):
+                info = source.getinfo(path)
+                index[path] = (info.CRC, info.file_size)
+            else:
+                # Not through classloader.open, which would count the read
+                # (and get the index again) on an AccountingClassLoader
+                with ClassLoader.open(classloader, path) as fin:
+                    index[path] = (hashlib.sha1(fin.read()).hexdigest(),)
+        _entry_indexes[classloader] = index
+    return index
+
+def fingerprint(classloader, kind, value=None):
+    """
+    Gets a fingerprint of the current content of an input from the jar
+    (not the aggregate).
+    """
+    classloader = unwrap(classloader)
+    index = _entry_index(classloader)
+    if kind == ENTRY:
+        return index.get(value)
+
+    fingerprints = _fingerprints.setdefault(classloader, {})
+    result = fingerprints.get((kind, value))
+    if result is None:
+        if kind == PREFIX:
+            paths = sorted(path for path in index if path.startswith(value))
+        else:
+            paths = sorted(index)
+        digest = hashlib.sha1()
+        for path in paths:
+            digest.update(repr((path, index[path])).encode("utf-8"))
+        result = fingerprints[(kind, value)] = digest.hexdigest()
+    return result
+
+class AccessStats(object):
+    """What a topping read from the jar."""
+
+    def __init__(self):
+        # Classes loaded, and how many of those weren't already parsed
+        self.classes = 0
+        self.parsed = 0
+        # Seconds spent loading (reading and parsing) classes
+        self.load_seconds = 0.0
+        # Entries (including classes) read, their uncompressed size, and the
+        # seconds spent reading them outside of loading classes
+        self.entries = 0
+        self.bytes = 0
+        self.read_seconds = 0.0
+
+    def add(self, other):
+        """Adds the counts in other to these."""
+        for name, value in six.iteritems(vars(other)):
+            setattr(self, name, getattr(self, name) + value)
+
+    def as_dict(self):
+        return dict(vars(self))
+
+class AccountingClassLoader(ClassLoader):
+    """
+    A ClassLoader that adds up what's read through it in stats, when that is
+    set to an AccessStats.
+    """
+
+    def __init__(self, *args, **kwargs):
+        ClassLoader.__init__(self, *args, **kwargs)
+        self.stats = None
+        # Whether a class is being loaded, in which case reading it counts
+        # towards the load time
+        self._loading = False
+
+    def load(self, path):
+        stats = self.stats
+        if stats is None or self._loading:
+            return ClassLoader.load(self, path)
+
+        parsed = path not in self.class_cache
+        start = time.time()
+        self._loading = True
+        try:
+            return ClassLoader.load(self, path)
+        finally:
+            self._loading = False
+            stats.load_seconds += time.time() - start
+            stats.classes += 1
+            if parsed:
+                stats.parsed += 1
+
+    @contextmanager
+    def open(self, path, mode="r"):
+        stats = self.stats
+        start = time.time()
+        with ClassLoader.open(self, path, mode) as fin:
+            if stats is not None:
+                if not self._loading:
+                    stats.read_seconds += time.time() - start
+                stats.entries += 1
+                stats.bytes += _entry_size(self, path)
+            yield fin
+
+def _entry_size(classloader, path):
+    source = classloader.path_map.get(path)
+    if isinstance(source, six.string_types):
+        # A file in a directory, which isn't worth hashing everything for
+        return os.path.getsize(source)
+    entry = _entry_index(classloader).get(path)
+    return entry[1] if entry is not None and len(entry) == 2 else 0
+
+def account(classloader, path):
+    """
+    Counts a read of the entry path that didn't go through the classloader
+    (e.g. from a zip file in its path_map).
+    """
+    classloader = unwrap(classloader)
+    stats = getattr(classloader, "stats", None)
+    if stats is not None:
+        stats.entries += 1
+        stats.bytes += _entry_size(classloader, path)
+
+def open_entry(classloader, path):
+    """
+    Opens the entry path as a binary file object, counting the read (see
+    account).  Unlike the classloader's open, an entry in a zip file is
+    streamed rather than read into memory first; an entry of a directory
+    is opened as a file.
+    """
+    account(classloader, path)
+    source = unwrap(classloader).path_map[path]
+    if isinstance(source, six.string_types):
+        return open(source, "rb")
+    return source.open(path)
+
+def read_entry(classloader, path):
+    """Reads the whole entry path, counting the read (see account)."""
+    with open_entry(classloader, path) as fin:
+        return fin.read()
+
+def format_report(rows):
+    """
+    Formats a table of what each topping read.  rows is a list of (topping
+    name, seconds the topping took, AccessStats).
+    """
+    lines = ["%-20s %9s %9s %9s %9s %9s %12s" % ("topping", "seconds", "classes",
+            "parsed", "load s", "entries", "bytes")]
+    for name, seconds, stats in rows:
+        lines.append("%-20s %9.3f %9d %9d %9.3f %9d %12d" % (name, seconds, stats.classes,
+                stats.parsed, stats.load_seconds, stats.entries, stats.bytes))
+    return "\n".join(lines)
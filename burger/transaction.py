@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Rollback of the changes a topping made to the aggregate, if it fails.
+
+The aggregate, and every dictionary and list in it, is a JournalDict or
+JournalList.  While a transaction is open, these record how to undo each
+change made to them in a Journal: the previous value of each dictionary key
+that's set or removed, and a copy of each list the first time it's changed.
+Rolling back undoes them in reverse, so changes anywhere in the aggregate
+(e.g. to aggregate["blocks"]["block"][...]) are undone, and only what was
+changed is copied.
+
+Dictionaries and lists that a topping adds are plain ones; when the
+transaction is committed, those are replaced by journaled copies, so that
+later toppings' changes to them can be undone as well.
+
+The aggregate itself is an Aggregate, which can also tell an observer which
+of its keys are read and written (see burger/toppingcache.py).
+
+Journaled containers pickle (and deep copy) as plain ones.
+"""
+
+from collections import OrderedDict
+
+import six
+
+_MISSING = object()
+
+class Journal(object):
+    """The undo log for every container in one aggregate."""
+
+    def __init__(self):
+        # (container, key, previous value) for each change, or None when no
+        # transaction is open
+        self._entries = None
+        # Containers (and for dictionaries, keys) that may have been given
+        # plain dictionaries and lists
+        self._added = []
+        # ids of lists already copied in this transaction
+        self._saved_lists = set()
+
+    @property
+    def active(self):
+        return self._entries is not None
+
+    def begin(self):
+        """Starts recording changes."""
+        self._entries = []
+        self._added = []
+        self._saved_lists = set()
+
+    def changed_keys(self):
+        """
+        Gets the set of keys of the aggregate whose values were changed
+        (anywhere inside them) since begin.
+        """
+        return set(_root(container, key) for container, key, _ in self._entries)
+
+    def commit(self):
+        """
+        Keeps the changes made since begin.  Returns the keys of the
+        aggregate that were changed, as from changed_keys.
+        """
+        changed = self.changed_keys()
+        # Separately for each key of the aggregate, so that every container
+        # knows which one it's in
+        memos = {}
+        for container, key in self._added:
+            root = _root(container, key)
+            memo = memos.setdefault(root, {})
+            if key is None:
+                for i, item in enumerate(container):
+                    if _needs_wrap(item):
+                        list.__setitem__(container, i, self.wrap(item, memo, root))
+            elif dict.__contains__(container, key):
+                value = dict.__getitem__(container, key)
+                if _needs_wrap(value):
+                    dict.__setitem__(container, key, self.wrap(value, memo, root))
+        self._entries = None
+        self._added = []
+        self._saved_lists = set()
+        return changed
+
+    def rollback(self):
+        """Undoes the changes made since begin."""
+        for container, key, previous in reversed(self._entries):
+            if key is None:
+                list.__setitem__(container, slice(None), previous)
+            elif previous is _MISSING:
+                dict.pop(container, key, None)
+            else:
+                dict.__setitem__(container, key, previous)
+        self._entries = None
+        self._added = []
+        self._saved_lists = set()
+
+    def _record_key(self, container, key, value=_MISSING):
+        if self._entries is not None:
+            self._entries.append((container, key, dict.get(container, key, _MISSING)))
+            if _needs_wrap(value):
+                self._added.append((container, key))
+
+    def _record_list(self, container):
+        if self._entries is not None and id(container) not in self._saved_lists:
+            self._saved_lists.add(id(container))
+            self._entries.append((container, None, list(container)))
+            self._added.append((container, None))
+
+    def wrap(self, value, memo=None, root=None):
+        """
+        Gets a journaled copy of a plain dictionary or list, and of the
+        dictionaries and lists in it.  Other values are returned as is.
+        root is the key of the aggregate the value is (going to be) in.
+        """
+        if memo is None:
+            memo = {}
+        if not _needs_wrap(value):
+            return value
+        if id(value) in memo:
+            return memo[id(value)]
+
+        if isinstance(value, dict):
+            result = memo[id(value)] = JournalDict(self)
+            for key, item in six.iteritems(value):
+                dict.__setitem__(result, key, self.wrap(item, memo, root))
+        else:
+            result = memo[id(value)] = JournalList(self)
+            for item in value:
+                list.append(result, self.wrap(item, memo, root))
+        result._root = root
+        return result
+
+def _root(container, key):
+    """Gets the key of the aggregate that a change to container[key] is in."""
+    return key if isinstance(container, Aggregate) else container._root
+
+def _needs_wrap(value):
+    # Other subclasses (e.g. defaultdict) would lose their behavior if copied
+    return type(value) in (dict, OrderedDict, list)
+
+class JournalDict(dict):
+    """A dictionary whose changes are recorded in a Journal."""
+
+    __slots__ = ("_journal", "_root")
+
+    def __init__(self, journal, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self._journal = journal
+        self._root = None
+
+    @property
+    def journal(self):
+        return self._journal
+
+    def __reduce_ex__(self, protocol):
+        return (dict, (dict(self),))
+
+    def __setitem__(self, key, value):
+        self._journal._record_key(self, key, value)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._journal._record_key(self, key)
+        dict.__delitem__(self, key)
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return dict.__getitem__(self, key)
+        self[key] = default
+        return default
+
+    def pop(self, key, *default):
+        if key in self:
+            self._journal._record_key(self, key)
+        return dict.pop(self, key, *default)
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        if self._journal.active:
+            self._journal._entries.append((self, key, value))
+        return key, value
+
+    def update(self, *args, **kwargs):
+        for key, value in six.iteritems(dict(*args, **kwargs)):
+            self[key] = value
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def clear(self):
+        for key in list(self):
+            del self[key]
+
+class JournalList(list):
+    """A list whose changes are recorded in a Journal."""
+
+    __slots__ = ("_journal", "_root")
+
+    def __init__(self, journal, *args):
+        list.__init__(self, *args)
+        self._journal = journal
+        self._root = None
+
+    def __reduce_ex__(self, protocol):
+        return (list, (list(self),))
+
+def _journaled(name):
+    method = getattr(list, name)
+
+    def journaled(self, *args, **kwargs):
+        self._journal._record_list(self)
+        return method(self, *args, **kwargs)
+    journaled.__name__ = name
+    return journaled
+
+for _name in ("__setitem__", "__delitem__", "__iadd__", "__imul__", "append",
+        "extend", "insert", "pop", "remove", "clear", "sort", "reverse"):
+    if hasattr(list, _name):
+        setattr(JournalList, _name, _journaled(_name))
+
+class Aggregate(JournalDict):
+    """
+    The top level of an aggregate.  If it's given an observer (with
+    observe), the observer's read method is called with each key that's
+    looked up (or None if every key is, e.g. by iterating), and its written
+    method with each key that's set or removed.
+    """
+
+    __slots__ = ("_observer",)
+
+    def __init__(self, journal, *args, **kwargs):
+        JournalDict.__init__(self, journal, *args, **kwargs)
+        self._observer = None
+
+    def observe(self, observer):
+        """Sets the observer; None removes it."""
+        self._observer = observer
+
+    def __getitem__(self, key):
+        if self._observer is not None:
+            self._observer.read(key)
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if self._observer is not None:
+            self._observer.read(key)
+        return dict.get(self, key, default)
+
+    def __contains__(self, key):
+        if self._observer is not None:
+            self._observer.read(key)
+        return dict.__contains__(self, key)
+
+    def __setitem__(self, key, value):
+        if self._observer is not None:
+            self._observer.written(key)
+        JournalDict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        if self._observer is not None:
+            self._observer.written(key)
+        JournalDict.__delitem__(self, key)
+
+    def pop(self, key, *default):
+        if self._observer is not None:
+            self._observer.read(key)
+            self._observer.written(key)
+        return JournalDict.pop(self, key, *default)
+
+def _read_all(name):
+    method = getattr(dict, name)
+
+    def read_all(self, *args):
+        if self._observer is not None:
+            self._observer.read(None)
+        return method(self, *args)
+    read_all.__name__ = name
+    return read_all
+
+for _name in ("__iter__", "__len__", "keys", "values", "items"):
+    setattr(Aggregate, _name, _read_all(_name))
+
+def new_aggregate(value=None):
+    """Creates a journaled aggregate, optionally with the contents of value."""
+    journal = Journal()
+    aggregate = Aggregate(journal)
+    if value is not None:
+        for key, item in six.iteritems(value):
+            dict.__setitem__(aggregate, key, journal.wrap(item, {}, key))
+    return aggregate
@@ -649,6 +649,113 @@ def walk_method(cf, method, callback, verbose, input_args=None):
     elif verbose:
         print("Unexpected final instruction %s: stack is %s" % (ins, stack))
 
+# Kinds of decoded instruction produced by decode_method.  Each decoded
+# instruction is a tuple of (kind, ins, ...), where the remaining elements are:
+OP_PUSH = 0 # value
+OP_NEW = 1 # class name
+OP_GET_FIELD = 2 # is static, class name, field name, field descriptor
+OP_PUT_FIELD = 3 # is static, class name, field name, field descriptor
+OP_INVOKE = 4 # is static, class name, method name, method descriptor, parsed descriptor
+OP_INVOKEDYNAMIC = 5 # parsed descriptor
+OP_LOAD = 6 # local index
+OP_STORE = 7 # local index
+OP_DUP = 8
+OP_POP = 9
+OP_NEW_ARRAY = 10 # fill value
+OP_ARRAY_STORE = 11
+OP_ARRAY_LOAD = 12
+OP_NOP = 13
+OP_UNKNOWN = 14
+
+_method_descriptors = {}
+
+# Once this many descriptors are remembered, they're forgotten and collected
+# again, so that a long-running server doesn't keep every jar's descriptors
+MAX_METHOD_DESCRIPTORS = 65536
+
+def cached_method_descriptor(descriptor):
+    """
+    Same as method_descriptor, but remembers the (immutable) result for each
+    descriptor string, since the same few descriptors are parsed over and over.
+    """
+    desc = _method_descriptors.get(descriptor)
+    if desc is None:
+        if len(_method_descriptors) >= MAX_METHOD_DESCRIPTORS:
+            _method_descriptors.clear()
+        desc = _method_descriptors[descriptor] = method_descriptor(descriptor)
+    return desc
+
+def decode_method(method):
+    """
+    Disassembles a method into a list of tuples (see the OP_ constants),
+    with every constant already resolved to the values walk_method would use.
+    This is for code that evaluates large methods (or the same method many
+    times) in its own loop, rather than with walk_method and a WalkerCallback.
+
+    As with walk_method, the method is assumed to only return at the very end;
+    the returned value is a tuple of (decoded instructions other than the last
+    one, the last instruction).
+    """
+    decoded = []
+    ins_list = list(method.code.disassemble())
+    for ins in ins_list[:-1]:
+        mnemonic = ins.mnemonic
+        if mnemonic in ("bipush", "sipush"):
+            decoded.append((OP_PUSH, ins, ins.operands[0].value))
+        elif mnemonic.startswith("fconst") or mnemonic.startswith("dconst"):
+            decoded.append((OP_PUSH, ins, float(mnemonic[-1])))
+        elif mnemonic == "aconst_null":
+            decoded.append((OP_PUSH, ins, None))
+        elif mnemonic in ("ldc", "ldc_w", "ldc2_w"):
+            const = ins.operands[0]
+            if isinstance(const, ConstantClass):
+                value = "%s.class" % const.name.value
+            elif isinstance(const, String):
+                value = const.string.value
+            else:
+                value = const.value
+            decoded.append((OP_PUSH, ins, value))
+        elif mnemonic == "new":
+            decoded.append((OP_NEW, ins, ins.operands[0].name.value))
+        elif mnemonic in ("getfield", "getstatic", "putfield", "putstatic"):
+            const = ins.operands[0]
+            kind = OP_GET_FIELD if mnemonic.startswith("get") else OP_PUT_FIELD
+            decoded.append((kind, ins, mnemonic.endswith("static"),
+                    const.class_.name.value, const.name_and_type.name.value,
+                    const.name_and_type.descriptor.value))
+        elif mnemonic in ("invokevirtual", "invokespecial", "invokeinterface", "invokestatic"):
+            const = ins.operands[0]
+            method_desc = const.name_and_type.descriptor.value
+            decoded.append((OP_INVOKE, ins, mnemonic == "invokestatic",
+                    const.class_.name.value, const.name_and_type.name.value,
+                    method_desc, cached_method_descriptor(method_desc)))
+        elif mnemonic in ("astore", "istore", "lstore", "fstore", "dstore"):
+            decoded.append((OP_STORE, ins, ins.operands[0].value))
+        elif mnemonic in ("aload", "iload", "lload", "fload", "dload"):
+            decoded.append((OP_LOAD, ins, ins.operands[0].value))
+        elif mnemonic == "dup":
+            decoded.append((OP_DUP, ins))
+        elif mnemonic == "pop":
+            decoded.append((OP_POP, ins))
+        elif mnemonic == "anewarray":
+            decoded.append((OP_NEW_ARRAY, ins, None))
+        elif mnemonic == "newarray":
+            decoded.append((OP_NEW_ARRAY, ins, 0))
+        elif mnemonic in ("aastore", "bastore", "castore", "sastore", "iastore", "lastore", "fastore", "dastore"):
+            decoded.append((OP_ARRAY_STORE, ins))
+        elif mnemonic in ("aaload", "baload", "caload", "saload", "iaload", "laload", "faload", "daload"):
+            decoded.append((OP_ARRAY_LOAD, ins))
+        elif mnemonic == "invokedynamic":
+            const = ins.operands[0]
+            method_desc = const.name_and_type.descriptor.value
+            decoded.append((OP_INVOKEDYNAMIC, ins, cached_method_descriptor(method_desc)))
+        elif mnemonic == "checkcast":
+            decoded.append((OP_NOP, ins))
+        else:
+            decoded.append((OP_UNKNOWN, ins))
+
+    return decoded, ins_list[-1]
+
 def get_enum_constants(cf, verbose):
     # Gets enum constants declared in the given class.
     # Consider the following code:
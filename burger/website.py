@@ -21,7 +21,9 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
+import concurrent.futures
 import os
+import tempfile
 import six.moves.urllib.request
 
 try:
@@ -32,6 +34,9 @@ except ImportError:
 VERSION_MANIFEST = "https://launchermeta.mojang.com/mc/game/version_manifest.json"
 LEGACY_VERSION_META = "https://s3.amazonaws.com/Minecraft.Download/versions/%(version)s/%(version)s.json" # DEPRECATED
 
+# How many jars client_jars downloads at once
+DOWNLOAD_THREADS = 4
+
 _cached_version_manifest = None
 _cached_version_metas = {}
 
@@ -89,9 +94,14 @@ def get_asset_index(version_meta, verbose):
     return _load_json(asset_index["url"])
 
 
-def client_jar(version, verbose):
-    """Downloads a specific version, by name"""
+def client_jar(version, verbose, directory=None):
+    """
+    Downloads a specific version, by name, into directory (the current
+    directory if None), unless it's already there
+    """
     filename = version + ".jar"
+    if directory is not None:
+        filename = os.path.join(directory, filename)
     if not os.path.exists(filename):
         meta = get_version_meta(version, verbose)
         if verbose:
@@ -99,9 +109,79 @@ def client_jar(version, verbose):
         url = meta["downloads"]["client"]["url"]
         if verbose:
             print("Downloading %s from %s" % (version, url))
-        six.moves.urllib.request.urlretrieve(url, filename=filename)
+        # Download under another name first, so that a partial download
+        # (or one still going on in another process) isn't mistaken for
+        # the jar
+        fd, temp_path = tempfile.mkstemp(suffix=".part", dir=directory or ".")
+        os.close(fd)
+        six.moves.urllib.request.urlretrieve(url, filename=temp_path)
+        os.replace(temp_path, filename)
     return filename
 
 def latest_client_jar(verbose):
     manifest = get_version_manifest()
     return client_jar(manifest["latest"]["snapshot"], verbose)
+
+def select_versions(spec, verbose=False):
+    """
+    Gets the ids of the versions in the version manifest matching spec, from
+    oldest to newest.  spec is a comma-separated list of:
+
+        1.14            That version
+        FROM..TO        Every version released from FROM to TO (inclusive);
+                        either can be left out for no limit
+        TYPE:           Every version of a type (release, snapshot, old_beta
+                        or old_alpha)
+        TYPE:FROM..TO   Every version of a type in a range, e.g.
+                        release:1.13.. for every release since 1.13
+
+    Raises ValueError for an unknown version or type.
+    """
+    versions = sorted(get_version_manifest()["versions"], key=lambda info: info["releaseTime"])
+    by_id = dict((info["id"], info) for info in versions)
+    types = set(info["type"] for info in versions)
+
+    def release_time(version):
+        if version not in by_id:
+            raise ValueError("Unknown version %s" % version)
+        return by_id[version]["releaseTime"]
+
+    selected = set()
+    for term in spec.split(","):
+        term = term.strip()
+        type_, _, term = term.rpartition(":")
+        if type_ and type_ not in types:
+            raise ValueError("Unknown version type %s (expected one of %s)" % (type_, ", ".join(sorted(types))))
+
+        if ".." in term:
+            start, _, end = term.partition("..")
+            start = release_time(start) if start else None
+            end = release_time(end) if end else None
+        elif term:
+            start = end = release_time(term)
+        else:
+            start = end = None
+
+        for info in versions:
+            if type_ and info["type"] != type_:
+                continue
+            if start is not None and info["releaseTime"] < start:
+                continue
+            if end is not None and info["releaseTime"] > end:
+                continue
+            selected.add(info["id"])
+
+    result = [info["id"] for info in versions if info["id"] in selected]
+    if verbose:
+        print("Selected %d versions: %s" % (len(result), ", ".join(result)))
+    return result
+
+def client_jars(versions, verbose, directory=None, threads=DOWNLOAD_THREADS):
+    """
+    Downloads several versions at once (as with client_jar), returning
+    their jars' paths in the same order.
+    """
+    if len(versions) <= 1:
+        return [client_jar(version, verbose, directory) for version in versions]
+    with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+        return list(executor.map(lambda version: client_jar(version, verbose, directory), versions))
@@ -25,60 +25,31 @@ import os
 import sys
 import getopt
 import urllib
-import traceback
+import zipfile
 
 try:
     import json
 except ImportError:
     import simplejson as json
 
-from collections import deque
-
-from jawa.classloader import ClassLoader
-from jawa.transforms import simple_swap, expand_constants
-
-from burger import website
-from burger.roundedfloats import transform_floats
-
-
-def import_toppings():
-    """
-    Attempts to imports either a list of toppings or, if none were
-    given, attempts to load all available toppings.
-    """
-    this_dir = os.path.dirname(__file__)
-    toppings_dir = os.path.join(this_dir, "burger", "toppings")
-    from_list = []
-
-    # Traverse the toppings directory and import everything.
-    for root, dirs, files in os.walk(toppings_dir):
-        for file_ in files:
-            if not file_.endswith(".py"):
-                continue
-            elif file_.startswith("__"):
-                continue
-            elif file_ == "topping.py":
-                continue
-
-            from_list.append(file_[:-3])
-
-    from burger.toppings.topping import Topping
-    toppings = {}
-    last = Topping.__subclasses__()
-
-    for topping in from_list:
-        __import__("burger.toppings.%s" % topping)
-        current = Topping.__subclasses__()
-        subclasses = list([o for o in current if o not in last])
-        last = Topping.__subclasses__()
-        if len(subclasses) == 0:
-            print("Topping '%s' contains no topping" % topping)
-        elif len(subclasses) >= 2:
-            print("Topping '%s' contains more than one topping" % topping)
-        else:
-            toppings[topping] = subclasses[0]
+from collections import deque, OrderedDict
+
+import six
+
+from burger import jobs, website
+from burger.binary import write_binary
+from burger.cache import set_cache_dir
+from burger.container import write_container
+from burger.diff import diff_aggregates, load_aggregate
+from burger.hashing import write_index
+from burger.profiler import SamplingProfiler
+from burger.registry import get_registry
+from burger.runner import iter_run
+from burger.scheduler import Scheduler
+from burger.server import parse_address, serve
+from burger.strings import to_string_table
+from burger.tracing import AccessStats, format_report
 
-    return toppings
 
 if __name__ == "__main__":
     try:
@@ -93,7 +64,27 @@ if __name__ == "__main__":
                 "download-latest",
                 "list",
                 "compact",
-                "url="
+                "url=",
+                "cache-dir=",
+                "compact-recipes",
+                "all-locales",
+                "assets-dir=",
+                "asset-index=",
+                "string-table",
+                "binary",
+                "sections",
+                "diff",
+                "hashes=",
+                "serve=",
+                "cache-toppings",
+                "access-report",
+                "profile-sample=",
+                "workers=",
+                "submit=",
+                "work=",
+                "lease=",
+                "merge=",
+                "versions="
             ]
         )
     except getopt.GetoptError as err:
@@ -103,18 +94,38 @@ if __name__ == "__main__":
     # Default options
     toppings = None
     output = sys.stdout
+    output_path = None
+    binary = False
+    sections = False
+    diff = False
+    hashes_path = None
+    serve_address = None
+    cache_toppings = False
+    access_report = False
+    profile_path = None
+    workers = None
+    submit_dir = None
+    work_dir = None
+    lease = jobs.LEASE_SECONDS
+    merge_dir = None
     verbose = False
     download_jars = []
+    version_specs = []
     download_latest = False
     list_toppings = False
     compact = False
+    compact_recipes = False
+    all_locales = False
+    assets_dir = None
+    asset_index = None
+    string_table = False
     url = None
 
     for o, a in opts:
         if o in ("-t", "--toppings"):
             toppings = a.split(",")
         elif o in ("-o", "--output"):
-            output = open(a, "w")
+            output_path = a
         elif o in ("-v", "--verbose"):
             verbose = True
         elif o in ("-c", "--compact"):
@@ -127,9 +138,57 @@ if __name__ == "__main__":
             list_toppings = True
         elif o in ("-s", "--url"):
             url = a
-
-    # Load all toppings
-    all_toppings = import_toppings()
+        elif o == "--cache-dir":
+            set_cache_dir(a)
+        elif o == "--compact-recipes":
+            compact_recipes = True
+        elif o == "--all-locales":
+            all_locales = True
+        elif o == "--assets-dir":
+            assets_dir = a
+        elif o == "--asset-index":
+            asset_index = a
+        elif o == "--string-table":
+            string_table = True
+        elif o == "--binary":
+            binary = True
+        elif o == "--sections":
+            sections = True
+        elif o == "--diff":
+            diff = True
+        elif o == "--hashes":
+            hashes_path = a
+        elif o == "--serve":
+            serve_address = a
+        elif o == "--cache-toppings":
+            cache_toppings = True
+        elif o == "--access-report":
+            access_report = True
+        elif o == "--profile-sample":
+            profile_path = a
+        elif o == "--workers":
+            workers = int(a)
+        elif o == "--submit":
+            submit_dir = a
+        elif o == "--work":
+            work_dir = a
+        elif o == "--lease":
+            lease = float(a) if float(a) > 0 else None
+        elif o == "--merge":
+            merge_dir = a
+        elif o == "--versions":
+            version_specs.append(a)
+
+    # Find all toppings; they're only imported if they're used
+    all_toppings = get_registry()
+
+    if compact_recipes and "recipes" in all_toppings:
+        all_toppings["recipes"].load().COMPACT = True
+    if all_locales and "languages" in all_toppings:
+        languages = all_toppings["languages"].load()
+        languages.ALL_LOCALES = True
+        languages.ASSETS_DIR = assets_dir
+        languages.ASSET_INDEX = asset_index
 
     # List all of the available toppings,
     # as well as their docstring if available.
@@ -140,78 +199,51 @@ if __name__ == "__main__":
                 print(" -- %s\n" % all_toppings[topping].__doc__)
         sys.exit(0)
 
-    # Get the toppings we want
-    if toppings is None:
-        loaded_toppings = all_toppings.values()
-    else:
-        loaded_toppings = []
-        for topping in toppings:
-            if topping not in all_toppings:
-                print("Topping '%s' doesn't exist" % topping)
-            else:
-                loaded_toppings.append(all_toppings[topping])
-
-    class DependencyNode:
-        def  __init__(self, topping):
-            self.topping = topping
-            self.provides = topping.PROVIDES
-            self.depends = topping.DEPENDS
-            self.childs = []
-
-        def __repr__(self):
-            return str(self.topping)
-
-    # Order topping execution by building dependency tree
-    topping_nodes = []
-    topping_provides = {}
-    for topping in loaded_toppings:
-        topping_node = DependencyNode(topping)
-        topping_nodes.append(topping_node)
-        for provides in topping_node.provides:
-            topping_provides[provides] = topping_node
-
-    # Include missing dependencies
-    for topping in topping_nodes:
-        for dependency in topping.depends:
-            if not dependency in topping_provides:
-                for other_topping in all_toppings.values():
-                    if dependency in other_topping.PROVIDES:
-                        topping_node = DependencyNode(other_topping)
-                        topping_nodes.append(topping_node)
-                        for provides in topping_node.provides:
-                            topping_provides[provides] = topping_node
-
-    # Find dependency childs
-    for topping in topping_nodes:
-        for dependency in topping.depends:
-            if not dependency in topping_provides:
-                print("(%s) requires (%s)" % (topping, dependency))
-                sys.exit(1)
-            if not topping_provides[dependency] in topping.childs:
-                topping.childs.append(topping_provides[dependency])
-
-    # Run leaves first
-    to_be_run = []
-    while len(topping_nodes) > 0:
-        stuck = True
-        for topping in topping_nodes:
-            if len(topping.childs) == 0:
-                stuck = False
-                for parent in topping_nodes:
-                    if topping in parent.childs:
-                        parent.childs.remove(topping)
-                to_be_run.append(topping.topping)
-                topping_nodes.remove(topping)
-        if stuck:
-            print("Can't resolve dependencies")
+    if serve_address is not None:
+        serve(parse_address(serve_address), verbose)
+        sys.exit(0)
+
+    # Versions selected from the version manifest are downloaded along with
+    # the ones given with --download
+    for spec in version_specs:
+        try:
+            selected = website.select_versions(spec, verbose)
+        except ValueError as e:
+            print(str(e))
             sys.exit(1)
+        download_jars.extend(version for version in selected if version not in download_jars)
+
+    # Jobs for other processes to run, with --work; versions to download
+    # are left for them
+    if submit_dir is not None:
+        for job_id in jobs.submit(submit_dir, args, download_jars, toppings):
+            print(job_id)
+        sys.exit(0)
+
+    if work_dir is not None:
+        count = jobs.work(work_dir, verbose, cache_toppings, lease=lease)
+        if verbose:
+            print("Ran %d jobs" % count)
+        sys.exit(0)
 
     jarlist = args
 
-    # Download any jars that have already been specified
-    for version in download_jars:
-        client_path = website.client_jar(version, verbose)
-        jarlist.append(client_path)
+    # When diffing, any of the files given can be previous output instead of
+    # a jar
+    diff_outputs = {}
+    if diff:
+        diff_args = list(args)
+        for path in diff_args:
+            if not zipfile.is_zipfile(path):
+                try:
+                    diff_outputs[path] = load_aggregate(path)
+                except ValueError as e:
+                    print(str(e))
+                    sys.exit(1)
+        jarlist = [path for path in diff_args if path not in diff_outputs]
+
+    # Download any jars that have already been specified, several at once
+    jarlist.extend(website.client_jars(download_jars, verbose))
 
     # Download a copy of the latest snapshot jar
     if download_latest:
@@ -223,50 +255,83 @@ if __name__ == "__main__":
         url_path = urllib.urlretrieve(url)[0]
         jarlist.append(url_path)
 
-    summary = []
-
-    for path in jarlist:
-        classloader = ClassLoader(path, max_cache=0, bytecode_transforms=[simple_swap, expand_constants])
-        names = classloader.path_map.keys()
-        num_classes = sum(1 for name in names if name.endswith(".class"))
-
-        aggregate = {
-            "source": {
-                "file": path,
-                "classes": num_classes,
-                "other": len(names),
-                "size": os.path.getsize(path)
-            }
-        }
-
-        available = []
-        for topping in to_be_run:
-            missing = [dep for dep in topping.DEPENDS if dep not in available]
-            if len(missing) != 0:
-                if verbose:
-                    print("Dependencies failed for %s: Missing %s" % (topping, missing))
-                continue
-
-            orig_aggregate = aggregate.copy()
-            try:
-                topping.act(aggregate, classloader, verbose)
-                available.extend(topping.PROVIDES)
-            except:
-                aggregate = orig_aggregate # If the topping failed, don't leave things in an incomplete state
-                if verbose:
-                    print("Failed to run %s" % topping)
-                    traceback.print_exc()
-
-        summary.append(aggregate)
-
-    if not compact:
-        json.dump(transform_floats(summary), output, sort_keys=True, indent=4)
+    # What each topping read from the jars, in the order they were run
+    topping_seconds = OrderedDict()
+    topping_access = OrderedDict()
+
+    def on_topping(jar, topping, seconds, succeeded):
+        topping_seconds[topping] = topping_seconds.get(topping, 0) + seconds
+
+    def on_access(jar, topping, stats):
+        topping_access.setdefault(topping, AccessStats()).add(stats)
+
+    scheduler = Scheduler(workers) if workers is not None else None
+    try:
+        profiler = SamplingProfiler() if profile_path is not None else None
+        if profiler is not None:
+            profiler.start()
+        try:
+            if merge_dir is not None:
+                result = jobs.merge(merge_dir)
+            else:
+                result = list(iter_run(jarlist, toppings, verbose, cache_toppings=cache_toppings,
+                        on_topping=on_topping, on_access=on_access, scheduler=scheduler))
+        finally:
+            if profiler is not None:
+                profiler.stop()
+    except ValueError as e:
+        print(str(e))
+        sys.exit(1)
+
+    if profiler is not None:
+        profiler.write(profile_path)
+    if scheduler is not None:
+        sys.stderr.write(scheduler.report() + "\n")
+
+    if access_report:
+        sys.stderr.write(format_report([(topping.__module__.split(".")[-1],
+                topping_seconds[topping], stats)
+                for topping, stats in six.iteritems(topping_access)]) + "\n")
+
+    if hashes_path is not None:
+        with open(hashes_path, "w") as fout:
+            write_index(result, fout)
+
+    if diff:
+        aggregates = iter(result)
+        sides = [diff_outputs[path] if path in diff_outputs else next(aggregates)
+                for path in diff_args] + list(aggregates)
+        if len(sides) != 2:
+            print("--diff needs two jars or outputs, got %s" % len(sides))
+            sys.exit(1)
+
+        if output_path is not None:
+            output = open(output_path, "w")
+        # Each change is written as soon as it's found, one per line
+        for change in diff_aggregates(sides[0], sides[1]):
+            output.write(json.dumps(change, sort_keys=True) + "\n")
+    elif binary or sections:
+        if output_path is not None:
+            output = open(output_path, "wb")
+        else:
+            output = sys.stdout.buffer
+        if binary:
+            write_binary(result, output)
+        else:
+            write_container(result, output)
     else:
-        json.dump(transform_floats(summary), output)
+        if output_path is not None:
+            output = open(output_path, "w")
+        if string_table:
+            result = to_string_table(result)
+        if not compact:
+            json.dump(result, output, sort_keys=True, indent=4)
+        else:
+            json.dump(result, output)
 
     # Cleanup temporary downloads (the URL download is temporary)
     if url:
         os.remove(url_path)
     # Cleanup file output (if used)
-    if output is not sys.stdout:
+    if output_path is not None:
         output.close()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+import unittest
+
+from burger.toppings.blockstates import _property_key
+
+def _field(declared_in, declared_name, name):
+    return {
+        "class": "BooleanProperty",
+        "type": "bool",
+        "args": [name],
+        "declared_in": declared_in,
+        "declared_name": declared_name
+    }
+
+class PropertyKeyTest(unittest.TestCase):
+    def test_same_alias_for_different_fields(self):
+        # X.a = BSP.O and Y.a = BSP.P
+        lit = _field("BSP", "O", "lit")
+        powered = _field("BSP", "P", "powered")
+        self.assertNotEqual(_property_key("X", "a", lit), _property_key("Y", "a", powered))
+
+    def test_same_field_is_shared(self):
+        lit = _field("BSP", "O", "lit")
+        self.assertEqual(_property_key("X", "a", lit), _property_key("Y", "a", dict(lit)))
+
+    def test_different_alias_for_same_field(self):
+        # The block class's name for the field is part of the data
+        lit = _field("BSP", "O", "lit")
+        self.assertNotEqual(_property_key("X", "a", lit), _property_key("Y", "b", lit))
+
+    def test_array_index(self):
+        lit = _field("BSP", "O", "lit")
+        self.assertNotEqual(_property_key("X", "a", lit, 0), _property_key("X", "a", lit, 1))
+
+    def test_undeclared_field_is_per_class(self):
+        field = {"class": "BooleanProperty", "type": "bool", "args": ["lit"]}
+        self.assertNotEqual(_property_key("X", "a", field), _property_key("Y", "a", field))
+
+if __name__ == "__main__":
+    unittest.main()